@@ -6,19 +6,22 @@ Slim entry point that registers modular Blueprints and serves the React UI.
 Build the React app with 'npm run build' in the frontend/ directory.
 CRA outputs to frontend/build/, which Flask serves as static files.
 
+Development: python app.py            (Werkzeug dev server)
+Production : python serve.py --workers N   (multi-worker WSGI, see serve.py)
+
 Modules:
-  - common   : Shared JSON utils, DB utils, storage, connection routes
+  - common   : Shared JSON utils, DB utils, storage, connection + result routes
   - module_1 : SQL-to-File comparison  (active)
-  - module_2 : SQL-to-SQL comparison   (coming soon)
-  - module_3 : File-to-File comparison (coming soon)
+  - module_2 : SQL-to-SQL comparison   (active)
+  - module_3 : File-to-File comparison (active)
 """
 
 from flask import Flask, send_from_directory
 from flask_cors import CORS
-import os, atexit
+import os
 
 from common.json_utils import safe_jsonify
-from common.storage_manager import clear_cache
+from common.cache_janitor import start_janitor
 
 # ── Serve React build from frontend/build (CRA output) ──
 FRONTEND_BUILD = os.path.join(os.path.dirname(__file__), '..', 'frontend', 'build')
@@ -31,11 +34,13 @@ CORS(app)
 # ═══════════════════════════════════════════════════════════════════════════
 
 from common.routes import common_bp
+from common.result_routes import results_bp
 from module_1.routes import m1_bp
 from module_2.routes import m2_bp
 from module_3.routes import m3_bp
 
 app.register_blueprint(common_bp)
+app.register_blueprint(results_bp)
 app.register_blueprint(m1_bp)
 app.register_blueprint(m2_bp)
 app.register_blueprint(m3_bp)
@@ -55,14 +60,10 @@ def serve_react(path):
     return safe_jsonify({"error": "Frontend not built. Run 'npm run build' in the frontend/ folder first."}, 404)
 
 
-# ── Graceful shutdown: clean up temp cache ──
-def _on_shutdown():
-    try:
-        clear_cache()
-    except Exception:
-        pass
-
-atexit.register(_on_shutdown)
+# ── Cache housekeeping ──
+# temp_cache survives restarts; the janitor reclaims idle entries (per-category
+# TTL) and enforces the disk quota continuously instead of wiping at exit.
+start_janitor()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,304 @@
+"""
+SQL File Reconcile Tool — Headless Batch Runner
+===============================================
+Runs many SQL-to-File comparisons from a JSON manifest, without the web UI.
+
+  python batch_runner.py month_end.json --out batch_output --workers 4
+
+Manifest:
+  {
+    "defaults": {"server": "...", "database": "...", "port": 1433},
+    "job_memory_mb": 4096,
+    "jobs": [
+      {"name": "payments", "query": "SELECT * FROM dbo.Payments",
+       "file": "exports/payments.xlsx", "keys": ["PaymentID"],
+       "column_mapping": [{"sql": "Amount", "file": "Amt"}]},
+      ...
+    ]
+  }
+"defaults" are merged into every job; relative file paths are resolved
+against the manifest's folder.
+
+  - jobs run in a process pool, each under its own address-space limit
+    (job "memory_mb" > manifest "job_memory_mb" > --job-memory-mb; Unix only)
+  - a query used by several jobs (same server/database/port/query text) is
+    fetched once into the Parquet cache and shared by those jobs (under the
+    largest memory limit among them); every job compares the SQL data in
+    its Parquet form, shared or not, so sharing never changes a result
+  - each result is written to <out>/<job name>.parquet and every job's
+    summary (or error) to <out>/summary.json
+The engine and the cache are called directly -- no HTTP.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    import resource
+    _DEFAULT_AS_LIMIT = resource.getrlimit(resource.RLIMIT_AS)
+except ImportError:             # Windows: no per-job memory limit
+    resource = None
+
+from common.db_utils import fetch_sql_df, is_select_only, project_query
+from common.storage_manager import (init_cache, save_df, load_df, delete_entry,
+                                    coerce_for_parquet, RESULTS_ROW_GROUP_SIZE)
+from common.file_ingest import ingest_file, is_supported
+from common.memory_utils import record_stage
+from common.json_utils import _dumps
+from common.result_layout import expand_result
+from module_1.comparison_engine import run_hybrid_comparison
+
+SUMMARY_FILE = 'summary.json'
+
+REQUIRED_FIELDS = ('server', 'database', 'query', 'file')
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Manifest
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _safe_name(name):
+    """File-system safe job name (used for the result file)."""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', str(name)).strip('._') or 'job'
+
+
+def _sql_key(job):
+    """Jobs with the same key can share one SQL fetch."""
+    return (job['server'], job['database'], str(job.get('port') or ''), ' '.join(job['query'].split()))
+
+
+def load_manifest(path, default_memory_mb=0):
+    """
+    Read and validate a manifest.  Returns the list of job dicts (defaults
+    merged, names unique, file paths absolute).  Raises ValueError on errors.
+    """
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    defaults = manifest.get('defaults', {})
+    memory_mb = manifest.get('job_memory_mb', default_memory_mb)
+    jobs, names = [], set()
+    for n, entry in enumerate(manifest.get('jobs', []), 1):
+        job = dict(defaults, **entry)
+        job.setdefault('memory_mb', memory_mb)
+        missing = [f for f in REQUIRED_FIELDS if not job.get(f)]
+        if missing:
+            raise ValueError(f"Job {n}: missing {', '.join(missing)}")
+        if not is_select_only(job['query']):
+            raise ValueError(f"Job {n}: only SELECT queries are permitted")
+        if not is_supported(job['file']):
+            raise ValueError(f"Job {n}: unsupported file type {job['file']}")
+
+        name = _safe_name(job.get('name') or f"job_{n}")
+        if name in names:
+            raise ValueError(f"Job {n}: duplicate name {name}")
+        names.add(name)
+        job['name'] = name
+        job['file'] = os.path.join(base_dir, job['file'])
+        job.setdefault('keys', [])
+        job.setdefault('column_mapping', [])
+        job.setdefault('file_name', os.path.basename(job['file']))
+        jobs.append(job)
+    if not jobs:
+        raise ValueError("Manifest has no jobs")
+    return jobs
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Worker side (runs in the pool processes)
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _limit_memory(memory_mb):
+    """Cap this process's address space for the next job (0 = restore the default)."""
+    if resource is None:
+        return
+    soft, hard = _DEFAULT_AS_LIMIT
+    if memory_mb:
+        soft = memory_mb * 1024 * 1024
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+def fetch_shared(server, database, query, port, snapshot_id, memory_mb=0):
+    """Fetch one shared query into the cache.  Returns its row count."""
+    try:
+        _limit_memory(memory_mb)
+        df_sql = fetch_sql_df(server, database, query, port)
+        save_df(df_sql, 'uploads', snapshot_id, source={"batch": "sql_snapshot", "server": server,
+                                                         "database": database, "query": query})
+        return len(df_sql)
+    except MemoryError:
+        raise RuntimeError(f"Out of memory (limit {memory_mb} MB)") from None
+    finally:
+        _limit_memory(0)
+
+
+def _load_file(path, columns=None):
+    """Ingest a file on disk through the upload path.  Returns the DataFrame
+    (all or *columns*)."""
+    file_id = str(uuid.uuid4())
+    try:
+        with open(path, 'rb') as stream:
+            ingest_file(stream, os.path.basename(path), file_id, source={"batch": "file", "filename": path})
+        return load_df('uploads', file_id, columns=columns)
+    finally:
+        delete_entry('uploads', file_id)
+
+
+def run_job(job, snapshot_id, out_dir):
+    """
+    Run one comparison and write its result Parquet.
+    Returns the job report {"name", "status", "summary" | "message", ...};
+    never raises.
+    """
+    t0 = time.time()
+    report = {"name": job['name'], "file": job['file'], "server": job['server'],
+              "database": job['database'], "query": job['query']}
+    try:
+        _limit_memory(job.get('memory_mb'))
+
+        column_mapping = job['column_mapping']
+        sql_columns = [m['sql'] for m in column_mapping] if column_mapping else None
+        file_columns = [m['file'] for m in column_mapping] if column_mapping else None
+
+        df_file = _load_file(job['file'], file_columns)
+        if snapshot_id is not None:
+            df_sql = load_df('uploads', snapshot_id, columns=sql_columns)
+            if df_sql is None:
+                raise RuntimeError("Shared SQL snapshot is missing")
+        else:
+            # Same values as a shared snapshot (mixed object columns as strings)
+            df_sql = coerce_for_parquet(fetch_sql_df(job['server'], job['database'],
+                                                     project_query(job['query'], sql_columns),
+                                                     job.get('port')))
+
+        if column_mapping:
+            df_sql = df_sql[[c for c in sql_columns if c in df_sql.columns]]
+            df_file = df_file.rename(columns={m['file']: m['sql'] for m in column_mapping})
+        memory = record_stage({}, 'sql_fetched', df_sql)
+        record_stage(memory, 'file_loaded', df_file)
+
+        result_df, summary = run_hybrid_comparison(df_sql, df_file, job['keys'],
+                                                   file_name=job['file_name'], memory=memory)
+
+        path = os.path.join(out_dir, f"{job['name']}.parquet")
+        coerce_for_parquet(expand_result(result_df, summary)).to_parquet(
+            path, index=False, row_group_size=RESULTS_ROW_GROUP_SIZE)
+        report.update(status="success", result_path=path, shared_sql=snapshot_id is not None, summary=summary)
+    except MemoryError:
+        report.update(status="error", message=f"Out of memory (limit {job.get('memory_mb')} MB)")
+    except Exception as e:
+        limit = f" (job memory limit {job['memory_mb']} MB)" if job.get('memory_mb') else ''
+        report.update(status="error", message=f"{e}{limit}")
+    finally:
+        _limit_memory(0)
+    report['elapsed_seconds'] = round(time.time() - t0, 2)
+    return report
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Driver
+# ═══════════════════════════════════════════════════════════════════════════
+
+def run_batch(jobs, out_dir, workers):
+    """
+    Run *jobs* across *workers* processes, writing results to *out_dir*.
+    Returns the consolidated report (also written to <out_dir>/summary.json).
+    """
+    t0 = time.time()
+    init_cache()
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Queries used by more than one job are fetched once, up front
+    groups = {}
+    for job in jobs:
+        groups.setdefault(_sql_key(job), []).append(job)
+    shared = {key: str(uuid.uuid4()) for key, members in groups.items() if len(members) > 1}
+
+    reports = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        fetches = {}
+        for key, snapshot_id in shared.items():
+            first = groups[key][0]
+            limits = [job.get('memory_mb') or 0 for job in groups[key]]
+            fetches[pool.submit(fetch_shared, first['server'], first['database'], first['query'],
+                                first.get('port'), snapshot_id, 0 if 0 in limits else max(limits))] = key
+
+        failed = {}
+        for future in as_completed(fetches):
+            key = fetches[future]
+            try:
+                rows = future.result()
+                print(f"  [Batch] Shared query fetched once for {len(groups[key])} jobs ({rows} rows)")
+            except Exception as e:
+                failed[key] = str(e)
+
+        futures = []
+        for job in jobs:
+            key = _sql_key(job)
+            if key in failed:
+                reports.append({"name": job['name'], "file": job['file'], "status": "error",
+                                "message": f"Shared SQL fetch failed: {failed[key]}", "elapsed_seconds": 0})
+                continue
+            futures.append(pool.submit(run_job, job, shared.get(key), out_dir))
+
+        for future in as_completed(futures):
+            report = future.result()
+            reports.append(report)
+            status = report['status'] if report['status'] != 'success' else \
+                f"{report['summary']['total_discrepancies']} discrepancies"
+            print(f"  [Batch] {report['name']}: {status} in {report['elapsed_seconds']}s")
+
+    for snapshot_id in shared.values():
+        delete_entry('uploads', snapshot_id)
+
+    order = {job['name']: i for i, job in enumerate(jobs)}
+    reports.sort(key=lambda r: order[r['name']])
+    ok = sum(1 for r in reports if r['status'] == 'success')
+    batch = {
+        "jobs_total": len(jobs),
+        "jobs_succeeded": ok,
+        "jobs_failed": len(jobs) - ok,
+        "shared_sql_fetches": len(shared),
+        "workers": workers,
+        "elapsed_seconds": round(time.time() - t0, 2),
+        "jobs": reports,
+    }
+    payload = _dumps(batch)
+    with open(os.path.join(out_dir, SUMMARY_FILE), 'wb') as f:
+        f.write(payload if isinstance(payload, bytes) else payload.encode('utf-8'))
+    return batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run SQL-to-File comparisons from a manifest, without the web UI.")
+    parser.add_argument('manifest', help="JSON manifest of jobs")
+    parser.add_argument('--out', default='batch_output', help="folder for result Parquet files and summary.json")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--job-memory-mb', type=int, default=0,
+                        help="address-space limit per job in MB (0 = none; manifest/job values win)")
+    args = parser.parse_args()
+
+    try:
+        jobs = load_manifest(args.manifest, args.job_memory_mb)
+    except (OSError, ValueError) as e:
+        print(f"Invalid manifest: {e}")
+        return 2
+
+    print(f"Running {len(jobs)} jobs with {args.workers} workers -> {os.path.abspath(args.out)}")
+    batch = run_batch(jobs, args.out, args.workers)
+    print(f"Done: {batch['jobs_succeeded']}/{batch['jobs_total']} succeeded "
+          f"in {batch['elapsed_seconds']}s ({batch['shared_sql_fetches']} shared SQL fetches)")
+    return 0 if batch['jobs_failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
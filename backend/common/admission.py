@@ -0,0 +1,225 @@
+"""
+Admission Control for comparisons.
+Every comparison reserves its estimated memory before it loads any data.
+Jobs are admitted in arrival order while both limits hold:
+  - at most admission_max_concurrent comparisons run at once
+  - their estimates sum to at most admission_memory_budget_mb
+    (a job alone is always admitted; its estimate never exceeds the budget)
+Otherwise a job waits in the queue (up to admission_max_queue jobs, for at
+most admission_queue_timeout_seconds).  Jobs estimated above the whole
+budget are rejected -- callers switch to a lower-memory mode first when
+they have one.
+
+The slots live in a SQLite table in temp_cache (admission.sqlite), so every
+worker process of serve.py shares one budget.  Slots of processes that have
+died are reclaimed on the next admission.
+
+Estimates (estimate_mb) come from row counts (upload metadata, SQL COUNT)
+and the row width sampled from the upload:
+  inputs  : rows x in-memory row width, twice (frames + working copies)
+  engine  : rows x columns x bytes per cell for the engine path
+            (key-based ~24 B, fingerprint ~80 B: every cell is normalised
+            to a Python string and hashed)
+"""
+
+import os
+import time
+import uuid
+import sqlite3
+from contextlib import closing, contextmanager
+
+from common.db_utils import CONFIG
+from common.storage_manager import CACHE_DIR
+from common.memory_utils import psutil
+
+MEMORY_BUDGET_MB = float(CONFIG.get('admission_memory_budget_mb', 4096))
+MAX_CONCURRENT = int(CONFIG.get('admission_max_concurrent', 2))
+MAX_QUEUE = int(CONFIG.get('admission_max_queue', 8))
+QUEUE_TIMEOUT_SECONDS = float(CONFIG.get('admission_queue_timeout_seconds', 600))
+
+# Seconds between admission checks while queued
+POLL_SECONDS = 0.5
+
+# Engine working memory per input cell, by comparison path (bytes)
+CELL_BYTES = {'key': 24, 'fingerprint': 80}
+
+# Input frames are held alongside their working copies
+INPUT_COPIES = 2
+
+# Assumed when a side's shape is unknown (SQL without a column mapping)
+DEFAULT_CELL_WIDTH = 16         # in-memory bytes per cell
+DEFAULT_COLUMNS = 10
+
+DB_PATH = os.path.join(CACHE_DIR, 'admission.sqlite')
+
+
+class AdmissionRejected(Exception):
+    """A comparison that cannot be admitted.  *status* is the HTTP status to
+    answer with; *info* the details for the client."""
+
+    def __init__(self, message, status, info):
+        super().__init__(message)
+        self.status = status
+        self.info = info
+
+
+def estimate_mb(rows, row_width, n_cols, path='key'):
+    """Peak memory estimate (MB) of comparing *rows* input rows (both sides)
+    of *row_width* bytes (None: DEFAULT_CELL_WIDTH per cell) and *n_cols* columns."""
+    if row_width is None:
+        row_width = n_cols * DEFAULT_CELL_WIDTH
+    total = rows * (INPUT_COPIES * row_width + n_cols * CELL_BYTES[path])
+    return round(total / (1024 * 1024), 1)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Slot table
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _connect():
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=10, isolation_level=None)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        " seq INTEGER PRIMARY KEY AUTOINCREMENT, ticket TEXT UNIQUE NOT NULL, pid INTEGER NOT NULL,"
+        " mb REAL NOT NULL, state TEXT NOT NULL, label TEXT, enqueued REAL NOT NULL, started REAL)")
+    return conn
+
+
+@contextmanager
+def _transaction():
+    """IMMEDIATE transaction (one admission decision at a time, across processes)."""
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def pid_alive(pid):
+    """True if process *pid* (on this host) may still be running."""
+    if pid == os.getpid():
+        return True
+    if psutil is not None:
+        return psutil.pid_exists(pid)
+    if os.name == 'nt':
+        # waitress runs a single process: other pids belong to a previous run
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _reclaim(conn):
+    """Drop the slots of processes that are gone."""
+    for pid, in conn.execute("SELECT DISTINCT pid FROM jobs").fetchall():
+        if not pid_alive(pid):
+            conn.execute("DELETE FROM jobs WHERE pid = ?", (pid,))
+
+
+def _running(conn):
+    n, mb = conn.execute("SELECT COUNT(*), COALESCE(SUM(mb), 0) FROM jobs WHERE state = 'running'").fetchone()
+    return n, mb
+
+
+def _try_start(conn, ticket):
+    """Start *ticket* if it is first in the queue and fits.  Returns (started, position)."""
+    seq, mb, state = conn.execute("SELECT seq, mb, state FROM jobs WHERE ticket = ?", (ticket,)).fetchone()
+    if state == 'running':
+        return True, 0
+    ahead = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND seq < ?", (seq,)).fetchone()[0]
+    n_running, running_mb = _running(conn)
+    if ahead == 0 and n_running < MAX_CONCURRENT and (n_running == 0 or running_mb + mb <= MEMORY_BUDGET_MB):
+        conn.execute("UPDATE jobs SET state = 'running', started = ? WHERE ticket = ?", (time.time(), ticket))
+        return True, 0
+    return False, ahead + 1
+
+
+def _release(ticket):
+    with closing(_connect()) as conn:
+        conn.execute("DELETE FROM jobs WHERE ticket = ?", (ticket,))
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Public API
+# ═══════════════════════════════════════════════════════════════════════════
+
+@contextmanager
+def admitted(estimated_mb, ticket=None, label=''):
+    """
+    Hold a comparison slot for the duration of the block, waiting in the
+    queue if needed.  Yields the admission report (estimate, queue position
+    on arrival, seconds waited).  Raises AdmissionRejected when the job is
+    larger than the budget, the queue is full, or the wait times out.
+    *ticket* lets the client follow its queue position (queue_status).
+    """
+    ticket = ticket or str(uuid.uuid4())
+    report = {"ticket": ticket, "estimated_mb": estimated_mb, "budget_mb": MEMORY_BUDGET_MB}
+    if estimated_mb > MEMORY_BUDGET_MB:
+        raise AdmissionRejected(
+            f"Estimated memory {estimated_mb:.0f} MB exceeds the comparison budget of "
+            f"{MEMORY_BUDGET_MB:.0f} MB.", 413, report)
+
+    t0 = time.time()
+    with _transaction() as conn:
+        _reclaim(conn)
+        if conn.execute("SELECT 1 FROM jobs WHERE ticket = ?", (ticket,)).fetchone():
+            raise AdmissionRejected("This ticket is already in use.", 409, report)
+        queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()[0]
+        conn.execute("INSERT INTO jobs (ticket, pid, mb, state, label, enqueued) VALUES (?, ?, ?, 'queued', ?, ?)",
+                     (ticket, os.getpid(), estimated_mb, label, t0))
+        started, position = _try_start(conn, ticket)
+        if not started and queued >= MAX_QUEUE:
+            conn.execute("DELETE FROM jobs WHERE ticket = ?", (ticket,))
+            report['queue_length'] = queued
+            raise AdmissionRejected("The comparison queue is full. Please try again later.", 503, report)
+    report['queue_position'] = position
+    if not started:
+        print(f"  [Admission] {label or ticket[:8]}: {estimated_mb:.0f} MB queued at position {position}")
+
+    try:
+        while not started:
+            if time.time() - t0 > QUEUE_TIMEOUT_SECONDS:
+                report['position'] = position
+                raise AdmissionRejected("Timed out waiting for a comparison slot. Please try again later.",
+                                        503, report)
+            time.sleep(POLL_SECONDS)
+            with _transaction() as conn:
+                _reclaim(conn)
+                started, position = _try_start(conn, ticket)
+        report['waited_seconds'] = round(time.time() - t0, 2)
+        yield report
+    finally:
+        _release(ticket)
+
+
+def queue_status(ticket=None):
+    """
+    Queue overview; with *ticket*, that job's state:
+    {"status": "queued", "position": n, ...} | {"status": "running"} | {"status": "none"}.
+    """
+    with closing(_connect()) as conn:
+        n_running, running_mb = _running(conn)
+        queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()[0]
+        status = {"running": n_running, "running_mb": round(running_mb, 1), "queued": queued,
+                  "budget_mb": MEMORY_BUDGET_MB, "max_concurrent": MAX_CONCURRENT}
+        if ticket:
+            row = conn.execute("SELECT seq, state FROM jobs WHERE ticket = ?", (ticket,)).fetchone()
+            if row is None:
+                status['status'] = 'none'
+            elif row[1] == 'running':
+                status['status'] = 'running'
+            else:
+                status['status'] = 'queued'
+                status['position'] = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND seq <= ?", (row[0],)).fetchone()[0]
+    return status
@@ -0,0 +1,125 @@
+"""
+Cache Janitor.
+Background thread that keeps temp_cache bounded instead of wiping it at exit:
+  - per-category TTL on last access  (uploads_ttl_hours / results_ttl_hours /
+                                      snapshots_ttl_hours)
+  - total disk quota, reclaimed least-recently-accessed first (disk_quota_mb)
+The manifest kept by storage_manager survives restarts, so sessions do too.
+"""
+
+import os
+import time
+import threading
+
+from common.db_utils import CONFIG
+from common import storage_manager as sm
+
+# Entries accessed this recently are never evicted for quota (may be in use).
+QUOTA_GRACE_SECONDS = 60
+
+_janitor_thread = None
+_janitor_lock = threading.Lock()
+
+
+def _ttl_seconds(category):
+    """Idle TTL for a category, from db_config.json (hours)."""
+    return float(CONFIG.get(f'{category}_ttl_hours', 24)) * 3600
+
+
+def sweep(now=None):
+    """
+    Run one janitor pass.  Returns {"expired": n, "evicted": n, "bytes": n}.
+    1. Adopt files missing from the manifest (access times are already in it:
+       each worker process records its own, see storage_manager._manifest_touch).
+    2. Drop entries idle longer than their category TTL.
+    3. Evict least-recently-accessed entries until under the disk quota.
+    4. Remove files left without a Parquet (e.g. the staged file and job
+       state of a failed upload) once untouched for their category TTL.
+    """
+    now = now or time.time()
+    manifest = sm.read_manifest()
+
+    # ── Reconcile manifest with what is actually on disk ──
+    # Row by row: entries saved or deleted by other workers meanwhile are kept
+    on_disk = set()
+    for category, file_id in sm.list_entries():
+        key = sm._manifest_key(category, file_id)
+        on_disk.add(key)
+        entry = manifest.get(key)
+        if entry is None:
+            try:
+                mtime = os.path.getmtime(sm._cache_path(category, file_id))
+            except OSError:
+                continue
+            sm.adopt_entry(category, file_id, mtime)
+            entry = manifest[key] = {
+                "category": category, "id": file_id, "created_at": mtime,
+                "last_access": mtime, "source": {},
+            }
+        size = sm.entry_size(category, file_id)
+        if size != entry.get('size_bytes'):
+            sm.set_entry_size(category, file_id, size)
+        entry['size_bytes'] = size
+    for key in [k for k in manifest if k not in on_disk]:
+        sm.forget_entry(manifest[key]['category'], manifest[key]['id'])
+        del manifest[key]
+
+    # ── TTL ──
+    # claim_idle_entry re-checks the last access, so an entry used or
+    # rewritten since the manifest was read survives
+    expired = 0
+    for key, entry in list(manifest.items()):
+        idle_before = now - _ttl_seconds(entry['category'])
+        if entry.get('last_access', 0) < idle_before and sm.claim_idle_entry(entry['category'], entry['id'], idle_before):
+            sm.delete_entry(entry['category'], entry['id'])
+            del manifest[key]
+            expired += 1
+
+    # ── Disk quota (LRU on last access) ──
+    evicted = 0
+    quota = float(CONFIG.get('disk_quota_mb', 5120)) * 1024 * 1024
+    total = sum(e.get('size_bytes', 0) for e in manifest.values())
+    for key, entry in sorted(manifest.items(), key=lambda kv: kv[1].get('last_access', 0)):
+        if total <= quota:
+            break
+        if not sm.claim_idle_entry(entry['category'], entry['id'], now - QUOTA_GRACE_SECONDS):
+            continue
+        sm.delete_entry(entry['category'], entry['id'])
+        total -= entry.get('size_bytes', 0)
+        evicted += 1
+
+    # ── Orphaned sidecars ──
+    orphans = 0
+    for category, path in sm.orphan_files():
+        try:
+            if os.path.getmtime(path) < now - _ttl_seconds(category):
+                os.remove(path)
+                orphans += 1
+        except OSError:
+            pass
+
+    if expired or evicted or orphans:
+        print(f"  [Janitor] {expired} expired, {evicted} evicted for quota, "
+              f"{orphans} orphaned files removed, {total / (1024 * 1024):.1f} MB in cache")
+    return {"expired": expired, "evicted": evicted, "bytes": int(total)}
+
+
+def _janitor_loop():
+    """Background daemon: sweep every janitor_interval_seconds."""
+    interval = float(CONFIG.get('janitor_interval_seconds', 300))
+    while True:
+        try:
+            sweep()
+        except Exception as e:
+            print(f"  [Janitor] sweep failed: {e}")
+        time.sleep(interval)
+
+
+def start_janitor():
+    """Start the janitor daemon thread (idempotent)."""
+    global _janitor_thread
+    with _janitor_lock:
+        if _janitor_thread is None or not _janitor_thread.is_alive():
+            _janitor_thread = threading.Thread(target=_janitor_loop, daemon=True)
+            _janitor_thread.start()
+    return _janitor_thread
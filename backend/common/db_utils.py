@@ -11,6 +11,7 @@ Supports:
 """
 
 import os
+import re
 import json
 
 
@@ -64,6 +65,110 @@ def get_connection_string(server, database, port=None, username=None, password=N
     return conn_str
 
 
+# Statements that must never reach the server from this tool
+FORBIDDEN_KEYWORDS = ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'TRUNCATE', 'ALTER', 'GRANT', 'REVOKE', 'EXEC', 'CREATE', 'MERGE']
+
+
+def is_select_only(query):
+    """Basic Safety Check (Prevent modifications): True if no forbidden keyword appears."""
+    return not any(keyword in query.upper() for keyword in FORBIDDEN_KEYWORDS)
+
+
+def quote_identifier(name):
+    """T-SQL bracket-quoted identifier."""
+    return '[' + str(name).replace(']', ']]') + ']'
+
+
+def strip_query(query):
+    """Query text without surrounding whitespace or a trailing ';'."""
+    return query.strip().rstrip(';').strip()
+
+
+def project_query(query, columns):
+    """
+    Column projection pushdown: SELECT only *columns* of *query* on the server
+    (SELECT q.[a], q.[b] FROM (<query>) q, the query on its own lines so a
+    trailing -- comment cannot swallow the ") q").  Returns *query* unchanged when
+    there is nothing to project or it cannot be used as a derived table
+    (CTE, or ORDER BY without TOP/OFFSET).
+    """
+    if not columns:
+        return query
+    body = _derived_table_body(query)
+    if body is None:
+        return query
+    select_list = ', '.join(f"q.{quote_identifier(c)}" for c in dict.fromkeys(columns))
+    return f"SELECT {select_list} FROM (\n{body}\n) q"
+
+
+def count_query(query):
+    """
+    SELECT COUNT_BIG(*) FROM (<query>) q -- the row count of *query* without
+    fetching it.  None when *query* cannot be used as a derived table.
+    """
+    body = _derived_table_body(query)
+    if body is None:
+        return None
+    return f"SELECT COUNT_BIG(*) FROM (\n{body}\n) q"
+
+
+def _derived_table_body(query):
+    """*query* stripped for use as FROM (<query>) q, or None when SQL Server
+    would refuse it there (CTE, or ORDER BY without TOP/OFFSET)."""
+    body = strip_query(query)
+    upper = body.upper()
+    if re.match(r'WITH\b', upper) or (re.search(r'\bORDER\s+BY\b', upper)
+                                      and not re.search(r'\b(TOP|OFFSET)\b', upper)):
+        return None
+    return body
+
+
+def fetch_row_count(server, database, query, port=None, timeout=30):
+    """Row count of *query* (count_query), or None when it cannot be counted."""
+    import pyodbc
+
+    sql = count_query(query)
+    if sql is None:
+        return None
+    try:
+        conn = pyodbc.connect(get_connection_string(server, database, port), timeout=timeout)
+        try:
+            return int(conn.cursor().execute(sql).fetchone()[0])
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"  [Count] Row count failed: {e}")
+        return None
+
+
+def fetch_sql_df(server, database, query, port=None, timeout=0, chunksize=None):
+    """
+    Run *query* on its own connection and return the full result as a DataFrame.
+    With *chunksize*, rows are streamed from the cursor in chunks and
+    concatenated (pyodbc releases the GIL while fetching, so several fetches
+    can run concurrently in threads).
+    Columns are converted to compact Arrow-backed dtypes (compact_dtypes);
+    chunks are compacted as they arrive, so Python-object rows never pile up.
+    """
+    import pyodbc
+    import pandas as pd
+    from common.memory_utils import compact_df
+    from common.metrics import observe_sql_fetch
+
+    conn = pyodbc.connect(get_connection_string(server, database, port), timeout=timeout)
+    try:
+        if not chunksize:
+            df = compact_df(pd.read_sql(query, conn))
+        else:
+            # At least one chunk: an empty result comes back as an empty frame
+            chunks = [compact_df(c, categories=False) for c in pd.read_sql(query, conn, chunksize=chunksize)]
+            df = compact_df(pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0])
+    finally:
+        conn.close()
+    observe_sql_fetch(len(df))
+    return df
+
+
 def validate_credentials(server, username, password):
     """
     Validate that the user-supplied credentials match the hardcoded config.
@@ -0,0 +1,346 @@
+"""
+Streaming Excel Export Engine.
+Writes color-coded reconciliation results with openpyxl in write-only mode:
+  - rows are streamed section by section, one row-group batch at a time
+  - every cell uses a shared NamedStyle (no per-cell style objects)
+  - column widths come from vectorised string lengths on a 100-row sample
+  - sections larger than Excel's sheet limit continue on a new sheet
+Large exports run as a background job; the finished workbook is cached as
+<result_id>.xlsx next to the result Parquet and served on every re-download.
+The job state is a sidecar of the result (<result_id>.export.json), so every
+worker process of serve.py sees the same job: a status poll or download that
+reaches another worker follows it, and a second request joins it.
+"""
+
+import os
+import json
+import threading
+import time
+import numpy as np
+
+from common.json_utils import sanitize_df_for_json
+from common.storage_manager import RESULTS_DIR, load_df, load_row_index, sidecar_path
+from common.result_index import load_result_index, load_result_rows
+from common.admission import pid_alive
+
+# Excel's hard per-sheet row limit
+EXCEL_MAX_ROWS = 1_048_576
+
+# Results up to this many rows are exported inline; larger ones in background
+BACKGROUND_EXPORT_ROWS = 50_000
+
+# Rows fetched from the result Parquet per batch while streaming
+EXPORT_BATCH_ROWS = 10_000
+
+SHEET_TITLE = "Reconciliation Results"
+
+# (status label, section title, pair_rows) -- pair_rows: 2 display rows per item
+SECTIONS = [
+    ('Mismatch', "Mismatched Rows", True),
+    ('Only in SQL', "Missing from File / SQL Only", False),
+    ('Only in File', "Extra in File / Not in SQL", False),
+]
+
+# Seconds between checks while waiting for another request's export
+EXPORT_POLL_SECONDS = 0.5
+
+JOB_SUFFIX = 'export.json'
+
+
+def export_path(result_id):
+    """Cached workbook path for a result."""
+    return os.path.join(RESULTS_DIR, f"{result_id}.xlsx")
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Styles  (match web UI)
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _register_styles(wb):
+    """Add the shared named styles to *wb*."""
+    from openpyxl.styles import NamedStyle, PatternFill, Font, Alignment, Border, Side
+
+    side = Side(style='thin', color='D1D5DB')
+    border = Border(left=side, right=side, top=side, bottom=side)
+
+    def fill(color):
+        return PatternFill(start_color=color, end_color=color, fill_type='solid')
+
+    specs = {
+        'rec_header':    dict(fill=fill('334155'), font=Font(color='FFFFFF', bold=True, size=10),
+                              border=border, alignment=Alignment(horizontal='center')),
+        'rec_section':   dict(fill=fill('F3F4F6'), font=Font(bold=True, size=11)),
+        'rec_pre':       dict(fill=fill('FEF9C3'), border=border),
+        'rec_post':      dict(fill=fill('DCFCE7'), border=border),
+        'rec_mismatch':  dict(fill=fill('FECACA'), font=Font(bold=True, color='7F1D1D'), border=border),
+        'rec_sql_only':  dict(fill=fill('FDE68A'), border=border),
+        'rec_file_only': dict(fill=fill('FECDD3'), border=border),
+        'rec_plain':     dict(border=border),
+        'rec_ok':        dict(font=Font(bold=True, size=12, color='16A34A')),
+    }
+    for name, attrs in specs.items():
+        wb.add_named_style(NamedStyle(name=name, **attrs))
+
+
+def _base_style(status, source, left_label='SQL'):
+    if status == 'Mismatch':
+        return 'rec_pre' if source == left_label else 'rec_post'
+    if status == 'Only in SQL':
+        return 'rec_sql_only'
+    if status == 'Only in File':
+        return 'rec_file_only'
+    return 'rec_plain'
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Writer
+# ═══════════════════════════════════════════════════════════════════════════
+
+class _SheetWriter:
+    """Appends rows to write-only sheets, rolling over at EXCEL_MAX_ROWS."""
+
+    def __init__(self, wb, display_cols, widths):
+        self.wb = wb
+        self.display_cols = display_cols
+        self.widths = widths
+        self.sheet_no = 0
+        self.ws = None
+        self.rows = 0
+        self._new_sheet()
+
+    def _new_sheet(self):
+        from openpyxl.utils import get_column_letter
+
+        self.sheet_no += 1
+        title = SHEET_TITLE if self.sheet_no == 1 else f"{SHEET_TITLE[:26]} ({self.sheet_no})"
+        self.ws = self.wb.create_sheet(title)
+        # Widths must be set before the first row in write-only mode
+        for ci, width in enumerate(self.widths, 1):
+            self.ws.column_dimensions[get_column_letter(ci)].width = width
+        self.rows = 0
+
+    def append(self, values, styles):
+        from openpyxl.cell import WriteOnlyCell
+
+        if self.rows >= EXCEL_MAX_ROWS:
+            self._new_sheet()
+            self.append_header()
+        cells = []
+        for value, style in zip(values, styles):
+            cell = WriteOnlyCell(self.ws, value=value)
+            if style:
+                cell.style = style
+            cells.append(cell)
+        self.ws.append(cells)
+        self.rows += 1
+
+    def append_header(self):
+        self.append(self.display_cols, ['rec_header'] * len(self.display_cols))
+
+    def append_blank(self):
+        if self.rows < EXCEL_MAX_ROWS:
+            self.ws.append([])
+            self.rows += 1
+
+
+def _column_widths(sample_df, display_cols):
+    """Width per column from the header and a sample of (sanitized) values."""
+    widths = []
+    for col in display_cols:
+        max_len = len(str(col))
+        if col in sample_df.columns and len(sample_df):
+            max_len = max(max_len, int(sample_df[col].astype(str).str.len().max()))
+        widths.append(min(max_len + 3, 40))
+    return widths
+
+
+def _iter_section_batches(result_id, status, df_full):
+    """Yield sanitized DataFrame batches of one status section, in stored order."""
+    if df_full is not None:
+        section = df_full[df_full['status'] == status]
+        for start in range(0, len(section), EXPORT_BATCH_ROWS):
+            yield sanitize_df_for_json(section.iloc[start:start + EXPORT_BATCH_ROWS])
+        return
+
+    index = load_result_index(result_id)
+    positions = index['status'].get(status, np.empty(0, np.int32))
+    for start in range(0, len(positions), EXPORT_BATCH_ROWS):
+        batch = load_result_rows(result_id, positions[start:start + EXPORT_BATCH_ROWS], index)
+        yield sanitize_df_for_json(batch)
+
+
+def write_workbook(result_id, path, progress=None):
+    """
+    Stream the result *result_id* into an .xlsx at *path*.
+    Uses the result index when present (reads only the rows of each section);
+    otherwise loads the result once.  Returns the number of data rows written.
+    """
+    from openpyxl import Workbook
+
+    index = load_result_index(result_id)
+    df_full = None if index is not None else load_df('results', result_id)
+    if index is None and df_full is None:
+        raise FileNotFoundError("Result cache expired. Run comparison again.")
+
+    if df_full is not None:
+        columns = list(df_full.columns)
+        counts = df_full['status'].value_counts().to_dict() if len(df_full) else {}
+        sample = sanitize_df_for_json(df_full.head(100))
+    else:
+        counts = {name: len(rows) for name, rows in index['status'].items()}
+        sample = sanitize_df_for_json(load_result_rows(result_id, np.arange(min(100, index['meta']['num_rows'])),
+                                                       index))
+        columns = list(sample.columns)
+
+    left_label = index['meta'].get('left_label', 'SQL') if index is not None else 'SQL'
+    display_cols = [c for c in columns if c != '_mismatch_cols']
+    status_pos = display_cols.index('status') if 'status' in display_cols else None
+    source_pos = display_cols.index('source') if 'source' in display_cols else None
+
+    wb = Workbook(write_only=True)
+    _register_styles(wb)
+    writer = _SheetWriter(wb, display_cols, _column_widths(sample, display_cols))
+
+    written = 0
+    for status, title, pair_rows in SECTIONS:
+        n = counts.get(status, 0)
+        if n == 0:
+            continue
+        label = f"{title} ({n // 2 if pair_rows else n})"
+        writer.append([label], ['rec_section'])
+        writer.append_header()
+
+        for batch in _iter_section_batches(result_id, status, df_full):
+            values = batch[display_cols].astype(str).to_numpy().tolist()
+            mismatch = batch['_mismatch_cols'].astype(str).to_numpy() \
+                if '_mismatch_cols' in batch.columns else [''] * len(batch)
+            for row, mm in zip(values, mismatch):
+                base = _base_style(row[status_pos] if status_pos is not None else '',
+                                   row[source_pos] if source_pos is not None else '',
+                                   left_label)
+                styles = [base] * len(row)
+                if mm and row[status_pos] == 'Mismatch':
+                    flagged = {c.strip() for c in mm.split(',')}
+                    styles = ['rec_mismatch' if c in flagged else base for c in display_cols]
+                writer.append(row, styles)
+            written += len(values)
+            if progress:
+                progress(written)
+
+        writer.append_blank()
+
+    if written == 0:
+        writer.append(["No discrepancies found - data matches perfectly!"], ['rec_ok'])
+
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    wb.save(tmp)
+    os.replace(tmp, path)
+    return written
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Background jobs
+# ═══════════════════════════════════════════════════════════════════════════
+
+def result_row_count(result_id):
+    """Display rows of a result (SQL + File rows), or None if it no longer exists."""
+    rows = load_row_index('results', result_id)
+    if rows is None:
+        return None
+    index = load_result_index(result_id)
+    return rows['num_rows'] if index is None else index['meta']['num_rows']
+
+
+def _job_path(result_id):
+    return sidecar_path('results', result_id, JOB_SUFFIX)
+
+
+def _read_job(result_id):
+    try:
+        with open(_job_path(result_id), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_job(result_id, job):
+    """Atomically replace the job file."""
+    path = _job_path(result_id)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(job, f)
+    os.replace(tmp, path)
+
+
+def _claim_job(result_id):
+    """Create the running job file; False if a live export already owns it."""
+    job = {"status": "running", "rows_written": 0, "started_at": time.time(), "pid": os.getpid()}
+    for _ in range(2):
+        try:
+            fd = os.open(_job_path(result_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            current = _read_job(result_id)
+            if current is not None and current.get('status') == 'running' and pid_alive(current.get('pid', -1)):
+                return False
+            # Failed or abandoned (its process died): start over
+            try:
+                os.remove(_job_path(result_id))
+            except OSError:
+                pass
+            continue
+        with os.fdopen(fd, 'w') as f:
+            json.dump(job, f)
+        return True
+    return False
+
+
+def get_export_status(result_id):
+    """
+    {"status": "done" | "running" | "error" | "none", ...} for a result's export.
+    A cached workbook on disk always counts as done.
+    """
+    job = _read_job(result_id)
+    if job is not None and job.get('status') == 'running' and not pid_alive(job.get('pid', -1)):
+        job = {"status": "error", "message": "Export was interrupted. Please try again."}
+    if job is not None and job.get('status') in ('running', 'error'):
+        job.pop('pid', None)
+        return job
+    if os.path.exists(export_path(result_id)):
+        return {"status": "done", "path": export_path(result_id)}
+    return {"status": "none"}
+
+
+def _run_export(result_id):
+    job = _read_job(result_id) or {"status": "running", "started_at": time.time(), "pid": os.getpid()}
+
+    def progress(n):
+        _write_job(result_id, dict(job, rows_written=n))
+
+    t0 = time.time()
+    try:
+        rows = write_workbook(result_id, export_path(result_id), progress)
+        print(f"  [Export] {result_id[:8]}: {rows} rows to Excel in {time.time() - t0:.2f}s")
+        try:
+            os.remove(_job_path(result_id))
+        except OSError:
+            pass
+    except Exception as e:
+        _write_job(result_id, {"status": "error", "message": str(e)})
+
+
+def start_export(result_id):
+    """Start the background export of *result_id*, unless one is already
+    running (in any worker process)."""
+    if os.path.exists(export_path(result_id)) or not _claim_job(result_id):
+        return
+    threading.Thread(target=_run_export, args=(result_id,), daemon=True).start()
+
+
+def wait_for_export(result_id, timeout=None):
+    """Block until the export of *result_id* is no longer running.  Returns its status."""
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+        status = get_export_status(result_id)
+        if status['status'] != 'running' or (deadline is not None and time.time() >= deadline):
+            return status
+        time.sleep(EXPORT_POLL_SECONDS)
@@ -0,0 +1,123 @@
+"""
+Chunked File Ingestion.
+Reads CSV / Excel / Parquet uploads in fixed-size chunks and streams them
+straight into the Parquet upload cache, so multi-GB files never have to fit
+in memory.  Every column is stored as string (nulls kept as null): chunk-wise
+type inference would otherwise disagree between chunks, and the comparison
+engine normalises values as strings anyway.  With compact_dtypes on,
+columns that are low-cardinality in the first chunk are dictionary encoded
+(they load back as pandas categories).
+"""
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from common.storage_manager import coerce_for_parquet, write_tables, save_df
+from common.memory_utils import COMPACT_DTYPES, CATEGORY_MAX_RATIO, CATEGORY_MIN_ROWS
+
+# Rows per chunk (= rows per Parquet row group in the upload cache)
+INGEST_CHUNK_ROWS = 100_000
+
+SUPPORTED_EXTENSIONS = ('.csv', '.xls', '.xlsx', '.parquet')
+
+
+def is_supported(filename):
+    return filename.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def _iter_xlsx_chunks(stream, chunk_rows):
+    """Stream the first sheet of an .xlsx with openpyxl read-only mode."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)]
+        batch = []
+        for row in rows:
+            batch.append(row[:len(columns)])
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame(batch, columns=columns)
+                batch = []
+        yield pd.DataFrame(batch, columns=columns)
+    finally:
+        wb.close()
+
+
+def iter_file_chunks(stream, filename, chunk_rows=INGEST_CHUNK_ROWS):
+    """Yield DataFrame chunks of an uploaded file (at least one, maybe empty)."""
+    name = filename.lower()
+    if name.endswith('.csv'):
+        yield from pd.read_csv(stream, chunksize=chunk_rows)
+    elif name.endswith('.parquet'):
+        pf = pq.ParquetFile(stream)
+        yielded = False
+        for batch in pf.iter_batches(batch_size=chunk_rows):
+            yielded = True
+            yield batch.to_pandas()
+        if not yielded:
+            yield pf.schema_arrow.empty_table().to_pandas()
+    elif name.endswith('.xlsx'):
+        yield from _iter_xlsx_chunks(stream, chunk_rows)
+    elif name.endswith('.xls'):
+        # Legacy .xls has no streaming reader; these files are small by format
+        df = pd.read_excel(stream)
+        for start in range(0, max(len(df), 1), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+    else:
+        raise ValueError("Invalid file format. Only CSV, Excel or Parquet allowed.")
+
+
+def chunk_to_table(chunk):
+    """DataFrame chunk -> all-string PyArrow Table (nulls preserved)."""
+    df = coerce_for_parquet(chunk)
+    for col in df.columns:
+        s = df[col]
+        if not (pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s)):
+            df[col] = s.astype(str).where(s.notna(), None)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    schema = pa.schema([pa.field(str(name), pa.string()) for name in table.column_names])
+    return table.rename_columns(schema.names).cast(schema)
+
+
+def _dictionary_columns(table):
+    """Columns of the first chunk worth dictionary encoding (compact_dtypes)."""
+    if not COMPACT_DTYPES or table.num_rows < CATEGORY_MIN_ROWS:
+        return []
+    return [name for name in table.column_names
+            if pc.count_distinct(table[name]).as_py() <= CATEGORY_MAX_RATIO * table.num_rows]
+
+
+def _dictionary_encode(table, names):
+    for name in names:
+        i = table.schema.get_field_index(name)
+        table = table.set_column(i, name, pc.dictionary_encode(table.column(i)))
+    return table
+
+
+def ingest_file(stream, filename, file_id, chunk_rows=INGEST_CHUNK_ROWS, source=None):
+    """
+    Stream an upload into uploads/<file_id>.parquet chunk by chunk.
+    Returns (columns, preview_df, total_rows); preview is the first 5 rows.
+    """
+    state = {'preview': None, 'dictionary_cols': None}
+
+    def tables():
+        for chunk in iter_file_chunks(stream, filename, chunk_rows):
+            if state['preview'] is None:
+                state['preview'] = chunk.head(5)
+            table = chunk_to_table(chunk)
+            if state['dictionary_cols'] is None:
+                state['dictionary_cols'] = _dictionary_columns(table)
+            yield _dictionary_encode(table, state['dictionary_cols'])
+
+    path, total = write_tables('uploads', file_id, tables(), source=source)
+    preview = state['preview'] if state['preview'] is not None else pd.DataFrame()
+    if path is None:
+        save_df(preview, 'uploads', file_id, source=source)
+    return [str(c) for c in preview.columns], preview, total
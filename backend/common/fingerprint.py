@@ -0,0 +1,232 @@
+"""
+Row Fingerprints (128-bit).
+Content fingerprints of normalised rows, used wherever rows are matched
+without keys (smart fingerprint mode, exact-match elimination, partitioning,
+upload prework).
+
+Each column is hashed in bulk straight from its Arrow buffers (dictionary
+columns: each distinct value once): every string is read as little-endian
+64-bit words from the offsets + data buffers, each word is mixed with its
+position (splitmix64 finaliser), the words are summed per string and the sum
+is mixed with the length.  Two independently seeded lanes give 128 bits.
+Column hashes are folded into the row fingerprint in column order.
+
+Work is split per column and per chunk of CHUNK_ROWS rows over a thread pool
+(NumPy and Arrow release the GIL), and fingerprint_frame() reports rows/s and
+MB/s.  At 128 bits an accidental collision is out of reach even at billions
+of rows; verify_pairs() (fingerprint_verify in db_config.json) additionally
+compares the normalised values of every fingerprint-matched pair, so a
+collision can never hide a difference.
+
+Fingerprints are (n, 2) uint64 arrays.
+"""
+
+import os
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from concurrent.futures import ThreadPoolExecutor
+
+from common.db_utils import CONFIG
+
+# Rows per hashing task (per column)
+CHUNK_ROWS = 1 << 18
+
+# Hashing threads (default: one per CPU, at most 8)
+THREADS = int(CONFIG.get('fingerprint_threads', 0)) or min(8, os.cpu_count() or 1)
+
+# Compare normalised values of fingerprint-matched rows
+VERIFY = bool(CONFIG.get('fingerprint_verify', True))
+
+_M1 = np.uint64(0xbf58476d1ce4e5b9)
+_M2 = np.uint64(0x94d049bb133111eb)
+_GOLDEN = np.uint64(0x9e3779b97f4a7c15)
+_SEEDS = (np.uint64(0x243f6a8885a308d3), np.uint64(0x13198a2e03707344))
+_NULL = np.uint64(0xa4093822299f31d0)
+
+
+def _mix(x):
+    """splitmix64 finaliser (in place on a fresh uint64 array)."""
+    x ^= x >> np.uint64(30)
+    x *= _M1
+    x ^= x >> np.uint64(27)
+    x *= _M2
+    x ^= x >> np.uint64(31)
+    return x
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Hashing
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _hash_strings(arr):
+    """(len(arr), 2) uint64 hashes of a string Array (nulls hash to a constant)."""
+    arr = arr.cast(pa.large_string()) if not pa.types.is_large_string(arr.type) else arr
+    n = len(arr)
+    out = np.empty((n, 2), dtype=np.uint64)
+    if n == 0:
+        return out
+    _, offsets_buf, data_buf = arr.buffers()
+    offsets = np.frombuffer(offsets_buf, dtype=np.int64, count=n + 1, offset=arr.offset * 8)
+    # A slice shares the whole column's data buffer: keep only its own bytes
+    data = (np.frombuffer(data_buf, dtype=np.uint8)[offsets[0]:offsets[-1]]
+            if data_buf is not None else np.empty(0, np.uint8))
+
+    starts = offsets[:-1] - offsets[0]
+    lengths = np.diff(offsets)
+    n_words = np.maximum(1, (lengths + 7) // 8)         # empty strings hash one zero word
+    first = np.zeros(n, dtype=np.int64)
+    np.cumsum(n_words[:-1], out=first[1:])
+    owner = np.repeat(np.arange(n), n_words)
+    word_no = np.arange(len(owner)) - first[owner]
+
+    # Read 8 bytes per word (zero padded past the buffer) and drop the bytes
+    # beyond the string's end
+    padded = np.zeros(len(data) + 8, dtype=np.uint8)
+    padded[:len(data)] = data
+    windows = np.lib.stride_tricks.as_strided(padded, shape=(len(data) + 1, 8), strides=(1, 1))
+    byte_pos = np.minimum(starts[owner] + 8 * word_no, len(data))
+    words = np.ascontiguousarray(windows[byte_pos]).view('<u8').ravel()
+    left = np.clip(lengths[owner] - 8 * word_no, 0, 8).astype(np.uint64)
+    keep = np.where(left == 8, np.uint64(0xFFFFFFFFFFFFFFFF),
+                    (np.uint64(1) << (left * np.uint64(8)) % np.uint64(64)) - np.uint64(1))
+    words &= keep
+
+    position = word_no.astype(np.uint64) * _GOLDEN
+    ulengths = lengths.astype(np.uint64) * _M2
+    for lane, seed in enumerate(_SEEDS):
+        acc = np.add.reduceat(_mix(words ^ (position + seed)), first)
+        out[:, lane] = _mix(acc ^ (ulengths + seed))
+    if arr.null_count:
+        out[np.asarray(arr.is_null())] = _NULL
+    return out
+
+
+def _hash_chunk(arr):
+    """Hash one column chunk.  Dictionary columns hash each distinct value once."""
+    if not pa.types.is_dictionary(arr.type):
+        if not pa.types.is_large_string(arr.type):
+            arr = arr.cast(pa.large_string())
+        return _hash_strings(arr), arr.nbytes
+    dictionary = arr.dictionary
+    if not pa.types.is_large_string(dictionary.type):
+        dictionary = dictionary.cast(pa.large_string())
+    hashes = _hash_strings(dictionary)
+    indices = arr.indices
+    if indices.null_count:
+        hashes = np.vstack([hashes, np.full((1, 2), _NULL, dtype=np.uint64)])
+        indices = indices.fill_null(len(dictionary))
+    return hashes[indices.to_numpy(zero_copy_only=False)], arr.nbytes
+
+
+def fingerprint_frame(df, threads=None, stats=None):
+    """
+    (len(df), 2) uint64 fingerprints of the rows of *df* (normalised string
+    values; other types are hashed by their string form).
+    stats: optional dict, filled with rows, bytes, seconds, rows/s, MB/s, threads.
+    """
+    t0 = time.perf_counter()
+    n = len(df)
+    threads = threads or THREADS
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tasks = [(j, start) for j in range(table.num_columns) for start in range(0, n, CHUNK_ROWS)]
+
+    def work(task):
+        j, start = task
+        chunk = table.column(j).slice(start, CHUNK_ROWS)
+        arr = chunk.combine_chunks() if chunk.num_chunks != 1 else chunk.chunk(0)
+        return _hash_chunk(arr)
+
+    if threads > 1 and len(tasks) > 1:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(work, tasks))
+    else:
+        results = [work(t) for t in tasks]
+
+    fp = np.zeros((n, 2), dtype=np.uint64)
+    total_bytes = 0
+    for (j, start), (hashes, nbytes) in zip(tasks, results):
+        rows = fp[start:start + len(hashes)]
+        salt = np.uint64(((j + 1) * int(_GOLDEN)) & 0xFFFFFFFFFFFFFFFF)
+        for lane in range(2):
+            rows[:, lane] = _mix(rows[:, lane] * _M1 + (hashes[:, lane] ^ salt))
+        total_bytes += nbytes
+
+    if stats is not None:
+        seconds = time.perf_counter() - t0
+        stats.update({
+            "bits": 128, "rows": n, "bytes": int(total_bytes), "seconds": round(seconds, 3),
+            "rows_per_second": int(n / seconds) if seconds > 0 else None,
+            "mb_per_second": round(total_bytes / 1024 / 1024 / seconds, 1) if seconds > 0 else None,
+            "threads": min(threads, max(1, len(tasks))),
+        })
+    return fp
+
+
+def merge_stats(*stats):
+    """Combined report of several fingerprint_frame() stats dicts."""
+    stats = [s for s in stats if s]
+    if not stats:
+        return {}
+    rows = sum(s['rows'] for s in stats)
+    nbytes = sum(s['bytes'] for s in stats)
+    seconds = sum(s['seconds'] for s in stats)
+    return {
+        "bits": 128, "rows": rows, "bytes": nbytes, "seconds": round(seconds, 3),
+        "rows_per_second": int(rows / seconds) if seconds > 0 else None,
+        "mb_per_second": round(nbytes / 1024 / 1024 / seconds, 1) if seconds > 0 else None,
+        "threads": max(s['threads'] for s in stats),
+    }
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Matching
+# ═══════════════════════════════════════════════════════════════════════════
+
+def match_codes(fp_a, fp_b):
+    """Dense int64 codes per row of both sides: equal codes <=> equal fingerprints."""
+    both = np.concatenate([fp_a, fp_b])
+    hi, n_hi = pd.factorize(both[:, 0])
+    lo, n_lo = pd.factorize(both[:, 1])
+    codes, _ = pd.factorize(hi.astype(np.int64) * len(n_lo) + lo)
+    codes = codes.astype(np.int64)
+    return codes[:len(fp_a)], codes[len(fp_a):]
+
+
+def exact_match_pairs(codes_a, codes_b):
+    """
+    Multiset matching on codes: the n-th occurrence of a code on one side
+    pairs with its n-th occurrence on the other.  Returns (pos_a, pos_b)
+    position arrays of the pairs.
+    """
+    occ_a = pd.Series(codes_a).groupby(codes_a).cumcount().to_numpy()
+    occ_b = pd.Series(codes_b).groupby(codes_b).cumcount().to_numpy()
+    width = np.int64(max(len(codes_a), len(codes_b)) + 1)
+    key_a = codes_a * width + occ_a
+    key_b = codes_b * width + occ_b
+    common, pos_a, pos_b = np.intersect1d(key_a, key_b, assume_unique=True, return_indices=True)
+    return pos_a, pos_b
+
+
+def _arrow_column(df, col):
+    column = pa.Table.from_pandas(df[[col]], preserve_index=False).column(0)
+    return column if pa.types.is_large_string(column.type) else column.cast(pa.large_string())
+
+
+def verify_pairs(norm_a, norm_b, pos_a, pos_b, columns=None):
+    """Boolean per pair: True where the normalised values really are equal."""
+    ok = np.ones(len(pos_a), dtype=bool)
+    if not len(pos_a):
+        return ok
+    for col in (columns if columns is not None else norm_a.columns):
+        a = _arrow_column(norm_a, col).take(pa.array(pos_a))
+        b = _arrow_column(norm_b, col).take(pa.array(pos_b))
+        ok &= pc.fill_null(pc.equal(a, b), pc.and_(pc.is_null(a), pc.is_null(b))).to_numpy(zero_copy_only=False)
+    return ok
+
+
+def partition_of(fp, n_parts):
+    """Partition number per row from its fingerprint."""
+    return (fp[:, 0] % np.uint64(n_parts)).astype(np.int64)
@@ -6,6 +6,8 @@ Problem  : Flask 3.x ignores app.json_encoder.  Pandas 3.x df.fillna("")
            objects calls .timetuple() which crashes.
 Solution : Convert every cell BEFORE json.dumps, then use our own
            safe_jsonify() with default=str as ultimate fallback.
+           Typed columns are converted in bulk; only object columns go
+           through the per-cell _safe_val().  orjson is used when installed.
 """
 
 from flask import Response
@@ -15,6 +17,14 @@ import json
 import datetime
 import decimal
 
+try:
+    import orjson
+except ImportError:             # optional speed-up
+    orjson = None
+
+# String cells that mean "no value" (compared stripped + lower-cased)
+_NULL_STRINGS = ['none', 'nat', 'nan', '<na>']
+
 
 def _safe_val(v):
     """Convert ONE value to a JSON-native primitive.
@@ -74,23 +84,126 @@ def _safe_val(v):
     return v
 
 
+# ═══════════════════════════════════════════════════════════════════════════
+# Per-dtype column sanitizers  (same output as mapping _safe_val per cell)
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _sanitize_float(s):
+    """NaN / inf -> '' in bulk; untouched when the column is all finite."""
+    vals = s.to_numpy(dtype='float64', na_value=np.nan)
+    bad = ~np.isfinite(vals)
+    if not bad.any():
+        return s
+    out = vals.astype(object)
+    out[bad] = ''
+    return pd.Series(out, index=s.index, dtype=object)
+
+
+def _sanitize_datetime(s):
+    """Bulk Timestamp.isoformat(); NaT -> ''.  Falls back to _safe_val per cell
+    for tz-aware or nanosecond-precision columns."""
+    if s.dt.tz is not None or (s.dt.nanosecond.fillna(0) != 0).any():
+        return s.map(_safe_val)
+    out = s.dt.strftime('%Y-%m-%dT%H:%M:%S').astype(object)
+    us = s.dt.microsecond
+    frac = us.fillna(0) != 0
+    if frac.any():
+        out[frac] = out[frac] + '.' + us[frac].astype('int64').astype(str).str.zfill(6)
+    out[s.isna()] = ''
+    return out
+
+
+def _sanitize_string(s):
+    """String-dtype column: nulls and 'None'/'NaN'/'NaT' sentinels -> ''."""
+    blank = s.isna() | s.str.strip().str.lower().isin(_NULL_STRINGS)
+    out = s.astype(object)
+    if blank.any():
+        out[blank.to_numpy(dtype=bool)] = ''
+    return out
+
+
+def _sanitize_categorical(s):
+    """Category column: sanitize each category once, expand by code (-1 = null)."""
+    cats = _sanitize_column(pd.Series(s.cat.categories)).to_numpy(dtype=object)
+    values = np.append(cats, '')
+    return pd.Series(values[s.cat.codes.to_numpy()], index=s.index, dtype=object)
+
+
+def _sanitize_column(s):
+    """Pick a sanitizer from the column dtype."""
+    dtype = s.dtype
+    if isinstance(dtype, np.dtype):
+        if dtype.kind in 'iub':
+            return s
+        if dtype.kind == 'f':
+            return _sanitize_float(s)
+        if dtype.kind == 'M':
+            return _sanitize_datetime(s)
+    elif isinstance(dtype, pd.DatetimeTZDtype):
+        return s.map(_safe_val)
+    elif isinstance(dtype, pd.StringDtype):
+        return _sanitize_string(s)
+    elif isinstance(dtype, pd.CategoricalDtype):
+        return _sanitize_categorical(s)
+    return s.map(_safe_val)
+
+
 def sanitize_df_for_json(df):
     """Make every cell in a DataFrame safe for json.dumps.
 
     Replaces `df.fillna("")` + handles typed columns that fillna crashes on.
-    Processes ALL columns regardless of dtype.
+    Numeric, datetime and string columns are handled in bulk; object and
+    other columns fall back to _safe_val() per cell.
     """
-    df = df.copy()
+    df = df.copy(deep=False)
     for col in df.columns:
-        df[col] = df[col].map(_safe_val)
+        df[col] = _sanitize_column(df[col])
     return df
 
 
+def _default(v):
+    """Fallback for values neither encoder handles natively: float subclasses
+    (np.float64) as numbers, everything else as str() -- json.dumps(default=str)
+    semantics (np.int64, np.bool_, Decimal ... become strings)."""
+    if isinstance(v, float):
+        return float(v)
+    return str(v)
+
+
+def _has_non_finite(data):
+    """True if *data* holds a NaN / Infinity float (nested dicts/lists)."""
+    if isinstance(data, (float, np.floating)):
+        return not np.isfinite(data)
+    if isinstance(data, dict):
+        return any(_has_non_finite(v) for v in data.values())
+    if isinstance(data, (list, tuple)):
+        return any(_has_non_finite(v) for v in data)
+    return False
+
+
+def _dumps(data):
+    """Encode with orjson when available, else stdlib json (same output).
+
+    orjson writes non-finite floats as null; stdlib json writes NaN /
+    Infinity, which the responses have always carried, so payloads with
+    such values are left to stdlib json.
+    """
+    if orjson is not None:
+        try:
+            payload = orjson.dumps(data, default=_default,
+                                   option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+            if b'null' not in payload or not _has_non_finite(data):
+                return payload
+        except (TypeError, orjson.JSONEncodeError):
+            pass                # e.g. ints beyond 64 bits
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
 def safe_jsonify(data, status=200):
     """Flask-version-agnostic JSON response.
 
-    Uses json.dumps with default=str as ultimate fallback so it
-    NEVER raises a serialisation error.
+    Uses default=str as ultimate fallback so it NEVER raises a
+    serialisation error.
     """
-    payload = json.dumps(data, ensure_ascii=False, default=str)
+    payload = _dumps(data)
     return Response(payload, status=status, mimetype='application/json')
@@ -0,0 +1,135 @@
+"""
+Compact In-Memory DataFrames + Memory Reporting.
+
+compact_df() converts pandas' default Python-object columns to Arrow-backed
+and smaller dtypes (db_config.json "compact_dtypes", default on):
+  - text             -> string[pyarrow]  (one contiguous buffer, no PyObjects)
+  - low-cardinality  -> category         (dictionary encoded)
+  - Decimal          -> Arrow decimal128 (exact, fixed width)
+  - datetime.date    -> Arrow date32
+  - int64            -> smallest integer type that holds the values
+Values keep their text form (str(v)), so comparison results do not change.
+Floats are never narrowed.
+
+frame_mb() / process_rss_mb() feed the per-stage memory report in
+comparison summaries (summary['memory_mb']).
+"""
+
+import os
+import decimal
+import datetime
+import pandas as pd
+import pyarrow as pa
+
+from common.db_utils import CONFIG
+
+try:
+    import psutil
+except ImportError:             # optional: process RSS in memory reports
+    psutil = None
+
+COMPACT_DTYPES = bool(CONFIG.get('compact_dtypes', True))
+
+# pandas 3's default 'str' is Arrow-backed with NaN nulls; older pandas needs the alias
+ARROW_STRING = 'str' if int(pd.__version__.split('.')[0]) >= 3 else 'string[pyarrow]'
+
+# Text columns with at most this share of distinct values become categories
+CATEGORY_MAX_RATIO = 0.5
+
+# ... and only when they are at least this long (tiny frames gain nothing)
+CATEGORY_MIN_ROWS = 1000
+
+
+def _first_valid(s):
+    idx = s.first_valid_index()
+    return None if idx is None else s.loc[idx]
+
+
+def _low_cardinality(s):
+    return (pd.api.types.is_string_dtype(s.dtype) and not isinstance(s.dtype, pd.CategoricalDtype)
+            and len(s) >= CATEGORY_MIN_ROWS and s.nunique(dropna=True) <= CATEGORY_MAX_RATIO * len(s))
+
+
+def _compact_object(s, categories=True):
+    """Arrow-backed replacement for one object column, or None to keep it."""
+    sample = _first_valid(s)
+    if sample is None:
+        return None
+    try:
+        if isinstance(sample, str):
+            s = s.astype(ARROW_STRING)
+            return s.astype('category') if categories and _low_cardinality(s) else s
+        if isinstance(sample, decimal.Decimal):
+            arr = pa.array(s.to_numpy(dtype=object), from_pandas=True)
+            if pa.types.is_decimal(arr.type):
+                return pd.Series(pd.arrays.ArrowExtensionArray(arr), index=s.index, name=s.name)
+        if isinstance(sample, datetime.date) and not isinstance(sample, datetime.datetime):
+            arr = pa.array(s.to_numpy(dtype=object), type=pa.date32(), from_pandas=True)
+            return pd.Series(pd.arrays.ArrowExtensionArray(arr), index=s.index, name=s.name)
+    except (pa.ArrowException, TypeError, ValueError):
+        # Mixed types in the column -- leave it as Python objects
+        return None
+    return None
+
+
+def compact_df(df, categories=True):
+    """
+    Return *df* with compact column dtypes (see module doc).  Columns that are
+    already compact are shared, not copied.  No-op when compact_dtypes is off.
+    categories=False skips dictionary encoding (for chunks that are
+    concatenated later -- categories would not line up).
+    """
+    if not COMPACT_DTYPES:
+        return df
+    out = df.copy(deep=False)
+    for col in out.columns:
+        s = out[col]
+        if s.dtype == object:
+            new = _compact_object(s, categories)
+        elif categories and _low_cardinality(s):
+            new = s.astype('category')
+        elif s.dtype.kind == 'i':
+            new = pd.to_numeric(s, downcast='integer')
+        else:
+            new = None
+        if new is not None:
+            out[col] = new
+    return out
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Memory reporting
+# ═══════════════════════════════════════════════════════════════════════════
+
+def frame_mb(*frames):
+    """Deep in-memory size of the given DataFrames, in MB."""
+    total = 0
+    for df in frames:
+        if df is not None:
+            total += int(df.memory_usage(deep=True, index=True).sum())
+    return round(total / (1024 * 1024), 2)
+
+
+def process_rss_bytes():
+    """Resident set size of this process in bytes: psutil, else
+    /proc/self/statm (Linux), else None."""
+    if psutil is not None:
+        return psutil.Process(os.getpid()).memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def process_rss_mb():
+    """Resident set size of this process in MB (None where unavailable)."""
+    rss = process_rss_bytes()
+    return None if rss is None else round(rss / (1024 * 1024), 1)
+
+
+def record_stage(stages, name, *frames):
+    """Add stage *name* (size of *frames*, MB) to a memory report dict."""
+    if stages is not None:
+        stages[name] = frame_mb(*frames)
+    return stages
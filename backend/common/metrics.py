@@ -0,0 +1,214 @@
+"""
+Service Metrics (Prometheus text format, served by GET /api/metrics).
+
+Recorded by lightweight request middleware (hooks on common_bp, so they wrap
+every blueprint and the UI routes):
+  - recon_http_requests_total{endpoint,method,status}
+  - recon_http_request_duration_seconds{endpoint,method}   histogram
+  - recon_comparisons_in_flight
+Fed by the code doing the work:
+  - recon_sql_rows_fetched_total            (every SQL Server fetch)
+  - recon_rows_compared_total, recon_comparison_seconds_total
+  - recon_comparison_rows_per_second        (most recent comparison)
+Read at scrape time:
+  - recon_cache_* : in-memory LRU hits / misses / entries / bytes and on-disk
+                    entries / bytes, per category (uploads, results)
+  - recon_admission_* : comparisons holding a slot, queued, memory reserved
+                        (shared by all worker processes)
+  - process_resident_memory_bytes, process_cpu_seconds_total
+
+Throughput over a window is a PromQL rate(), e.g.
+rate(recon_rows_compared_total[5m]).  Durations of streamed responses
+(CSV export) are measured to the first byte.  Counters are kept per worker
+process; under serve.py each worker reports its own.
+"""
+
+import os
+import time
+import threading
+
+# Request latency buckets in seconds (comparisons and exports can take minutes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Endpoints whose requests count as in-flight comparisons
+COMPARISON_ENDPOINTS = ('/api/run_comparison', '/api/m2/run_comparison', '/api/m3/run_comparison')
+
+_lock = threading.Lock()
+_requests = {}                  # (endpoint, method, status) -> count
+_latency = {}                   # (endpoint, method) -> [bucket counts..., sum, count]
+_counters = {'sql_rows_fetched': 0, 'rows_compared': 0, 'comparison_seconds': 0.0, 'comparisons': 0}
+_gauges = {'comparisons_in_flight': 0, 'comparison_rows_per_second': 0.0}
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Recording
+# ═══════════════════════════════════════════════════════════════════════════
+
+def request_started(endpoint):
+    """Call when a request starts.  Returns the start time for request_finished."""
+    if endpoint in COMPARISON_ENDPOINTS:
+        with _lock:
+            _gauges['comparisons_in_flight'] += 1
+    return time.perf_counter()
+
+
+def request_finished(endpoint, method, status, started):
+    """Record one completed request (*started* from request_started)."""
+    elapsed = time.perf_counter() - started
+    with _lock:
+        key = (endpoint, method, str(status))
+        _requests[key] = _requests.get(key, 0) + 1
+        hist = _latency.setdefault((endpoint, method), [0] * (len(LATENCY_BUCKETS) + 2))
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                hist[i] += 1
+        hist[-2] += elapsed
+        hist[-1] += 1
+
+
+def request_closed(endpoint):
+    """Call once per request, however it ended (balances request_started)."""
+    if endpoint in COMPARISON_ENDPOINTS:
+        with _lock:
+            _gauges['comparisons_in_flight'] -= 1
+
+
+def observe_sql_fetch(rows):
+    """Rows fetched from SQL Server."""
+    with _lock:
+        _counters['sql_rows_fetched'] += int(rows)
+
+
+def observe_comparison(summary):
+    """Rows compared (both sides) and engine time of a finished comparison."""
+    rows = int(summary.get('total_sql_rows', 0)) + int(summary.get('total_file_rows', 0))
+    seconds = float(summary.get('elapsed_seconds') or 0)
+    with _lock:
+        _counters['rows_compared'] += rows
+        _counters['comparison_seconds'] += seconds
+        _counters['comparisons'] += 1
+        if seconds > 0:
+            _gauges['comparison_rows_per_second'] = rows / seconds
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Exposition
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+def _family(lines, name, kind, help_text, samples):
+    """Append one metric family; *samples* is a list of (suffix, labels, value)."""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for suffix, labels, value in samples:
+        lines.append(f"{name}{suffix}{_labels(**labels)} {_number(value)}")
+
+
+def _process_stats():
+    """(RSS bytes, CPU seconds) of this process; None where unavailable."""
+    from common.memory_utils import psutil, process_rss_bytes
+    if psutil is not None:
+        proc = psutil.Process(os.getpid())
+        cpu = proc.cpu_times()
+        return proc.memory_info().rss, cpu.user + cpu.system
+    try:
+        import resource
+    except ImportError:         # Windows without psutil
+        return None, None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return process_rss_bytes(), usage.ru_utime + usage.ru_stime
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    from common.storage_manager import cache_stats, disk_usage
+    from common.admission import queue_status
+
+    with _lock:
+        requests = dict(_requests)
+        latency = {k: list(v) for k, v in _latency.items()}
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+    lines = []
+
+    # ── HTTP ──
+    _family(lines, 'recon_http_requests_total', 'counter', "HTTP requests by endpoint, method and status.",
+            [('', dict(endpoint=e, method=m, status=s), n) for (e, m, s), n in sorted(requests.items())])
+    samples = []
+    for (endpoint, method), hist in sorted(latency.items()):
+        for bound, count in zip(LATENCY_BUCKETS, hist):
+            samples.append(('_bucket', dict(endpoint=endpoint, method=method, le=_number(float(bound))), count))
+        samples.append(('_bucket', dict(endpoint=endpoint, method=method, le='+Inf'), hist[-1]))
+        samples.append(('_sum', dict(endpoint=endpoint, method=method), float(hist[-2])))
+        samples.append(('_count', dict(endpoint=endpoint, method=method), hist[-1]))
+    _family(lines, 'recon_http_request_duration_seconds', 'histogram',
+            "HTTP request latency in seconds.", samples)
+
+    # ── Comparisons ──
+    _family(lines, 'recon_comparisons_in_flight', 'gauge', "Comparison requests currently running.",
+            [('', {}, gauges['comparisons_in_flight'])])
+    _family(lines, 'recon_comparisons_total', 'counter', "Comparisons completed.",
+            [('', {}, counters['comparisons'])])
+    _family(lines, 'recon_sql_rows_fetched_total', 'counter', "Rows fetched from SQL Server.",
+            [('', {}, counters['sql_rows_fetched'])])
+    _family(lines, 'recon_rows_compared_total', 'counter', "Input rows compared (both sides).",
+            [('', {}, counters['rows_compared'])])
+    _family(lines, 'recon_comparison_seconds_total', 'counter', "Engine time spent comparing, in seconds.",
+            [('', {}, float(counters['comparison_seconds']))])
+    _family(lines, 'recon_comparison_rows_per_second', 'gauge', "Rows compared per second by the last comparison.",
+            [('', {}, float(gauges['comparison_rows_per_second']))])
+
+    queue = queue_status()
+    _family(lines, 'recon_admission_running', 'gauge', "Comparisons holding an admission slot (all workers).",
+            [('', {}, queue['running'])])
+    _family(lines, 'recon_admission_queued', 'gauge', "Comparisons waiting for an admission slot (all workers).",
+            [('', {}, queue['queued'])])
+    _family(lines, 'recon_admission_reserved_bytes', 'gauge', "Estimated memory reserved by admitted comparisons.",
+            [('', {}, int(queue['running_mb'] * 1024 * 1024))])
+
+    # ── Cache ──
+    stats = cache_stats()
+    categories = stats['categories']
+    disk = disk_usage()
+    _family(lines, 'recon_cache_hits_total', 'counter', "In-memory DataFrame cache hits.",
+            [('', dict(category=c), v['hits']) for c, v in sorted(categories.items())])
+    _family(lines, 'recon_cache_misses_total', 'counter', "In-memory DataFrame cache misses.",
+            [('', dict(category=c), v['misses']) for c, v in sorted(categories.items())])
+    _family(lines, 'recon_cache_evictions_total', 'counter', "In-memory DataFrame cache evictions.",
+            [('', {}, stats['evictions'])])
+    _family(lines, 'recon_cache_memory_entries', 'gauge', "DataFrames held in the in-memory cache.",
+            [('', dict(category=c), v['entries']) for c, v in sorted(categories.items())])
+    _family(lines, 'recon_cache_memory_bytes', 'gauge', "Bytes held in the in-memory cache.",
+            [('', dict(category=c), v['bytes']) for c, v in sorted(categories.items())])
+    _family(lines, 'recon_cache_memory_budget_bytes', 'gauge', "In-memory cache budget.",
+            [('', {}, stats['budget_bytes'])])
+    _family(lines, 'recon_cache_disk_entries', 'gauge', "Cache entries on disk.",
+            [('', dict(category=c), v['entries']) for c, v in sorted(disk.items())])
+    _family(lines, 'recon_cache_disk_bytes', 'gauge', "Bytes on disk used by cache entries (with sidecars).",
+            [('', dict(category=c), v['bytes']) for c, v in sorted(disk.items())])
+
+    # ── Process ──
+    rss, cpu = _process_stats()
+    if rss is not None:
+        _family(lines, 'process_resident_memory_bytes', 'gauge', "Resident memory size in bytes.",
+                [('', {}, rss)])
+    if cpu is not None:
+        _family(lines, 'process_cpu_seconds_total', 'counter', "Total user and system CPU time in seconds.",
+                [('', {}, float(cpu))])
+
+    return '\n'.join(lines) + '\n'
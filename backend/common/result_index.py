@@ -0,0 +1,253 @@
+"""
+Result Index Builder.
+Precomputes compact row-position indexes for a stored comparison result so
+/api/results_page can filter, sort and look up keys without scanning it:
+  - rows per status           ('Mismatch', 'Only in SQL', 'Only in File')
+  - rows per mismatched column (from the stored mismatch bitmask)
+  - rows sorted by key value   (binary-searchable composite key)
+Stored as <result_id>.index.npz next to the result Parquet.
+
+Results are stored in the compact layout (common/result_layout.py); the
+indexes hold stacked display-row positions, and load_result_rows() expands
+just the stored rows behind the positions asked for.  Results written before
+the compact layout (stacked rows, no 'starts' array) are read as they are.
+"""
+
+import os
+import json
+import uuid
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from collections import OrderedDict
+
+from common.storage_manager import (RESULTS_DIR, RESULTS_ROW_GROUP_SIZE, write_tables, load_df_take,
+                                    coerce_for_parquet)
+from common.result_layout import (MASK_COL, RESULT_COMPRESSION, decode_mask, expand, locate,
+                                  row_counts, stacked_starts)
+
+# Separator used to build composite key strings ("K1|K2")
+KEY_SEP = '|'
+
+# Recently used indexes stay loaded (they are small: int32 positions)
+_INDEX_CACHE_SIZE = 16
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def _index_path(result_id):
+    return os.path.join(RESULTS_DIR, f"{result_id}.index.npz")
+
+
+def composite_keys(df, key_cols):
+    """One string per row: key column values joined with KEY_SEP."""
+    cols = [c for c in key_cols if c in df.columns]
+    if not cols:
+        return pd.Series([''] * len(df), index=df.index, dtype=object)
+    keys = df[cols[0]].astype(str)
+    for c in cols[1:]:
+        keys = keys + KEY_SEP + df[c].astype(str)
+    return keys
+
+
+def _group_positions(values):
+    """{value: int32 row positions} for a 1-D array (positions ascending)."""
+    if len(values) == 0:
+        return {}
+    groups = pd.Series(np.arange(len(values))).groupby(np.asarray(values)).indices
+    return {str(k): np.asarray(v, dtype=np.int32) for k, v in groups.items()}
+
+
+def build_result_index(result_df, key_cols, common_cols):
+    """
+    Build indexes for a compact result frame (common/result_layout.py).
+    Positions are those of the stacked display rows, so a Mismatch appears
+    twice (its SQL and File rows) in every index it belongs to.
+    Returns (arrays, meta).  meta carries the per-column mismatch counts.
+    """
+    df = result_df.reset_index(drop=True)
+    status = df['status'].astype(str).to_numpy(dtype=object) if len(df) else np.empty(0, dtype=object)
+    starts = stacked_starts(status)
+    # Stored row of every stacked row
+    rows = np.repeat(np.arange(len(df)), row_counts(status))
+    n = len(rows)
+
+    # ── Status ──
+    by_status = _group_positions(status[rows])
+
+    # ── Mismatched columns ──
+    by_column, mismatch_counts = {}, {}
+    bits = decode_mask(df[MASK_COL], len(common_cols)) if len(df) else None
+    for j, col in enumerate(common_cols):
+        if bits is not None and bits[:, j].any():
+            by_column[col] = np.flatnonzero(bits[rows, j]).astype(np.int32)
+            mismatch_counts[col] = int(bits[:, j].sum())
+
+    # ── Key (sorted for binary search) ──
+    keys = composite_keys(df, key_cols).to_numpy(dtype=str)[rows]
+    key_order = np.argsort(keys, kind='stable').astype(np.int32)
+
+    arrays = {'key_sorted': keys[key_order], 'key_order': key_order, 'starts': starts}
+    statuses = sorted(by_status)
+    columns = sorted(by_column)
+    for i, name in enumerate(statuses):
+        arrays[f'status_{i}'] = by_status[name]
+    for i, name in enumerate(columns):
+        arrays[f'col_{i}'] = by_column[name]
+
+    meta = {
+        "num_rows": n,
+        "layout": "compact",
+        "key_cols": list(key_cols),
+        "common_cols": list(common_cols),
+        "statuses": statuses,
+        "columns": columns,
+        "column_mismatch_counts": {c: mismatch_counts[c] for c in columns},
+    }
+    return arrays, meta
+
+
+def save_result_index(result_id, result_df, key_cols, common_cols, labels=('SQL', 'File')):
+    """Build and persist the index for a stored result.  Returns meta."""
+    arrays, meta = build_result_index(result_df, key_cols, common_cols)
+    meta['left_label'], meta['right_label'] = labels
+    path = _index_path(result_id)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(tmp, path)
+    return meta
+
+
+def _row_groups(table):
+    """Slices of *table* of RESULTS_ROW_GROUP_SIZE rows (at least one)."""
+    yield table.slice(0, RESULTS_ROW_GROUP_SIZE)
+    for start in range(RESULTS_ROW_GROUP_SIZE, table.num_rows, RESULTS_ROW_GROUP_SIZE):
+        yield table.slice(start, RESULTS_ROW_GROUP_SIZE)
+
+
+def store_result(result_df, summary, source=None):
+    """
+    Persist a compact comparison result (Parquet + index) under a new
+    result_id.  The source labels come from summary['source_labels'].
+    Adds the per-column mismatch counts to *summary*.  Returns result_id.
+    """
+    result_id = str(uuid.uuid4())
+    key_cols, common_cols = summary['key_cols'], summary['common_cols']
+    # Key columns keep their values; mixed-type keys become strings as before
+    df = result_df.reset_index(drop=True).copy(deep=False)
+    df[key_cols] = coerce_for_parquet(df[key_cols])
+    write_tables('results', result_id, _row_groups(pa.Table.from_pandas(df, preserve_index=False)),
+                 compression=RESULT_COMPRESSION, source=source)
+    meta = save_result_index(result_id, df, key_cols, common_cols,
+                             summary.get('source_labels', ['SQL', 'File']))
+    summary['column_mismatch_counts'] = meta['column_mismatch_counts']
+    return result_id
+
+
+def load_result_index(result_id):
+    """Load (and memoise) a result index.  Returns None if missing."""
+    with _index_lock:
+        if result_id in _index_cache:
+            _index_cache.move_to_end(result_id)
+            return _index_cache[result_id]
+
+    path = _index_path(result_id)
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as z:
+        meta = json.loads(str(z['meta']))
+        index = {
+            "meta": meta,
+            "key_sorted": z['key_sorted'],
+            "key_order": z['key_order'],
+            "status": {name: z[f'status_{i}'] for i, name in enumerate(meta['statuses'])},
+            "column": {name: z[f'col_{i}'] for i, name in enumerate(meta['columns'])},
+            # Stacked position of every stored row (compact results only)
+            "starts": z['starts'] if 'starts' in z.files else None,
+        }
+
+    with _index_lock:
+        _index_cache[result_id] = index
+        while len(_index_cache) > _INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def select_rows(index, status=None, column=None, key=None, sort=None, descending=False):
+    """
+    Resolve a filtered/sorted view to row positions using only the index.
+    status : one status label        column : rows where that column mismatched
+    key    : exact composite key      sort   : None (stored order), 'key' or 'status'
+    Returns an int64 array of positions.  Paired SQL/File rows stay adjacent.
+    """
+    selected = None
+
+    def _narrow(current, rows):
+        return rows if current is None else np.intersect1d(current, rows, assume_unique=True)
+
+    if status:
+        selected = _narrow(selected, index['status'].get(status, np.empty(0, np.int32)))
+    if column:
+        selected = _narrow(selected, index['column'].get(column, np.empty(0, np.int32)))
+    if key is not None and key != '':
+        ks = index['key_sorted']
+        lo = np.searchsorted(ks, key, side='left')
+        hi = np.searchsorted(ks, key, side='right')
+        selected = _narrow(selected, np.sort(index['key_order'][lo:hi]))
+
+    if sort == 'key':
+        keep = slice(None) if selected is None else np.isin(index['key_order'], selected)
+        order = index['key_order'][keep]
+        if descending:
+            # Reverse the key groups but keep SQL/File order within each key
+            _, group = np.unique(index['key_sorted'][keep], return_inverse=True)
+            order = order[np.lexsort((np.arange(len(order)), -group))]
+        return order.astype(np.int64)
+
+    if sort == 'status':
+        names = sorted(index['status'], reverse=descending)
+        parts = [index['status'][n] for n in names]
+        order = np.concatenate(parts) if parts else np.empty(0, np.int32)
+        if selected is not None:
+            order = order[np.isin(order, selected)]
+        return order.astype(np.int64)
+
+    if selected is None:
+        return np.arange(index['meta']['num_rows'], dtype=np.int64)
+    return np.asarray(selected, dtype=np.int64)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Reading stacked rows
+# ═══════════════════════════════════════════════════════════════════════════
+
+def is_compact(index):
+    return index is not None and index['starts'] is not None
+
+
+def expand_rows(compact_df, index):
+    """Stacked display rows of stored compact rows (labels from the index)."""
+    meta = index['meta']
+    return expand(compact_df, meta['key_cols'], meta['common_cols'],
+                  meta.get('left_label', 'SQL'), meta.get('right_label', 'File'))
+
+
+def load_result_rows(result_id, positions, index=None):
+    """
+    Stacked display rows at *positions* (in the given order) of a stored result.
+    Only the stored rows behind them are read and expanded.
+    Returns None if the result no longer exists.
+    """
+    if index is None:
+        index = load_result_index(result_id)
+    if not is_compact(index):
+        return load_df_take('results', result_id, positions)
+
+    rows, side = locate(index['starts'], positions)
+    stored, inverse = np.unique(rows, return_inverse=True)
+    compact = load_df_take('results', result_id, stored)
+    if compact is None:
+        return None
+    first = np.concatenate([[0], np.cumsum(row_counts(compact['status']))])[:-1]
+    return expand_rows(compact, index).take(first[np.ravel(inverse)] + side).reset_index(drop=True)
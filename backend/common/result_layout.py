@@ -0,0 +1,137 @@
+"""
+Compact Result Layout.
+Comparison results are stored one row per discrepancy, side by side:
+  - key columns, 'status'
+  - '_mismatch_mask' : bitmask over common_cols of the columns that mismatched
+                       (bytes, numpy packbits order)
+  - <col>            : display value of the left side (the right side for
+                       'Only in File' rows)
+  - _file.<col>      : right-side display value of a Mismatch row, only where
+                       it differs from the left one (null = same)
+The stacked display rows (one per side: key, values, source, status,
+_mismatch_cols) are expanded on demand -- for a page, an export batch or a
+response preview -- instead of being stored.
+
+Row positions seen by clients (paging, the result index) are positions in
+the stacked form: 2 per Mismatch, 1 per Only in SQL / Only in File.
+"""
+
+import numpy as np
+import pandas as pd
+
+MASK_COL = '_mismatch_mask'
+FILE_PREFIX = '_file.'
+RESULT_COMPRESSION = 'zstd'
+
+
+def display_columns(key_cols, common_cols):
+    """Columns of the stacked display rows."""
+    return list(key_cols) + list(common_cols) + ['source', 'status', '_mismatch_cols']
+
+
+def row_counts(status):
+    """Stacked rows per stored row (2 for a Mismatch, else 1)."""
+    return np.where(np.asarray(status, dtype=object) == 'Mismatch', 2, 1).astype(np.int64)
+
+
+def stacked_starts(status):
+    """First stacked position of every stored row, plus the total at the end."""
+    return np.concatenate([[0], np.cumsum(row_counts(status))]).astype(np.int64)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Mismatch bitmask
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _mask_width(n_cols):
+    return max(1, -(-n_cols // 8))
+
+
+def encode_mask(bits):
+    """(rows x columns) bool matrix -> Series of fixed-width bytes."""
+    bits = np.asarray(bits, dtype=bool)
+    width = _mask_width(bits.shape[1])
+    packed = np.zeros((len(bits), width), dtype=np.uint8)
+    if bits.shape[1]:
+        packed[:, :-(-bits.shape[1] // 8)] = np.packbits(bits, axis=1)
+    return pd.Series(list(map(bytes, packed)), dtype=object, name=MASK_COL)
+
+
+def decode_mask(masks, n_cols):
+    """Binary mask Series -> (rows x n_cols) bool matrix."""
+    width = _mask_width(n_cols)
+    if len(masks) == 0:
+        return np.zeros((0, n_cols), dtype=bool)
+    raw = np.frombuffer(b''.join(masks.to_numpy(dtype=object)), dtype=np.uint8).reshape(len(masks), width)
+    return np.unpackbits(raw, axis=1)[:, :n_cols].astype(bool)
+
+
+def mismatch_strings(bits, common_cols):
+    """'_mismatch_cols' text per row: mismatched column names joined by ','."""
+    if len(bits) == 0:
+        return np.empty(0, dtype=object)
+    unique, inverse = np.unique(np.packbits(bits, axis=1), axis=0, return_inverse=True)
+    names = np.asarray(common_cols, dtype=object)
+    labels = [','.join(names[np.unpackbits(u)[:len(common_cols)].astype(bool)]) for u in unique]
+    return np.asarray(labels, dtype=object)[np.ravel(inverse)]
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Expansion
+# ═══════════════════════════════════════════════════════════════════════════
+
+def expand(compact, key_cols, common_cols, left_label='SQL', right_label='File'):
+    """Stacked display rows of a compact result frame (stored order)."""
+    columns = display_columns(key_cols, common_cols)
+    if len(compact) == 0:
+        return pd.DataFrame(columns=columns)
+
+    compact = compact.reset_index(drop=True)
+    status = compact['status'].to_numpy(dtype=object)
+    counts = row_counts(status)
+    rows = np.repeat(np.arange(len(compact)), counts)
+    # Second row of a Mismatch pair = the right side
+    right = np.zeros(len(rows), dtype=bool)
+    right[np.cumsum(counts)[counts == 2] - 1] = True
+    stacked_status = status[rows]
+
+    out = {}
+    for k in key_cols:
+        out[k] = compact[k].take(rows).reset_index(drop=True)
+    for col in common_cols:
+        left = compact[col].take(rows).reset_index(drop=True)
+        file_col = FILE_PREFIX + col
+        if file_col in compact.columns:
+            other = compact[file_col].take(rows).reset_index(drop=True)
+            use_other = right & other.notna().to_numpy()
+            if use_other.any():
+                left = left.astype(object)
+                left[use_other] = other[use_other].to_numpy(dtype=object)
+        out[col] = left
+    out['source'] = np.where(right | (stacked_status == 'Only in File'), right_label, left_label)
+    out['status'] = stacked_status
+    text = np.full(len(compact), '', dtype=object)
+    mm = status == 'Mismatch'
+    if mm.any():
+        text[mm] = mismatch_strings(decode_mask(compact[MASK_COL][mm], len(common_cols)), common_cols)
+    out['_mismatch_cols'] = text[rows]
+    return pd.DataFrame(out)[columns]
+
+
+def expand_result(result_df, summary):
+    """expand() with the column lists and source labels of a comparison summary."""
+    left, right = summary.get('source_labels', ['SQL', 'File'])
+    return expand(result_df, summary['key_cols'], summary['common_cols'], left, right)
+
+
+def preview(result_df, summary, n=50):
+    """(first *n* stacked rows, display columns) for a comparison response."""
+    head = expand_result(result_df.head(n), summary).head(n)
+    return head, display_columns(summary['key_cols'], summary['common_cols'])
+
+
+def locate(starts, positions):
+    """Stored row and side (0 = first, 1 = second row of a pair) of stacked *positions*."""
+    positions = np.asarray(positions, dtype=np.int64)
+    rows = np.searchsorted(starts, positions, side='right') - 1
+    return rows, positions - starts[rows]
@@ -0,0 +1,211 @@
+"""
+Result Routes — shared by every comparison module.
+Paging, filtering and exporting of a stored comparison result by result_id.
+All modules persist results with result_index.store_result(), so the same
+endpoints serve SQL-to-File, SQL-to-SQL and File-to-File results.
+"""
+
+from flask import Blueprint, Response, request, send_file, stream_with_context
+import os
+import io
+import uuid
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from common.json_utils import safe_jsonify
+from common.storage_manager import (load_df_rows, iter_row_groups, cache_file_path, sidecar_path,
+                                    coerce_for_parquet)
+from common.result_index import load_result_index, select_rows, load_result_rows, is_compact, expand_rows
+from common.wire_format import parse_format, table_response
+from common.excel_export import (export_path, write_workbook, start_export, wait_for_export,
+                                 get_export_status, result_row_count, BACKGROUND_EXPORT_ROWS)
+
+results_bp = Blueprint('results', __name__)
+
+
+@results_bp.route('/api/results_page', methods=['GET'])
+def get_results_page():
+    """
+    Pagination for the Data Grid.
+    Query Params: result_id, page (1-based), size (default 100)
+    Optional filters (answered from the precomputed result index):
+      status  : 'Mismatch' | 'Only in SQL' | 'Only in File'
+      column  : only rows where this column mismatched
+      key     : exact key value (composite keys joined with '|')
+      sort    : 'key' | 'status'      order : 'asc' (default) | 'desc'
+    format : 'records' (default) | 'columns' | 'arrow'  (gzip/deflate via Accept-Encoding)
+    """
+    result_id = request.args.get('result_id')
+    page = int(request.args.get('page', 1))
+    size = int(request.args.get('size', 100))
+    status = request.args.get('status')
+    column = request.args.get('column')
+    key = request.args.get('key')
+    sort = request.args.get('sort')
+    descending = request.args.get('order', 'asc').lower() == 'desc'
+    fmt = parse_format(request.args.get('format'))
+    if fmt is None:
+        return safe_jsonify({"error": "Invalid format. Use records, columns or arrow."}, 400)
+
+    # Calculate slice
+    start = (page - 1) * size
+    end = start + size
+
+    index = load_result_index(result_id)
+    if status or column or key or sort:
+        if index is None:
+            return safe_jsonify({"error": "Result cache expired. Run comparison again."}, 404)
+        positions = select_rows(index, status=status, column=column, key=key,
+                                sort=sort, descending=descending)
+        total = len(positions)
+        sliced_df = load_result_rows(result_id, positions[start:end], index)
+    elif is_compact(index):
+        total = index['meta']['num_rows']
+        sliced_df = load_result_rows(result_id, np.arange(min(start, total), min(end, total)), index)
+    else:
+        # Reads only the row groups covering [start, end)
+        sliced_df, total = load_df_rows('results', result_id, start, end)
+    if sliced_df is None:
+        return safe_jsonify({"error": "Result cache expired. Run comparison again."}, 404)
+
+    if start >= total:
+        return table_response(sliced_df.head(0), fmt, {
+            "page": page, "has_more": False, "total_rows": total
+        }, rows_key='data')
+
+    return table_response(sliced_df, fmt, {
+        "page": page,
+        "total_pages": (total // size) + 1,
+        "total_rows": total,
+        "has_more": end < total
+    }, rows_key='data')
+
+
+@results_bp.route('/api/export_excel', methods=['GET'])
+def export_excel():
+    """
+    Download the styled Excel file with color-coded reconciliation results.
+    The workbook is streamed to disk once and cached per result_id.
+    Results above BACKGROUND_EXPORT_ROWS are generated in a background job:
+    by default the request waits for it; with async=1 it returns 202 + status
+    immediately (poll /api/export_excel/status, then call again to download).
+    """
+    result_id = request.args.get('result_id')
+    if not result_id:
+        return safe_jsonify({"error": "Missing result_id"}, 400)
+
+    path = export_path(result_id)
+    if not os.path.exists(path):
+        n_rows = result_row_count(result_id)
+        if n_rows is None:
+            return safe_jsonify({"error": "Result cache expired. Run comparison again."}, 404)
+
+        if n_rows <= BACKGROUND_EXPORT_ROWS:
+            write_workbook(result_id, path)
+        else:
+            start_export(result_id)
+            if request.args.get('async') == '1':
+                return safe_jsonify(get_export_status(result_id), 202)
+            status = wait_for_export(result_id)
+            if status['status'] != 'done':
+                return safe_jsonify({"status": "error", "message": status.get('message', 'Export failed')}, 500)
+
+    return send_file(
+        path,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        as_attachment=True,
+        download_name=f'reconciliation_{result_id[:8]}.xlsx'
+    )
+
+
+@results_bp.route('/api/export_excel/status', methods=['GET'])
+def export_excel_status():
+    """Progress of a background Excel export: none | running | done | error."""
+    result_id = request.args.get('result_id')
+    if not result_id:
+        return safe_jsonify({"error": "Missing result_id"}, 400)
+    status = get_export_status(result_id)
+    status.pop('path', None)
+    return safe_jsonify(status)
+
+
+def _iter_stacked_tables(result_id):
+    """The result as stacked display rows, one stored row group at a time."""
+    index = load_result_index(result_id)
+    for table in iter_row_groups('results', result_id):
+        if is_compact(index):
+            stacked = coerce_for_parquet(expand_rows(table.to_pandas(), index))
+            table = pa.Table.from_pandas(stacked, preserve_index=False)
+        yield table
+
+
+@results_bp.route('/api/export_csv', methods=['GET'])
+def export_csv():
+    """
+    Stream the result as CSV (stacked SQL/File rows), one Parquet row group
+    at a time.  The server never holds more than one row group in memory.
+    """
+    result_id = request.args.get('result_id')
+    if not result_id:
+        return safe_jsonify({"error": "Missing result_id"}, 400)
+    if cache_file_path('results', result_id) is None:
+        return safe_jsonify({"error": "Result cache expired. Run comparison again."}, 404)
+
+    def generate():
+        first = True
+        for table in _iter_stacked_tables(result_id):
+            buf = io.BytesIO()
+            pa_csv.write_csv(table, buf, pa_csv.WriteOptions(include_header=first))
+            first = False
+            yield buf.getvalue()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={"Content-Disposition": f"attachment; filename=reconciliation_{result_id[:8]}.csv"}
+    )
+
+
+@results_bp.route('/api/export_parquet', methods=['GET'])
+def export_parquet():
+    """
+    Send the result as Parquet (stacked SQL/File rows).  Compact results are
+    expanded into a temporary file, row group by row group, which is removed
+    once the response is closed; older stacked results are sent as-is.
+    """
+    result_id = request.args.get('result_id')
+    if not result_id:
+        return safe_jsonify({"error": "Missing result_id"}, 400)
+    path = cache_file_path('results', result_id)
+    if path is None:
+        return safe_jsonify({"error": "Result cache expired. Run comparison again."}, 404)
+
+    tmp = None
+    if is_compact(load_result_index(result_id)):
+        # Sidecar name: swept with the result should the response never close
+        tmp = sidecar_path('results', result_id, f"export.{uuid.uuid4().hex[:8]}.tmp")
+        writer = None
+        try:
+            for table in _iter_stacked_tables(result_id):
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+        path = tmp
+
+    response = send_file(
+        path,
+        mimetype='application/vnd.apache.parquet',
+        as_attachment=True,
+        download_name=f'reconciliation_{result_id[:8]}.parquet'
+    )
+    if tmp is not None:
+        # A passthrough file body is handed to the server as is and the
+        # response's close callbacks would never run
+        response.direct_passthrough = False
+        response.call_on_close(lambda: os.path.exists(tmp) and os.remove(tmp))
+    return response
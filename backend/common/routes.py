@@ -1,57 +1,106 @@
 """
 Common API Routes — shared across all modules.
 Handles: environment config, DB connection testing, credential validation,
-         idle timeout tracking, safe disconnect.
+         idle timeout tracking, safe disconnect, service metrics,
+         comparison queue status.
 """
 
-from flask import Blueprint, request
+from flask import Blueprint, Response, request, g
 import pyodbc
 import time
-import threading
+import uuid
 
 from common.json_utils import safe_jsonify
 from common.db_utils import CONFIG, get_connection_string, validate_credentials
+from common.storage_manager import cache_stats
+from common.session_store import STORE
+from common.admission import queue_status
+from common import metrics
 
 common_bp = Blueprint('common', __name__)
 
-# ── Idle-timeout tracking ──
-# Tracks the last activity timestamp.  A background thread checks every 60s;
-# if idle_timeout_minutes have elapsed since last_activity, it marks
-# the session as timed-out so the frontend can react.
-_session_state = {
-    'connected': False,
-    'last_activity': time.time(),
-    'server': None,
-    'database': None,
-    'port': None,
-    'timed_out': False,
-}
-_state_lock = threading.Lock()
+# ── Per-session state ──
+# Each browser gets a session cookie; its connection + last-activity state
+# lives in the shared session store so every worker process sees it.
+# Idle timeout is evaluated lazily on read: if idle_timeout_minutes have
+# elapsed since last_activity, the session is marked timed-out.
+SESSION_COOKIE = 'recon_session'
+
+
+def _session_id():
+    """Session id from the cookie, or a new one (cookie set after the request)."""
+    if 'session_id' not in g:
+        sid = request.cookies.get(SESSION_COOKIE)
+        if not sid:
+            sid = str(uuid.uuid4())
+            g.new_session = True
+        g.session_id = sid
+    return g.session_id
+
+
+@common_bp.after_app_request
+def _set_session_cookie(response):
+    if g.get('new_session'):
+        response.set_cookie(SESSION_COOKIE, g.session_id, httponly=True, samesite='Lax')
+    return response
+
+
+# ── Request metrics (common/metrics.py) ──
+# App-wide hooks: every blueprint and the UI routes are timed.  Endpoints are
+# labelled by their URL rule, so the label set stays bounded.
+
+def _metrics_endpoint():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+@common_bp.before_app_request
+def _metrics_start():
+    g.metrics_started = metrics.request_started(_metrics_endpoint())
+
+
+@common_bp.after_app_request
+def _metrics_finish(response):
+    if 'metrics_started' in g:
+        metrics.request_finished(_metrics_endpoint(), request.method, response.status_code, g.metrics_started)
+        g.metrics_recorded = True
+    return response
+
+
+@common_bp.teardown_app_request
+def _metrics_close(exc):
+    if 'metrics_started' not in g:
+        return
+    if not g.get('metrics_recorded'):
+        # Unhandled exception: no response went through after_request
+        metrics.request_finished(_metrics_endpoint(), request.method, 500, g.metrics_started)
+    metrics.request_closed(_metrics_endpoint())
+
+
+def _apply_idle_timeout(state):
+    """Mark a connected session timed-out once it has been idle too long."""
+    if state['connected']:
+        timeout_min = CONFIG.get('idle_timeout_minutes', 10)
+        if time.time() - state['last_activity'] > timeout_min * 60:
+            state['timed_out'] = True
+            state['connected'] = False
 
 
 def _touch_activity():
     """Update the last-activity timestamp (called on every API hit)."""
-    with _state_lock:
-        _session_state['last_activity'] = time.time()
-        _session_state['timed_out'] = False
+    def touch(state):
+        _apply_idle_timeout(state)
+        state['last_activity'] = time.time()
+        state['timed_out'] = False
+    STORE.modify(_session_id(), touch)
 
 
-def _idle_checker():
-    """Background daemon that checks for idle timeout."""
-    while True:
-        time.sleep(30)  # check every 30s
-        with _state_lock:
-            if not _session_state['connected']:
-                continue
-            timeout_min = CONFIG.get('idle_timeout_minutes', 10)
-            elapsed = time.time() - _session_state['last_activity']
-            if elapsed > timeout_min * 60:
-                _session_state['timed_out'] = True
-                _session_state['connected'] = False
-
-# Start the idle-checker daemon thread
-_idle_thread = threading.Thread(target=_idle_checker, daemon=True)
-_idle_thread.start()
+def _session_state():
+    """Current session state, applying the idle timeout."""
+    sid = _session_id()
+    state = STORE.get(sid)
+    if state['connected']:
+        state = STORE.modify(sid, _apply_idle_timeout)
+    return state
 
 
 @common_bp.route('/api/config', methods=['GET'])
@@ -111,13 +160,8 @@ def test_connection():
         conn.close()
 
         # Mark session connected
-        with _state_lock:
-            _session_state['connected'] = True
-            _session_state['server'] = server
-            _session_state['database'] = database
-            _session_state['port'] = port
-            _session_state['last_activity'] = time.time()
-            _session_state['timed_out'] = False
+        STORE.update(_session_id(), connected=True, server=server, database=database,
+                     port=port, last_activity=time.time(), timed_out=False)
 
         # Info message
         auth_msg = "Windows Auth"
@@ -176,12 +220,8 @@ def disconnect():
     Explicitly disconnect / reset the session.
     Called on manual disconnect or browser beforeunload.
     """
-    with _state_lock:
-        _session_state['connected'] = False
-        _session_state['server'] = None
-        _session_state['database'] = None
-        _session_state['port'] = None
-        _session_state['timed_out'] = False
+    STORE.update(_session_id(), connected=False, server=None, database=None,
+                 port=None, timed_out=False)
     return safe_jsonify({"status": "disconnected"})
 
 
@@ -191,9 +231,9 @@ def heartbeat():
     Frontend polls this to detect idle-timeout.
     Also refreshes the activity timer (so active users never time out).
     """
-    with _state_lock:
-        timed_out = _session_state['timed_out']
-        connected = _session_state['connected']
+    state = _session_state()
+    timed_out = state['timed_out']
+    connected = state['connected']
     if not timed_out:
         _touch_activity()
     return safe_jsonify({
@@ -207,3 +247,25 @@ def touch_activity():
     """Called by the frontend on meaningful user actions to reset idle timer."""
     _touch_activity()
     return safe_jsonify({"status": "ok"})
+
+
+@common_bp.route('/api/cache_stats', methods=['GET'])
+def get_cache_stats():
+    """In-memory DataFrame cache counters (hits, misses, evictions, bytes)."""
+    return safe_jsonify(cache_stats())
+
+
+@common_bp.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Latency, throughput, cache and process metrics in Prometheus text format."""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@common_bp.route('/api/comparison_queue', methods=['GET'])
+def get_comparison_queue():
+    """
+    Comparison admission queue: running jobs, their reserved memory and the
+    queue length.  With ?ticket=<ticket sent to run_comparison>: that job's
+    status (queued + position | running | none).
+    """
+    return safe_jsonify(queue_status(request.args.get('ticket')))
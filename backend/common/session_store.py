@@ -0,0 +1,110 @@
+"""
+Shared Session Store.
+Per-user connection + activity state, shared by every worker process so the
+app can run under a multi-worker WSGI server.
+
+Backends (db_config.json "session_store"):
+  - sqlite : default; one SQLite file in temp_cache, safe across processes
+  - memory : single-process dict (development server only)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import closing
+
+from common.db_utils import CONFIG
+from common.storage_manager import CACHE_DIR
+
+# Fresh state for a session that has never connected
+DEFAULT_STATE = {
+    'connected': False,
+    'last_activity': 0.0,
+    'server': None,
+    'database': None,
+    'port': None,
+    'timed_out': False,
+}
+
+# Sessions idle this long are dropped from the store entirely
+SESSION_RETENTION_SECONDS = 24 * 3600
+
+
+class MemorySessionStore:
+    """Process-local store (development server only)."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            return dict(DEFAULT_STATE, **self._data.get(sid, {}))
+
+    def modify(self, sid, fn):
+        with self._lock:
+            state = self._data.setdefault(sid, dict(DEFAULT_STATE))
+            fn(state)
+            return dict(state)
+
+    def update(self, sid, **fields):
+        return self.modify(sid, lambda state: state.update(fields))
+
+
+class SQLiteSessionStore:
+    """SQLite-backed store shared by all worker processes on this host."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " sid TEXT PRIMARY KEY, state TEXT NOT NULL, updated REAL NOT NULL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def get(self, sid):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT state FROM sessions WHERE sid = ?", (sid,)).fetchone()
+        return dict(DEFAULT_STATE, **(json.loads(row[0]) if row else {}))
+
+    def modify(self, sid, fn):
+        """Apply fn(state) as a read-modify-write under an IMMEDIATE lock
+        (atomic across processes).  Returns the new state."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT state FROM sessions WHERE sid = ?", (sid,)).fetchone()
+            state = dict(DEFAULT_STATE, **(json.loads(row[0]) if row else {}))
+            fn(state)
+            conn.execute("INSERT OR REPLACE INTO sessions (sid, state, updated) VALUES (?, ?, ?)",
+                         (sid, json.dumps(state), now))
+            conn.execute("DELETE FROM sessions WHERE updated < ?", (now - SESSION_RETENTION_SECONDS,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return state
+
+    def update(self, sid, **fields):
+        return self.modify(sid, lambda state: state.update(fields))
+
+
+def create_store():
+    """Build the store selected in db_config.json."""
+    kind = CONFIG.get('session_store', 'sqlite').lower()
+    if kind == 'memory':
+        return MemorySessionStore()
+    return SQLiteSessionStore(os.path.join(CACHE_DIR, 'sessions.sqlite'))
+
+
+# Loaded once at import time — available as common.session_store.STORE
+STORE = create_store()
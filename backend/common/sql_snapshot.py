@@ -0,0 +1,121 @@
+"""
+SQL Result Snapshots.
+The SQL side of a comparison (and of a preview) is kept in the Parquet cache
+(category 'snapshots'), so a rerun that only changes keys, mapping or mode
+does not send the same query back to the server.
+
+A snapshot is keyed by server, database, port and the normalised query text
+(whitespace outside literals collapsed, trailing ';' dropped).  It is reused
+while younger than the max age (sql_snapshot_max_age_minutes in
+db_config.json, overridable per request; 0 = always fetch).  Preview
+snapshots hold every column, so a projected comparison query can also be
+answered from the snapshot of its base query.  refresh=True always fetches
+from the database and replaces the snapshot.  Snapshots are swept by the
+cache janitor like other entries (snapshots_ttl_hours, disk quota).
+"""
+
+import os
+import re
+import time
+import hashlib
+import datetime as _dt
+
+from common.db_utils import CONFIG, fetch_sql_df, project_query, strip_query
+from common.storage_manager import save_df, load_df, sample_shape, cache_file_path
+
+DEFAULT_MAX_AGE_MINUTES = float(CONFIG.get('sql_snapshot_max_age_minutes', 60))
+
+# Quoted literals / identifiers (kept verbatim) or a run of whitespace
+_TOKEN_RE = re.compile(r"('(?:[^']|'')*'|\"[^\"]*\"|\[[^\]]*\])|\s+")
+
+
+def normalize_query(query):
+    """Query text with whitespace outside literals collapsed to one space."""
+    return _TOKEN_RE.sub(lambda m: m.group(1) or ' ', strip_query(query))
+
+
+def snapshot_id(server, database, port, query):
+    """Cache id of the snapshot of *query* on server/database/port."""
+    key = '\x1f'.join([str(server).lower(), str(database).lower(), str(port or ''), normalize_query(query)])
+    return 'sql-' + hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def _max_age_seconds(max_age_minutes):
+    if max_age_minutes is None:
+        max_age_minutes = DEFAULT_MAX_AGE_MINUTES
+    return float(max_age_minutes) * 60
+
+
+def _info(sid, source, created):
+    return {
+        "source": source,
+        "snapshot_id": sid,
+        "created_at": _dt.datetime.fromtimestamp(created).isoformat(timespec='seconds'),
+        "age_seconds": round(max(0.0, time.time() - created), 1),
+    }
+
+
+def request_options(data):
+    """(refresh, max_age_minutes) from a request body ("refresh",
+    "snapshot_max_age_minutes").  Raises ValueError on a bad max age."""
+    max_age = data.get('snapshot_max_age_minutes')
+    if max_age is not None:
+        try:
+            max_age = float(max_age)
+        except (TypeError, ValueError):
+            raise ValueError("snapshot_max_age_minutes must be a number of minutes.")
+        if max_age < 0:
+            raise ValueError("snapshot_max_age_minutes must be a number of minutes.")
+    return bool(data.get('refresh')), max_age
+
+
+def find_snapshot(server, database, query, port=None, columns=None, max_age_minutes=None):
+    """
+    Freshest usable snapshot for *query* projected on *columns*: the projected
+    query's own, else the full base query's.  Returns
+    {"snapshot_id", "rows", "projected": bool, "created"} or None.
+    """
+    max_age = _max_age_seconds(max_age_minutes)
+    if max_age <= 0:
+        return None
+    projected = project_query(query, columns)
+    candidates = [(projected, False)] if projected == query else [(projected, False), (query, True)]
+    for text, needs_projection in candidates:
+        sid = snapshot_id(server, database, port, text)
+        path = cache_file_path('snapshots', sid)
+        if path is None:
+            continue
+        try:
+            created = os.path.getmtime(path)
+        except OSError:
+            continue
+        if time.time() - created > max_age:
+            continue
+        return {"snapshot_id": sid, "rows": sample_shape('snapshots', sid, rows=1)[0],
+                "projected": needs_projection, "created": created}
+    return None
+
+
+def fetch_sql_snapshot(server, database, query, port=None, columns=None, refresh=False,
+                       max_age_minutes=None, timeout=0, chunksize=None):
+    """
+    fetch_sql_df() of project_query(query, columns), answered from a fresh
+    snapshot when there is one.  Returns (DataFrame, info) where info is
+    {"source": "snapshot" | "database", "snapshot_id", "created_at", "age_seconds"}.
+    The DataFrame may be shared with the cache -- do not mutate it.
+    """
+    if not refresh:
+        snap = find_snapshot(server, database, query, port, columns, max_age_minutes)
+        if snap is not None:
+            df = load_df('snapshots', snap['snapshot_id'], columns=columns if snap['projected'] else None)
+            if df is not None:
+                info = _info(snap['snapshot_id'], 'snapshot', snap['created'])
+                print(f"  [Snapshot] {len(df)} rows from snapshot ({info['age_seconds']:.0f}s old)")
+                return df, info
+
+    fetched = project_query(query, columns)
+    df = fetch_sql_df(server, database, fetched, port, timeout, chunksize)
+    sid = snapshot_id(server, database, port, fetched)
+    save_df(df, 'snapshots', sid, source={"server": server, "database": database, "port": port,
+                                          "query": normalize_query(fetched)})
+    return df, _info(sid, 'database', time.time())
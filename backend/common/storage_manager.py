@@ -5,24 +5,78 @@ Shared across all modules.
 """
 
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import os
+import json
 import shutil
+import bisect
+import sqlite3
+import threading
+import time
 import datetime as _dt
+from collections import OrderedDict
+from contextlib import closing
 
-# Distinct cache directories
-CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', 'temp_cache')
+from common.db_utils import CONFIG
+from common.memory_utils import COMPACT_DTYPES
+
+# Distinct cache directories (RECON_CACHE_DIR overrides the location)
+CACHE_DIR = os.environ.get('RECON_CACHE_DIR') or os.path.join(os.path.dirname(__file__), '..', 'temp_cache')
 UPLOADS_DIR = os.path.join(CACHE_DIR, 'uploads')
 RESULTS_DIR = os.path.join(CACHE_DIR, 'results')
+SNAPSHOTS_DIR = os.path.join(CACHE_DIR, 'snapshots')      # SQL result snapshots (sql_snapshot.py)
+CATEGORY_DIRS = {'uploads': UPLOADS_DIR, 'results': RESULTS_DIR, 'snapshots': SNAPSHOTS_DIR}
+
+# Restart-safe record of every cache entry (size, created, last access, source).
+# Maintained here, swept by common/cache_janitor.py.  One SQLite row per entry,
+# updated row by row, so every worker process of serve.py shares it safely.
+MANIFEST_PATH = os.path.join(CACHE_DIR, 'manifest.sqlite')
+LEGACY_MANIFEST_PATH = os.path.join(CACHE_DIR, 'manifest.json')     # imported once
+_manifest_lock = threading.Lock()
+
+# Access times are written to the manifest by the process that reads the
+# entry, at most once per ACCESS_WRITE_SECONDS per entry (must stay below the
+# janitor's QUOTA_GRACE_SECONDS, so an entry in use is never evicted)
+ACCESS_WRITE_SECONDS = 30
+_access_written = {}            # manifest key -> last access written by this process
+
+# ── Parquet write options ──
+# snappy is PyArrow's default: cheap to decode, decent ratio.  Row-group size
+# None lets PyArrow pick (one group per ~1M rows).
+DEFAULT_COMPRESSION = 'snappy'
+DEFAULT_ROW_GROUP_SIZE = None
+
+# Results are paged by the Data Grid, so they are written in small fixed-size
+# row groups: a page read touches at most two groups regardless of result size.
+RESULTS_ROW_GROUP_SIZE = 10_000
+
+# ── In-process DataFrame cache ──
+# Process-wide LRU keyed by (category, id) with a total memory budget.
+# Cached frames are SHARED: callers must treat what load_df returns as
+# read-only (assign columns on a copy(deep=False), never in place).
+MEMORY_CACHE_BUDGET = int(CONFIG.get('memory_cache_mb', 512)) * 1024 * 1024
+_mem_cache = OrderedDict()      # (category, id) -> (DataFrame, nbytes)
+_mem_cache_lock = threading.Lock()
+_mem_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes': 0}
+_mem_category_stats = {c: {'hits': 0, 'misses': 0} for c in CATEGORY_DIRS}
+
+# String placeholders that mean "no value" after a str() round-trip.
+_NULL_SENTINELS = ['None', 'nan', 'NaT', 'NaN', '<NA>']
 
 
 def init_cache():
     """Ensures cache directories exist."""
-    os.makedirs(UPLOADS_DIR, exist_ok=True)
-    os.makedirs(RESULTS_DIR, exist_ok=True)
+    for folder in CATEGORY_DIRS.values():
+        os.makedirs(folder, exist_ok=True)
 
 
 def clear_cache():
-    """Clears the temp_cache directory."""
+    """Clears the temp_cache directory (including the manifest)."""
+    _mem_clear()
+    with _manifest_lock:
+        _access_written.clear()
     try:
         if os.path.exists(CACHE_DIR):
             shutil.rmtree(CACHE_DIR)
@@ -31,52 +85,670 @@ def clear_cache():
         print(f"Error clearing cache: {e}")
 
 
-def save_df(df, category, file_id):
+def _cache_path(category, file_id):
+    """Resolve the Parquet path for a cache entry."""
+    return os.path.join(CATEGORY_DIRS.get(category, RESULTS_DIR), f"{file_id}.parquet")
+
+
+def _row_index_path(category, file_id):
+    """Sidecar JSON holding the row offset of every Parquet row group."""
+    return _cache_path(category, file_id)[:-len('.parquet')] + '.rows.json'
+
+
+def sidecar_path(category, file_id, suffix):
+    """Path of an extra file stored with a cache entry (<id>.<suffix>).
+    Sidecars are sized and deleted together with the entry."""
+    return os.path.join(CATEGORY_DIRS.get(category, RESULTS_DIR), f"{file_id}.{suffix}")
+
+
+def _entry_files(category, file_id):
+    """All files belonging to one cache entry: the Parquet plus its sidecars."""
+    folder = CATEGORY_DIRS.get(category, RESULTS_DIR)
+    prefix = f"{file_id}."
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(folder, n) for n in names if n.startswith(prefix)]
+
+
+def entry_size(category, file_id):
+    """Bytes on disk used by one cache entry."""
+    total = 0
+    for path in _entry_files(category, file_id):
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+def list_entries():
+    """(category, file_id) of every Parquet entry currently on disk."""
+    entries = []
+    for category, folder in CATEGORY_DIRS.items():
+        try:
+            names = os.listdir(folder)
+        except FileNotFoundError:
+            continue
+        for n in names:
+            if n.endswith('.parquet'):
+                entries.append((category, n[:-len('.parquet')]))
+    return entries
+
+
+def orphan_files():
+    """(category, path) of every file whose entry has no Parquet (sidecars
+    of a failed or interrupted write)."""
+    orphans = []
+    for category, folder in CATEGORY_DIRS.items():
+        try:
+            names = os.listdir(folder)
+        except FileNotFoundError:
+            continue
+        ids = {n[:-len('.parquet')] for n in names if n.endswith('.parquet')}
+        orphans.extend((category, os.path.join(folder, n)) for n in names
+                       if not n.endswith('.parquet') and n.split('.', 1)[0] not in ids)
+    return orphans
+
+
+def delete_entry(category, file_id):
+    """Remove one cache entry from memory, disk and the manifest."""
+    _mem_invalidate((category, file_id))
+    for path in _entry_files(category, file_id):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    key = _manifest_key(category, file_id)
+    with _manifest_lock:
+        _access_written.pop(key, None)
+    with closing(_manifest_connect()) as conn:
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Manifest
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _manifest_key(category, file_id):
+    return f"{category}/{file_id}"
+
+
+_MANIFEST_COLUMNS = ('category', 'id', 'size_bytes', 'created_at', 'last_access', 'source')
+
+
+def _manifest_connect():
+    """Connection to the manifest database (created on first use; a
+    manifest.json from an older version is imported once)."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(MANIFEST_PATH, timeout=10, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS entries ("
+        " key TEXT PRIMARY KEY, category TEXT NOT NULL, id TEXT NOT NULL, size_bytes INTEGER NOT NULL,"
+        " created_at REAL NOT NULL, last_access REAL NOT NULL, source TEXT NOT NULL)")
+    if os.path.exists(LEGACY_MANIFEST_PATH):
+        _import_legacy_manifest(conn)
+    return conn
+
+
+def _import_legacy_manifest(conn):
+    try:
+        with open(LEGACY_MANIFEST_PATH, 'r') as f:
+            legacy = json.load(f)
+    except (OSError, ValueError):
+        legacy = {}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for key, e in legacy.items():
+            conn.execute("INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (key, e['category'], e['id'], int(e.get('size_bytes', 0)), e.get('created_at', 0),
+                          e.get('last_access', 0), json.dumps(e.get('source') or {})))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    try:
+        os.remove(LEGACY_MANIFEST_PATH)
+    except OSError:
+        pass
+
+
+def _read_manifest(conn):
+    """{key: entry dict} of every manifest row."""
+    manifest = {}
+    for row in conn.execute(f"SELECT key, {', '.join(_MANIFEST_COLUMNS)} FROM entries"):
+        entry = dict(zip(_MANIFEST_COLUMNS, row[1:]))
+        entry['source'] = json.loads(entry['source'])
+        manifest[row[0]] = entry
+    return manifest
+
+
+def _manifest_record(category, file_id, source=None):
+    """Create/refresh the manifest entry for a freshly written cache entry."""
+    now = time.time()
+    key = _manifest_key(category, file_id)
+    with _manifest_lock:
+        _access_written[key] = now
+    with closing(_manifest_connect()) as conn:
+        conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (key, category, file_id, entry_size(category, file_id), now, now,
+                      json.dumps(source or {}, default=str)))
+
+
+def _manifest_touch(category, file_id):
+    """Record an access in the manifest (throttled: ACCESS_WRITE_SECONDS)."""
+    now = time.time()
+    key = _manifest_key(category, file_id)
+    with _manifest_lock:
+        if now - _access_written.get(key, 0) < ACCESS_WRITE_SECONDS:
+            return
+        _access_written[key] = now
+    try:
+        with closing(_manifest_connect()) as conn:
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ? AND last_access < ?",
+                         (now, key, now - ACCESS_WRITE_SECONDS))
+    except sqlite3.Error as e:
+        # A busy manifest must not fail the read; the next access retries
+        with _manifest_lock:
+            _access_written.pop(key, None)
+        print(f"  [Cache] access time not recorded for {key}: {e}")
+
+
+def read_manifest():
+    """{key: entry} of every cache entry in the manifest."""
+    with closing(_manifest_connect()) as conn:
+        return _read_manifest(conn)
+
+
+def adopt_entry(category, file_id, created_at):
+    """Record an entry found on disk without a manifest row (never replaces one)."""
+    with closing(_manifest_connect()) as conn:
+        conn.execute("INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?, ?, '{}')",
+                     (_manifest_key(category, file_id), category, file_id,
+                      entry_size(category, file_id), created_at, created_at))
+
+
+def set_entry_size(category, file_id, size_bytes):
+    with closing(_manifest_connect()) as conn:
+        conn.execute("UPDATE entries SET size_bytes = ? WHERE key = ?",
+                     (int(size_bytes), _manifest_key(category, file_id)))
+
+
+def forget_entry(category, file_id):
+    """Drop the manifest row of an entry whose Parquet is gone."""
+    if not os.path.exists(_cache_path(category, file_id)):
+        with closing(_manifest_connect()) as conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (_manifest_key(category, file_id),))
+
+
+def claim_idle_entry(category, file_id, idle_before):
     """
-    Saves a DataFrame to Parquet.
-    category: 'uploads' or 'results'
+    Remove the manifest row of an entry last accessed before *idle_before*.
+    True if this caller removed it (it may then delete the files); False if
+    the entry was used or rewritten in the meantime.
+    """
+    key = _manifest_key(category, file_id)
+    with closing(_manifest_connect()) as conn:
+        return conn.execute("DELETE FROM entries WHERE key = ? AND last_access < ?",
+                            (key, idle_before)).rowcount > 0
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# In-memory LRU
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _mem_get(key, count_miss=True):
+    """Return the cached DataFrame for *key* (and mark it recent), or None."""
+    with _mem_cache_lock:
+        entry = _mem_cache.get(key)
+        by_category = _mem_category_stats.setdefault(key[0], {'hits': 0, 'misses': 0})
+        if entry is None:
+            if count_miss:
+                _mem_cache_stats['misses'] += 1
+                by_category['misses'] += 1
+            return None
+        _mem_cache.move_to_end(key)
+        _mem_cache_stats['hits'] += 1
+        by_category['hits'] += 1
+        return entry[0]
+
+
+def _mem_put(key, df):
+    """Cache *df* under *key*, evicting least-recently-used frames to fit."""
+    nbytes = int(df.memory_usage(index=True, deep=True).sum())
+    if nbytes > MEMORY_CACHE_BUDGET:
+        return
+    with _mem_cache_lock:
+        old = _mem_cache.pop(key, None)
+        if old is not None:
+            _mem_cache_stats['bytes'] -= old[1]
+        while _mem_cache and _mem_cache_stats['bytes'] + nbytes > MEMORY_CACHE_BUDGET:
+            _, (_, evicted) = _mem_cache.popitem(last=False)
+            _mem_cache_stats['bytes'] -= evicted
+            _mem_cache_stats['evictions'] += 1
+        _mem_cache[key] = (df, nbytes)
+        _mem_cache_stats['bytes'] += nbytes
+
+
+def _mem_invalidate(key):
+    """Drop *key* from the in-memory cache (no-op if absent)."""
+    with _mem_cache_lock:
+        old = _mem_cache.pop(key, None)
+        if old is not None:
+            _mem_cache_stats['bytes'] -= old[1]
+
+
+def _mem_clear():
+    """Drop every in-memory entry (counters are kept)."""
+    with _mem_cache_lock:
+        _mem_cache.clear()
+        _mem_cache_stats['bytes'] = 0
+
+
+def cache_stats():
+    """Snapshot of the in-memory cache counters (totals and per category)."""
+    with _mem_cache_lock:
+        categories = {c: dict(v, entries=0, bytes=0) for c, v in _mem_category_stats.items()}
+        for (category, _), (_, nbytes) in _mem_cache.items():
+            entry = categories.setdefault(category, {'hits': 0, 'misses': 0, 'entries': 0, 'bytes': 0})
+            entry['entries'] += 1
+            entry['bytes'] += nbytes
+        return {
+            "entries": len(_mem_cache),
+            "hits": _mem_cache_stats['hits'],
+            "misses": _mem_cache_stats['misses'],
+            "evictions": _mem_cache_stats['evictions'],
+            "bytes": _mem_cache_stats['bytes'],
+            "budget_bytes": MEMORY_CACHE_BUDGET,
+            "categories": categories,
+        }
+
+
+def disk_usage():
+    """{category: {"entries": Parquet entries, "bytes": all files}} on disk."""
+    usage = {}
+    for category, folder in CATEGORY_DIRS.items():
+        entries, total = 0, 0
+        try:
+            with os.scandir(folder) as it:
+                for e in it:
+                    try:
+                        total += e.stat().st_size
+                    except OSError:
+                        continue
+                    entries += e.name.endswith('.parquet')
+        except FileNotFoundError:
+            pass
+        usage[category] = {"entries": entries, "bytes": total}
+    return usage
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Type coercion  (object columns -> Parquet-safe strings)
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _coerce_cell(v):
+    """Scalar fallback: convert ONE object cell to a Parquet-safe string."""
+    if v is None or v is pd.NaT:
+        return ''
+    if isinstance(v, (_dt.time, _dt.date, _dt.datetime, pd.Timestamp)):
+        return v.isoformat()
+    return v if isinstance(v, str) else str(v)
+
+
+# Types whose equal values always print the same: converted once per distinct
+# value.  (1 == 1.0 == True and Decimal('1') == Decimal('1.0') but print
+# differently, so values are only grouped within one of these types.)
+_STABLE_STR_TYPES = (str, int, bool, np.int64, np.bool_, _dt.date, type(None))
+
+
+def _convert_by_key(group, keys):
+    """_coerce_cell once per distinct key of *group*."""
+    codes, uniques = pd.factorize(keys, use_na_sentinel=False)
+    first = np.empty(len(uniques), dtype=np.int64)
+    first[codes[::-1]] = np.arange(len(codes) - 1, -1, -1)
+    converted = np.array([_coerce_cell(group[i]) for i in first] + [''], dtype=object)
+    return converted[codes]
+
+
+def _map_uniques(s):
+    """Apply _coerce_cell once per distinct (type, value) instead of once per cell.
+    Floats are grouped by bit pattern (0.0 / -0.0 keep their own text); cells
+    of other types are converted one by one."""
+    values = s.to_numpy(dtype=object)
+    types = [type(v) for v in values]
+    type_codes, type_uniques = pd.factorize(pd.Series(types, dtype=object))
+    out = np.empty(len(values), dtype=object)
+    for code, t in enumerate(type_uniques):
+        idx = np.flatnonzero(type_codes == code) if len(type_uniques) > 1 else slice(None)
+        group = values[idx]
+        if t in (float, np.float64):
+            out[idx] = _convert_by_key(group, group.astype(np.float64).view(np.int64))
+        elif t in _STABLE_STR_TYPES:
+            out[idx] = _convert_by_key(group, group)
+        else:
+            out[idx] = [_coerce_cell(v) for v in group]
+    return pd.Series(out, index=s.index, dtype=object)
+
+
+def _isoformat_datetimes(s):
+    """Bulk datetime.isoformat() for a column of naive datetimes/Timestamps.
+
+    Raises ValueError/TypeError when the column cannot be converted exactly
+    (tz-aware, out of range, nanosecond precision) so the caller can fall back.
+    """
+    dt = pd.to_datetime(s, errors='raise')
+    if dt.dt.tz is not None or (dt.dt.nanosecond != 0).any():
+        raise ValueError("datetime column needs scalar isoformat")
+    out = dt.dt.strftime('%Y-%m-%dT%H:%M:%S').astype(object)
+    us = dt.dt.microsecond
+    frac = us.fillna(0) != 0
+    if frac.any():
+        out[frac] = out[frac] + '.' + us[frac].astype('int64').astype(str).str.zfill(6)
+    return out
+
+
+def _coerce_object_column(s):
+    """Convert an object column to Parquet-safe strings with bulk operations.
+
+    The value kind is detected once per column (pandas infer_dtype):
+      string   -> written as-is; only null / sentinel cells are blanked
+      datetime -> vectorised isoformat
+      decimal  -> astype(str)
+      other    -> scalar conversion applied once per distinct value
+    Nulls and the 'None'/'nan'/'NaT' string sentinels always become ''.
     """
-    if category == 'uploads':
-        path = os.path.join(UPLOADS_DIR, f"{file_id}.parquet")
-    else:
-        path = os.path.join(RESULTS_DIR, f"{file_id}.parquet")
+    kind = pd.api.types.infer_dtype(s, skipna=True)
+    null_mask = s.isna()
+
+    if kind in ('string', 'empty'):
+        blank = null_mask | s.isin(_NULL_SENTINELS)
+        return s.mask(blank, '') if blank.any() else s
+
+    out = None
+    if kind == 'datetime':
+        try:
+            out = _isoformat_datetimes(s)
+        except (ValueError, TypeError, OverflowError, pd.errors.OutOfBoundsDatetime):
+            out = None
+    elif kind == 'decimal':
+        out = s.astype(str)
+
+    if out is None:
+        out = _map_uniques(s)
+
+    blank = null_mask | out.isin(_NULL_SENTINELS)
+    return out.mask(blank, '') if blank.any() else out
 
-    # Fix mixed-type columns that crash PyArrow.
-    # Excel/SQL often produce 'object' dtype columns with mixed datetime/time/string/None.
-    # Convert ALL problematic columns to string for safe Parquet round-trip.
-    df_safe = df.copy()
+
+def coerce_for_parquet(df):
+    """Return a Parquet-safe view of *df*.
+
+    Excel/SQL often produce 'object' dtype columns with mixed
+    datetime/time/Decimal/string/None values that crash PyArrow, so those
+    become strings.  Untouched columns share memory with *df* (shallow copy).
+    """
+    df_safe = df.copy(deep=False)
     for col in df_safe.columns:
-        dtype = df_safe[col].dtype
+        s = df_safe[col]
+        dtype = s.dtype
         if dtype == 'object':
-            # Object columns may contain datetime.time, datetime.date, Decimal, etc.
-            df_safe[col] = df_safe[col].apply(
-                lambda v: '' if v is None or v is pd.NaT
-                else v.isoformat() if isinstance(v, (_dt.time, _dt.date, _dt.datetime, pd.Timestamp))
-                else str(v) if not isinstance(v, str) else v
-            ).replace({'None': '', 'nan': '', 'NaT': '', 'NaN': '', '<NA>': ''})
-        elif pd.api.types.is_datetime64_any_dtype(df_safe[col]):
-            df_safe[col] = df_safe[col].astype(str).replace('NaT', '')
-        elif 'timedelta' in str(dtype):
-            df_safe[col] = df_safe[col].astype(str).replace('NaT', '')
-
-    df_safe.to_parquet(path, index=False)
+            df_safe[col] = _coerce_object_column(s)
+        elif pd.api.types.is_datetime64_any_dtype(s) or pd.api.types.is_timedelta64_dtype(s):
+            df_safe[col] = s.astype(str).replace('NaT', '')
+    return df_safe
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Save / Load
+# ═══════════════════════════════════════════════════════════════════════════
+
+def save_df(df, category, file_id, compression=DEFAULT_COMPRESSION, row_group_size=DEFAULT_ROW_GROUP_SIZE,
+            source=None):
+    """
+    Saves a DataFrame to Parquet.
+    category: 'uploads', 'results' or 'snapshots'
+    compression: Parquet codec ('snappy', 'zstd', 'gzip', 'lz4', None)
+    row_group_size: max rows per Parquet row group
+                    (None = RESULTS_ROW_GROUP_SIZE for results, PyArrow default otherwise)
+    source: optional dict recorded in the manifest (file name, server, query ...)
+    """
+    path = _cache_path(category, file_id)
+    _mem_invalidate((category, file_id))
+    if row_group_size is None and category == 'results':
+        row_group_size = RESULTS_ROW_GROUP_SIZE
+
+    df_safe = coerce_for_parquet(df)
+    # Written aside and moved into place: readers never see a partial file
+    # (the temp name is a sidecar of the entry, so it is swept with it)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    df_safe.to_parquet(tmp, index=False, compression=compression,
+                       row_group_size=row_group_size)
+    os.replace(tmp, path)
+    _write_row_index(path, _row_index_path(category, file_id))
+    _manifest_record(category, file_id, source)
     return path
 
 
-def load_df(category, file_id):
+def write_tables(category, file_id, tables, compression=DEFAULT_COMPRESSION, source=None):
+    """
+    Stream an iterable of PyArrow Tables (same schema) into one cache entry,
+    one row group per table, without holding the whole dataset in memory.
+    Written to a temp file first, so readers never see a partial entry.
+    Returns (path, total_rows); (None, 0) if *tables* was empty.
+    """
+    path = _cache_path(category, file_id)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    _mem_invalidate((category, file_id))
+
+    writer = None
+    total = 0
+    try:
+        for table in tables:
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema, compression=compression)
+            writer.write_table(table)
+            total += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        return None, 0
+
+    os.replace(tmp, path)
+    _write_row_index(path, _row_index_path(category, file_id))
+    _manifest_record(category, file_id, source)
+    return path, total
+
+
+def load_df(category, file_id, columns=None):
     """
-    Loads a DataFrame from Parquet.
+    Loads a DataFrame from the in-memory cache, else from Parquet.
+    The returned frame is shared with other callers -- do not mutate it.
+    columns: projection -- only these columns (those that exist, in this
+             order) are read from disk; projected reads are not memory-cached.
     Returns None if not found.
     """
-    if category == 'uploads':
-        path = os.path.join(UPLOADS_DIR, f"{file_id}.parquet")
-    else:
-        path = os.path.join(RESULTS_DIR, f"{file_id}.parquet")
+    key = (category, file_id)
+    df = _mem_get(key, count_miss=columns is None)
+    if df is not None:
+        _manifest_touch(category, file_id)
+        return df if columns is None else df[[c for c in columns if c in df.columns]]
+
+    path = _cache_path(category, file_id)
+
+    if not os.path.exists(path):
+        return None
+
+    _manifest_touch(category, file_id)
+    if columns is not None:
+        names = set(pq.read_schema(path).names)
+        return _read_parquet(path, [c for c in columns if c in names])
+    df = _read_parquet(path)
+    _mem_put(key, df)
+    return df
+
+
+def _arrow_types(arrow_type):
+    """to_pandas() types_mapper: keep decimal/date columns Arrow-backed."""
+    if pa.types.is_decimal(arrow_type) or pa.types.is_date(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
+
+
+def _read_parquet(path, columns=None):
+    """Parquet file (all or *columns*) as a DataFrame.  With compact_dtypes,
+    decimal and date columns stay Arrow-backed instead of becoming Python
+    objects (dictionary columns load as categories either way)."""
+    if not COMPACT_DTYPES:
+        return pd.read_parquet(path, columns=columns)
+    return pq.read_table(path, columns=columns).to_pandas(types_mapper=_arrow_types)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Row-group paged reads
+# ═══════════════════════════════════════════════════════════════════════════
 
+def _build_row_index(path):
+    """Row offsets per row group, taken from the Parquet footer."""
+    meta = pq.read_metadata(path)
+    offsets = [0]
+    for i in range(meta.num_row_groups):
+        offsets.append(offsets[-1] + meta.row_group(i).num_rows)
+    return {"num_rows": meta.num_rows, "row_group_offsets": offsets}
+
+
+def _write_row_index(path, index_path):
+    """Write the row-group offset sidecar next to a freshly saved Parquet file."""
+    with open(index_path, 'w') as f:
+        json.dump(_build_row_index(path), f)
+
+
+def load_row_index(category, file_id):
+    """
+    Returns {"num_rows": n, "row_group_offsets": [0, ..., n]} for a cache entry.
+    Falls back to the Parquet footer when the sidecar is missing.
+    Returns None if not found.
+    """
+    path = _cache_path(category, file_id)
     if not os.path.exists(path):
         return None
+    try:
+        with open(_row_index_path(category, file_id), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return _build_row_index(path)
+
+
+def load_df_rows(category, file_id, start, end):
+    """
+    Loads rows [start, end) of a cached DataFrame.
+    Only the row groups covering the range are read (memory-mapped), so the
+    cost is independent of the total size.
+    Returns (DataFrame, total_rows), or (None, 0) if not found.
+    """
+    # Served from memory when the whole frame is already hot
+    df = _mem_get((category, file_id), count_miss=False)
+    if df is not None:
+        _manifest_touch(category, file_id)
+        return df.iloc[max(0, start):end], len(df)
+
+    index = load_row_index(category, file_id)
+    if index is None:
+        return None, 0
+    _manifest_touch(category, file_id)
+
+    path = _cache_path(category, file_id)
+    total = index['num_rows']
+    offsets = index['row_group_offsets']
+    start = max(0, start)
+    end = min(end, total)
+
+    pf = pq.ParquetFile(path, memory_map=True)
+    if start >= end:
+        return pf.schema_arrow.empty_table().to_pandas(), total
+
+    first = bisect.bisect_right(offsets, start) - 1
+    last = bisect.bisect_left(offsets, end) - 1
+    table = pf.read_row_groups(list(range(first, last + 1)))
+    table = table.slice(start - offsets[first], end - start)
+    return table.to_pandas(), total
+
+
+def iter_row_groups(category, file_id, columns=None):
+    """
+    Yield a cached entry as PyArrow Tables, one Parquet row group at a time
+    (constant memory, independent of the result size).
+    columns: projection -- only these columns (those that exist) are read.
+    """
+    path = _cache_path(category, file_id)
+    _manifest_touch(category, file_id)
+    pf = pq.ParquetFile(path, memory_map=True)
+    if columns is not None:
+        names = set(pf.schema_arrow.names)
+        columns = [c for c in columns if c in names]
+    for i in range(pf.num_row_groups):
+        yield pf.read_row_group(i, columns=columns)
+
+
+def cache_file_path(category, file_id):
+    """Path of the Parquet file for a cache entry, or None if not found."""
+    path = _cache_path(category, file_id)
+    return path if os.path.exists(path) else None
+
+
+def sample_shape(category, file_id, columns=None, rows=1000):
+    """
+    (row count, column count, in-memory bytes per row) of a cache entry, from
+    the Parquet footer and the Arrow size of its first *rows* rows -- the
+    entry itself is not loaded.  columns: only these columns (those that exist).
+    Returns None if not found.
+    """
+    path = cache_file_path(category, file_id)
+    if path is None:
+        return None
+    pf = pq.ParquetFile(path)
+    columns = pf.schema_arrow.names if columns is None else [c for c in columns if c in pf.schema_arrow.names]
+    total = pf.metadata.num_rows
+    batch = next(pf.iter_batches(batch_size=rows, columns=columns), None)
+    width = batch.nbytes / batch.num_rows if batch is not None and batch.num_rows else 0
+    return total, len(columns), width
+
+
+def load_df_take(category, file_id, positions):
+    """
+    Loads the rows at *positions* (0-based, in the given order).
+    Only the row groups containing those rows are read.
+    Returns None if not found.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+
+    df = _mem_get((category, file_id), count_miss=False)
+    if df is not None:
+        _manifest_touch(category, file_id)
+        return df.take(positions)
+
+    index = load_row_index(category, file_id)
+    if index is None:
+        return None
+    _manifest_touch(category, file_id)
+
+    pf = pq.ParquetFile(_cache_path(category, file_id), memory_map=True)
+    if len(positions) == 0:
+        return pf.schema_arrow.empty_table().to_pandas()
+
+    offsets = np.asarray(index['row_group_offsets'], dtype=np.int64)
+    group_of = np.searchsorted(offsets, positions, side='right') - 1
+    groups = np.unique(group_of)
+    table = pf.read_row_groups(groups.tolist())
 
-    return pd.read_parquet(path)
+    # Position of each needed group's first row inside the concatenated table
+    sizes = offsets[groups + 1] - offsets[groups]
+    base = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    local = positions - offsets[group_of] + base[np.searchsorted(groups, group_of)]
+    return table.take(pa.array(local)).to_pandas()
 
 
 # Initialize on import
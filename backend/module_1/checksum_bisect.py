@@ -0,0 +1,392 @@
+"""
+Module 1: Checksum Bisection (SQL-side hash pushdown)
+Key-based SQL-to-File reconciliation that lets SQL Server do the first pass.
+
+Every row is assigned to a bucket by a hash of its key, and SQL Server
+returns only per-bucket aggregates (row count + two sums of 32-bit row-hash
+slices).  The same aggregates are computed over the file.  Buckets that
+agree are counted as matched; buckets that differ are split FANOUT ways and
+queried again, until the rows left in differing buckets are few enough
+(LEAF_ROWS).  Only those leaf buckets are fetched in full and compared by the
+key-based engine, so transfer grows with the number of differences, not the
+size of the table.
+
+Normalisation contract
+----------------------
+Both sides hash the same text for a row.  Each value is rendered per the SQL
+column type (from the query's result metadata), then NULL becomes '':
+  - string / other : the value with leading/trailing spaces removed
+  - integer        : plain digits                       (7, -12)
+  - bit            : 1 or 0
+  - decimal / float: rounded half away from zero to DECIMAL_PLACES
+                     (12.5 -> 12.500000; -0.0000001 -> 0.000000)
+  - datetime       : yyyy-mm-dd hh:mi:ss  (fractional seconds dropped)
+  - date           : yyyy-mm-dd
+File values that cannot be read as the column type are hashed as trimmed
+text, which only makes their bucket differ (and be fetched).
+  key text = key values joined by U+001F;  row text = key columns, then the
+             other common columns in query order, joined by U+001F
+  key hash = MD5(UTF-16LE key text) bytes 5-8, unsigned -> bucket
+  row hash = MD5(UTF-16LE row text) bytes 1-4 and 9-12, signed 32-bit
+Differences the contract hides (beyond DECIMAL_PLACES, below one second,
+other whitespace) are not reported by this mode.
+The same key hash drives the quick sample mode: keys whose hash modulo
+SAMPLE_MODULUS is below k are selected on both sides (key_sample_sql /
+file_key_sample), so a sample compares like-for-like slices.
+Requires SQL Server 2016+ (HASHBYTES over NVARCHAR(MAX)); the query must be
+usable as a derived table (no ORDER BY without TOP, no CTE).
+"""
+
+import time
+import hashlib
+import numpy as np
+import pandas as pd
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
+
+from common.db_utils import CONFIG, get_connection_string, quote_identifier, strip_query
+from common.metrics import observe_sql_fetch
+from module_1.comparison_engine import run_hybrid_comparison
+
+HASH_SPACE = 1 << 32
+
+# Buckets of the first pass, and split factor of each deeper pass (powers of 2)
+INITIAL_BUCKETS = 4096
+FANOUT = 64
+
+# Stop descending once the differing buckets hold at most this many rows
+LEAF_ROWS = 5000
+
+# Most bucket ids sent back in one IN (...) list
+MAX_IN_LIST = 2000
+
+# If differing buckets hold more than this share of the rows, fetch everything
+MAX_DIFF_FRACTION = 0.5
+
+DECIMAL_PLACES = CONFIG.get('checksum_decimal_places', 6)
+
+SEP = '\x1f'
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Normalisation (SQL side)
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _column_kind(type_code):
+    """Contract kind of a column from its pyodbc cursor.description type."""
+    if type_code is bool:
+        return 'bit'
+    if type_code is int:
+        return 'integer'
+    if type_code in (float, Decimal):
+        return 'decimal'
+    if type_code is datetime:
+        return 'datetime'
+    if type_code is date:
+        return 'date'
+    return 'string'
+
+
+def _sql_value(col, kind):
+    """T-SQL expression rendering one column per the contract."""
+    c = f"q.{quote_identifier(col)}"
+    if kind == 'integer':
+        expr = f"CONVERT(NVARCHAR(40), {c})"
+    elif kind == 'bit':
+        expr = f"CONVERT(NVARCHAR(1), CONVERT(INT, {c}))"
+    elif kind == 'decimal':
+        expr = (f"CONVERT(NVARCHAR(60), CAST(ROUND({c}, {DECIMAL_PLACES}) "
+                f"AS DECIMAL(38, {DECIMAL_PLACES})))")
+    elif kind == 'datetime':
+        expr = f"CONVERT(NVARCHAR(19), {c}, 120)"
+    elif kind == 'date':
+        expr = f"CONVERT(NVARCHAR(10), {c}, 23)"
+    else:
+        expr = f"LTRIM(RTRIM(CAST({c} AS NVARCHAR(MAX))))"
+    return f"ISNULL({expr}, N'')"
+
+
+def _sql_text(cols, kinds):
+    """T-SQL expression for the contract text of *cols* (NVARCHAR(MAX))."""
+    parts = [_sql_value(c, kinds[c]) for c in cols]
+    return "CAST(N'' AS NVARCHAR(MAX)) + " + " + NCHAR(31) + ".join(parts)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Normalisation (file side)
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _is_null(val):
+    return val is None or val is pd.NaT or (isinstance(val, float) and np.isnan(val)) or val is pd.NA
+
+
+def _to_decimal(val):
+    if isinstance(val, bool):
+        return Decimal(int(val))
+    try:
+        return Decimal(str(val).strip())
+    except InvalidOperation:
+        return None
+
+
+def _file_value(val, kind):
+    """Contract text of one file value for a column of *kind*."""
+    if _is_null(val):
+        return ''
+    if kind in ('integer', 'bit', 'decimal'):
+        d = _to_decimal(val)
+        if d is not None and d.is_finite():
+            if kind == 'decimal':
+                q = d.quantize(Decimal(1).scaleb(-DECIMAL_PLACES), rounding=ROUND_HALF_UP)
+                return format(abs(q) if q == 0 else q, 'f')
+            if d == d.to_integral_value():
+                return str(int(d))
+    elif kind in ('datetime', 'date'):
+        try:
+            ts = pd.Timestamp(val.strip() if isinstance(val, str) else val)
+            if not pd.isna(ts):
+                return ts.strftime('%Y-%m-%d %H:%M:%S' if kind == 'datetime' else '%Y-%m-%d')
+        except (ValueError, TypeError):
+            pass
+    return str(val).strip(' ')
+
+
+def _file_column(s, kind):
+    """Contract text of a whole file column (vectorised for the common dtypes)."""
+    null = s.isna().to_numpy()
+    if kind == 'string':
+        out = s.astype(str).str.strip(' ')
+    elif kind == 'decimal' and pd.api.types.is_float_dtype(s):
+        out = pd.Series([f"{x:.{DECIMAL_PLACES}f}" for x in s.to_numpy(float, na_value=np.nan)], index=s.index)
+        out = out.mask(out.str.fullmatch(r'-0\.?0*'), out.str.lstrip('-'))
+    elif kind in ('integer', 'bit') and pd.api.types.is_bool_dtype(s) and not null.any():
+        out = s.astype(int).astype(str)
+    elif kind in ('integer', 'decimal') and pd.api.types.is_integer_dtype(s):
+        out = s.astype(str)
+        if kind == 'decimal' and DECIMAL_PLACES > 0:
+            out = out + '.' + '0' * DECIMAL_PLACES
+    elif kind in ('datetime', 'date') and not pd.api.types.is_numeric_dtype(s):
+        ts = pd.to_datetime(s, errors='coerce', format='mixed')
+        out = ts.dt.strftime('%Y-%m-%d %H:%M:%S' if kind == 'datetime' else '%Y-%m-%d')
+        bad = ts.isna().to_numpy() & ~null
+        if bad.any():
+            out[bad] = s[bad].astype(str).str.strip(' ')
+    else:
+        return [_file_value(v, kind) for v in s.tolist()]
+    return out.where(~null, '').tolist()
+
+
+def _md5(text):
+    return hashlib.md5(text.encode('utf-16-le')).digest()
+
+
+def file_key_hashes(df, key_cols, kinds):
+    """Key hash (uint64 holding the unsigned 32-bit value) per file row."""
+    rendered = [_file_column(df[c], kinds[c]) for c in key_cols]
+    return np.fromiter((int.from_bytes(_md5(SEP.join(parts))[4:8], 'big') for parts in zip(*rendered)),
+                       np.uint64, len(df))
+
+
+def file_hashes(df, key_cols, hash_cols, kinds):
+    """(key hash uint64, row hash slice 1 int64, row hash slice 2 int64) per file row."""
+    rendered = {c: _file_column(df[c], kinds[c]) for c in dict.fromkeys(list(key_cols) + list(hash_cols))}
+    key_h = np.empty(len(df), np.uint64)
+    s1 = np.empty(len(df), np.int64)
+    s2 = np.empty(len(df), np.int64)
+    rows = zip(zip(*[rendered[c] for c in key_cols]), zip(*[rendered[c] for c in hash_cols]))
+    for i, (key_parts, row_parts) in enumerate(rows):
+        key_h[i] = int.from_bytes(_md5(SEP.join(key_parts))[4:8], 'big')
+        d = _md5(SEP.join(row_parts))
+        s1[i] = int.from_bytes(d[0:4], 'big', signed=True)
+        s2[i] = int.from_bytes(d[8:12], 'big', signed=True)
+    return key_h, s1, s2
+
+
+def _file_aggregates(key_h, s1, s2, width, parents):
+    """{bucket: (count, sum1, sum2)} over the file rows under *parents*."""
+    buckets = (key_h // np.uint64(width)).astype(np.int64)
+    if parents is not None:
+        mask = np.isin(buckets // FANOUT, list(parents))
+        buckets, s1, s2 = buckets[mask], s1[mask], s2[mask]
+    agg = pd.DataFrame({'b': buckets, 's1': s1, 's2': s2}) \
+        .groupby('b').agg(n=('s1', 'size'), s1=('s1', 'sum'), s2=('s2', 'sum'))
+    return {int(b): (int(n), int(x), int(y)) for b, n, x, y in zip(agg.index, agg['n'], agg['s1'], agg['s2'])}
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# SQL side
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _derived(query):
+    """(<query>) q for a FROM clause, the query on its own lines so a trailing
+    -- comment cannot swallow the ") q"."""
+    return f"(\n{strip_query(query)}\n) q"
+
+
+def probe_columns(cursor, query):
+    """[(name, kind)] of the query's result columns (no rows are read)."""
+    cursor.execute(f"SELECT TOP 0 * FROM {_derived(query)}")
+    return [(d[0], _column_kind(d[1])) for d in cursor.description]
+
+
+def _key_hash_sql(key_cols, kinds):
+    """T-SQL expression for the key hash (unsigned 32-bit, as BIGINT)."""
+    return f"CAST(SUBSTRING(HASHBYTES('MD5', {_sql_text(key_cols, kinds)}), 5, 4) AS BIGINT)"
+
+
+def _key_bucket_sql(key_cols, kinds, width):
+    return f"{_key_hash_sql(key_cols, kinds)} / {int(width)}"
+
+
+def bucket_aggregates_sql(query, key_cols, hash_cols, kinds, width, parents):
+    """Per-bucket aggregate query at bucket *width*, restricted to *parents*."""
+    where = ""
+    if parents is not None:
+        where = f"WHERE b.bucket / {FANOUT} IN ({', '.join(str(int(p)) for p in sorted(parents))})"
+    return (
+        "SELECT b.bucket, COUNT_BIG(*) AS n,"
+        " SUM(CAST(CAST(SUBSTRING(b.rh, 1, 4) AS INT) AS BIGINT)) AS s1,"
+        " SUM(CAST(CAST(SUBSTRING(b.rh, 9, 4) AS INT) AS BIGINT)) AS s2"
+        f" FROM (SELECT {_key_bucket_sql(key_cols, kinds, width)} AS bucket,"
+        f" HASHBYTES('MD5', {_sql_text(hash_cols, kinds)}) AS rh"
+        f" FROM {_derived(query)}) b {where} GROUP BY b.bucket"
+    )
+
+
+def _select_list(columns):
+    """q.* or the projected (pushed-down) columns."""
+    return 'q.*' if columns is None else ', '.join(f"q.{quote_identifier(c)}" for c in columns)
+
+
+def leaf_rows_sql(query, key_cols, kinds, width, buckets, columns=None):
+    """Rows of the query (all or *columns*) that fall into *buckets* at *width*."""
+    ids = ', '.join(str(int(b)) for b in sorted(buckets))
+    return (f"SELECT {_select_list(columns)} FROM {_derived(query)}"
+            f" WHERE {_key_bucket_sql(key_cols, kinds, width)} IN ({ids})")
+
+
+def probe_query_columns(server, database, query, port=None):
+    """probe_columns() on a connection of its own."""
+    import pyodbc
+
+    conn = pyodbc.connect(get_connection_string(server, database, port))
+    try:
+        return probe_columns(conn.cursor(), query)
+    finally:
+        conn.close()
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Key sampling  (quick estimate mode)
+# ═══════════════════════════════════════════════════════════════════════════
+
+# Keys are sampled when key hash % SAMPLE_MODULUS < k
+SAMPLE_MODULUS = 1000
+
+
+def key_sample_sql(query, key_cols, kinds, k, columns=None):
+    """*query* (all or *columns*) restricted to the keys of sample *k* (out of SAMPLE_MODULUS)."""
+    return (f"SELECT {_select_list(columns)} FROM {_derived(query)}"
+            f" WHERE {_key_hash_sql(key_cols, kinds)} % {SAMPLE_MODULUS} < {int(k)}")
+
+
+def file_key_sample(df, key_cols, kinds, k):
+    """Rows of *df* whose keys fall into sample *k* -- the same keys as key_sample_sql()."""
+    return df[file_key_hashes(df, key_cols, kinds) % np.uint64(SAMPLE_MODULUS) < np.uint64(k)]
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Bisection
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _differing(server_agg, file_agg):
+    """Bucket ids whose aggregates disagree, and the rows they hold (max side)."""
+    diff = {b for b in set(server_agg) | set(file_agg) if server_agg.get(b) != file_agg.get(b)}
+    rows = sum(max(server_agg.get(b, (0,))[0], file_agg.get(b, (0,))[0]) for b in diff)
+    return diff, rows
+
+
+def run_checksum_comparison(server, database, query, df_file, keys, port=None,
+                            sql_columns=None, file_name='File'):
+    """
+    Key-based comparison of *query* against *df_file* (already renamed to SQL
+    column names) that only fetches rows from differing buckets.
+    *sql_columns* restricts the SQL side like the column mapping does.
+    Returns (result_df, summary) like run_hybrid_comparison.
+    """
+    import pyodbc
+
+    t_start = time.time()
+    conn = pyodbc.connect(get_connection_string(server, database, port))
+    try:
+        cursor = conn.cursor()
+        columns = probe_columns(cursor, query)
+        kinds = dict(columns)
+        sql_cols = [c for c, _ in columns if sql_columns is None or c in sql_columns]
+        missing = [k for k in keys if k not in sql_cols or k not in df_file.columns]
+        if missing:
+            raise ValueError(f"Key columns not present on both sides: {missing}")
+        hash_cols = list(keys) + [c for c in sql_cols if c in df_file.columns and c not in keys]
+
+        t0 = time.time()
+        key_h, s1, s2 = file_hashes(df_file, keys, hash_cols, kinds)
+        print(f"  [Checksum] hashed {len(df_file)} file rows in {time.time() - t0:.2f}s")
+
+        width, parents = HASH_SPACE // INITIAL_BUCKETS, None
+        levels, buckets_compared, total_sql, fallback = 0, 0, None, False
+        equal_rows = 0
+        while True:
+            cursor.execute(bucket_aggregates_sql(query, keys, hash_cols, kinds, width, parents))
+            server_agg = {int(r[0]): (int(r[1]), int(r[2] or 0), int(r[3] or 0)) for r in cursor.fetchall()}
+            file_agg = _file_aggregates(key_h, s1, s2, width, parents)
+            levels += 1
+            buckets_compared += len(set(server_agg) | set(file_agg))
+            if total_sql is None:
+                total_sql = sum(v[0] for v in server_agg.values())
+
+            diff, diff_rows = _differing(server_agg, file_agg)
+            equal_rows += sum(v[0] for b, v in file_agg.items() if b not in diff)
+            print(f"  [Checksum] level {levels}: {len(diff)} of {len(set(server_agg) | set(file_agg))}"
+                  f" buckets differ ({diff_rows} rows)")
+
+            if diff_rows > MAX_DIFF_FRACTION * max(total_sql, len(df_file)) or len(diff) > MAX_IN_LIST:
+                fallback = True
+                break
+            if not diff or diff_rows <= LEAF_ROWS or width < FANOUT or len(diff) * FANOUT > MAX_IN_LIST:
+                break
+            # Rows under the differing buckets are re-counted at the next level
+            width, parents = width // FANOUT, diff
+
+        projected = sql_cols if sql_columns is not None else None
+        if fallback:
+            equal_rows = 0
+            df_sql = pd.read_sql(f"SELECT {_select_list(projected)} FROM {_derived(query)}", conn)
+            file_part = df_file
+        elif diff:
+            df_sql = pd.read_sql(leaf_rows_sql(query, keys, kinds, width, diff, projected), conn)
+            leaf = np.isin((key_h // np.uint64(width)).astype(np.int64), list(diff))
+            file_part = df_file[leaf]
+        else:
+            df_sql = pd.DataFrame({c: pd.Series(dtype=object) for c in sql_cols})
+            file_part = df_file.iloc[0:0]
+    finally:
+        conn.close()
+
+    observe_sql_fetch(len(df_sql))
+    df_sql = df_sql[[c for c in sql_cols if c in df_sql.columns]]
+    result_df, summary = run_hybrid_comparison(df_sql, file_part, keys, file_name=file_name)
+
+    summary['total_sql_rows'] = int(total_sql)
+    summary['total_file_rows'] = len(df_file)
+    summary['matched_rows'] += int(equal_rows)
+    summary['comparison_mode'] = "Checksum Bisection" + (" (full fetch)" if fallback else "")
+    summary['checksum'] = {
+        "levels": levels,
+        "buckets_compared": buckets_compared,
+        "sql_rows_fetched": len(df_sql),
+        "file_rows_compared": len(file_part),
+        "full_fetch_fallback": fallback,
+        "decimal_places": DECIMAL_PLACES,
+    }
+    summary['elapsed_seconds'] = round(time.time() - t_start, 2)
+    return result_df, summary
@@ -6,10 +6,15 @@ Key-based + hash-based order-independent comparison for SQL-to-File reconciliati
 import pandas as pd
 import numpy as np
 import re
+import math
 import time
 from collections import Counter
 from datetime import date, datetime
 
+from common.memory_utils import record_stage, process_rss_mb, ARROW_STRING
+from common.result_layout import encode_mask, expand, MASK_COL, FILE_PREFIX
+from common import fingerprint as fp
+
 
 # ---------------------------------------------------------------------------
 # Maximum number of unmatched rows (per side) that will go through the
@@ -19,6 +24,9 @@ from datetime import date, datetime
 # ---------------------------------------------------------------------------
 MAX_PAIR_SIZE = 5000
 
+# Two-sided 95 % normal quantile for sample-mode confidence intervals
+Z_95 = 1.96
+
 
 # ============================== Normalisation ==============================
 
@@ -32,8 +40,11 @@ def normalize_series_for_comparison(s):
     - Whitespace trimming
     - NaN / None placeholders
     """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return _on_categories(s, normalize_series_for_comparison)
+
     def norm(val):
-        if val is None or (isinstance(val, float) and np.isnan(val)):
+        if val is None or val is pd.NA or (isinstance(val, float) and np.isnan(val)):
             return '__NULL__'
 
         s_val = str(val).strip()
@@ -77,6 +88,9 @@ def _fast_normalize_series(s):
     but uses bulk pandas string operations instead of per-cell Python calls.
     ~10-30x faster on 1M rows.
     """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return _on_categories(s, _fast_normalize_series)
+
     # Convert everything to string, strip whitespace
     out = s.astype(str).str.strip()
 
@@ -101,6 +115,15 @@ def _fast_normalize_series(s):
     return out
 
 
+def _on_categories(s, normalize):
+    """Normalise a dictionary-encoded (category) column: each category once,
+    then expand by code (-1 = null) instead of normalising every cell."""
+    cats = normalize(pd.Series(s.cat.categories.astype(object), dtype=object))
+    null_val = normalize(pd.Series([None], dtype=object)).iloc[0]
+    values = np.append(cats.to_numpy(dtype=object), null_val)
+    return pd.Series(values[s.cat.codes.to_numpy()], index=s.index).astype(str)
+
+
 def _clean_display_value(val):
     """Clean a value for display -- strip midnight timestamps, tidy numbers."""
     if val is None or (isinstance(val, float) and np.isnan(val)):
@@ -120,6 +143,57 @@ def _clean_display_value(val):
 
 # ========================= Pre / Post Transform ===========================
 
+def _display_values(s):
+    """_clean_display_value() of every cell, computed once per distinct value."""
+    values = s.astype(object).to_numpy()
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    cleaned = np.array([_clean_display_value(v) for v in uniques] + [''], dtype=object)
+    # code -1 (null) picks the trailing '' slot
+    return cleaned[codes]
+
+
+def compact_result(diff_df, key_cols, common_cols):
+    """Side-by-side discrepancies (key, {col}_sql, {col}_file, status) -> the
+    compact stored result layout (common/result_layout.py).
+
+    One row per discrepancy.  Mismatched columns are detected on the Mismatch
+    rows column by column: identical text is equal, and only the differing
+    cells are normalised.  The right-side display value is kept only where it
+    differs from the left one.
+    """
+    n = len(diff_df)
+    status = diff_df['status'].to_numpy(dtype=object) if n else np.empty(0, dtype=object)
+    only_file = status == 'Only in File'
+    mm_rows = np.flatnonzero(status == 'Mismatch')
+
+    out = {k: diff_df[k].reset_index(drop=True) for k in key_cols}
+    out['status'] = pd.Series(status, dtype=object)
+    bits = np.zeros((n, len(common_cols)), dtype=bool)
+    file_values = {}
+    for j, col in enumerate(common_cols):
+        v_sql = diff_df[f'{col}_sql'].reset_index(drop=True)
+        v_file = diff_df[f'{col}_file'].reset_index(drop=True)
+        left = _display_values(v_sql)
+        right = _display_values(v_file)
+        out[col] = pd.Series(np.where(only_file, right, left), dtype=ARROW_STRING)
+
+        if len(mm_rows):
+            v1, v2 = v_sql.take(mm_rows), v_file.take(mm_rows)
+            differs = v1.astype(str).to_numpy(dtype=object) != v2.astype(str).to_numpy(dtype=object)
+            if differs.any():
+                n1 = normalize_series_for_comparison(v1[differs]).to_numpy()
+                n2 = normalize_series_for_comparison(v2[differs]).to_numpy()
+                bits[mm_rows[differs], j] = n1 != n2
+            shown = np.zeros(n, dtype=bool)
+            shown[mm_rows] = right[mm_rows] != left[mm_rows]
+            if shown.any():
+                file_values[FILE_PREFIX + col] = pd.Series(np.where(shown, right, None), dtype=ARROW_STRING)
+
+    out[MASK_COL] = encode_mask(bits)
+    out.update(file_values)
+    return pd.DataFrame(out)
+
+
 def transform_to_pre_post(diff_df, key_cols, common_cols, sql_label='SQL', file_label='File'):
     """Transform side-by-side _sql/_file columns into stacked source rows.
 
@@ -128,52 +202,11 @@ def transform_to_pre_post(diff_df, key_cols, common_cols, sql_label='SQL', file_
     For Only in File:   1 row  (source=file_label)
 
     sql_label / file_label control the value in the 'source' column,
-    e.g. 'SQL' and 'test@diff.xlsx'.
+    e.g. 'SQL' and 'test@diff.xlsx'.  Results are stored compactly
+    (compact_result); this is the same expansion the result pages use.
     """
-    rows = []
-
-    for _, row in diff_df.iterrows():
-        status = row.get('status', '')
-
-        # Identify which columns have value mismatches
-        mismatch_cols = []
-        if status == 'Mismatch':
-            for col in common_cols:
-                raw_sql  = row.get(f'{col}_sql', '__NA__')
-                raw_file = row.get(f'{col}_file', '__NA__')
-                n1 = normalize_series_for_comparison(pd.Series([raw_sql])).iloc[0]
-                n2 = normalize_series_for_comparison(pd.Series([raw_file])).iloc[0]
-                if n1 != n2:
-                    mismatch_cols.append(col)
-
-        mismatch_str = ','.join(mismatch_cols)
-
-        # SQL row
-        if status in ('Mismatch', 'Only in SQL'):
-            pre = {k: row.get(k, '') for k in key_cols}
-            for col in common_cols:
-                pre[col] = _clean_display_value(row.get(f'{col}_sql', row.get(col, '')))
-            pre['source'] = sql_label
-            pre['status'] = status
-            pre['_mismatch_cols'] = mismatch_str
-            rows.append(pre)
-
-        # File row
-        if status in ('Mismatch', 'Only in File'):
-            post = {k: row.get(k, '') for k in key_cols}
-            for col in common_cols:
-                post[col] = _clean_display_value(row.get(f'{col}_file', row.get(col, '')))
-            post['source'] = file_label
-            post['status'] = status
-            post['_mismatch_cols'] = mismatch_str
-            rows.append(post)
-
-    if not rows:
-        return pd.DataFrame(columns=key_cols + common_cols + ['source', 'status', '_mismatch_cols'])
-
-    result = pd.DataFrame(rows)
-    ordered = [c for c in key_cols + common_cols + ['source', 'status', '_mismatch_cols'] if c in result.columns]
-    return result[ordered]
+    return expand(compact_result(diff_df, key_cols, common_cols), key_cols, common_cols,
+                  sql_label, file_label)
 
 
 # =================== Smart Fingerprint Comparison ==========================
@@ -187,20 +220,41 @@ def _compute_normalized_frame(df, cols):
     return nf
 
 
-def _smart_no_key_comparison(df_sql, df_file, common_cols):
+def _prepared_file_side(df_file, common_cols, file_normalized, file_fingerprints):
+    """(normalised frame, fingerprints) for the file side from upload prework,
+    or (None, None) when it does not line up with *df_file* / *common_cols*."""
+    if (file_normalized is None or len(file_normalized) != len(df_file)
+            or any(c not in file_normalized.columns for c in common_cols)):
+        return None, None
+    norm = file_normalized[common_cols].set_axis(df_file.index)
+    hashes = None
+    if (file_fingerprints is not None and list(file_normalized.columns) == common_cols
+            and file_fingerprints.shape == (len(df_file), 2)):
+        hashes = file_fingerprints
+    return norm, hashes
+
+
+def _smart_no_key_comparison(df_sql, df_file, common_cols, stages=None,
+                             file_normalized=None, file_fingerprints=None):
     """Intelligent comparison without primary keys.
 
     Algorithm
     ---------
-    1.  Normalise every cell and compute a hash fingerprint per row.
-    2.  Multiset exact-match elimination  (handles duplicate rows correctly).
+    1.  Normalise every cell and compute a 128-bit fingerprint per row
+        (common/fingerprint.py).
+    2.  Multiset exact-match elimination  (handles duplicate rows correctly);
+        with fingerprint_verify the normalised values of every matched pair
+        are compared as well, so a hash collision cannot hide a difference.
     3.  For the remaining unmatched rows, build a column-level similarity
         matrix and greedily pair the best matches (threshold >= 30 % cols).
     4.  Paired rows  ->  Mismatch.
         Unpaired SQL  ->  Only in SQL.
         Unpaired File ->  Only in File.
 
-    Returns (diff_df, matched_count).
+    file_normalized / file_fingerprints: optional file-side prework from the
+    upload (module_1/upload_ingest.py), used when it lines up.
+
+    Returns (diff_df, matched_count, pairing_skipped, fingerprint report).
     diff_df columns: {col}_sql, {col}_file, status, has_mismatch, Match#
     """
     t0 = time.time()
@@ -208,42 +262,39 @@ def _smart_no_key_comparison(df_sql, df_file, common_cols):
 
     # ---- Step 1: normalise + fingerprint ----
     sql_norm  = _compute_normalized_frame(df_sql, common_cols)
-    file_norm = _compute_normalized_frame(df_file, common_cols)
-
-    sql_hashes  = pd.util.hash_pandas_object(sql_norm, index=False)
-    file_hashes = pd.util.hash_pandas_object(file_norm, index=False)
-
-    print(f"  [Fingerprint] Hashed {len(df_sql)} SQL + {len(df_file)} File rows in {time.time()-t0:.2f}s")
+    file_norm, file_hashes = _prepared_file_side(df_file, common_cols, file_normalized, file_fingerprints)
+    reused = 'prepared' if file_hashes is not None else 'normalised' if file_norm is not None else None
+    if file_norm is None:
+        file_norm = _compute_normalized_frame(df_file, common_cols)
+
+    sql_stats, file_stats = {}, {}
+    sql_hashes = fp.fingerprint_frame(sql_norm, stats=sql_stats)
+    if file_hashes is None:
+        file_hashes = fp.fingerprint_frame(file_norm, stats=file_stats)
+    report = fp.merge_stats(sql_stats, file_stats)
+    record_stage(stages, 'normalized', sql_norm, file_norm)
+
+    print(f"  [Fingerprint] Hashed {len(df_sql)} SQL + {len(df_file)} File rows in {time.time()-t0:.2f}s"
+          f" (128-bit, {report.get('mb_per_second')} MB/s on {report.get('threads')} threads)"
+          + (f" (file side {reused} at upload)" if reused else ""))
 
     # ---- Step 2: multiset exact-match elimination ----
     t1 = time.time()
+    pos_sql, pos_file, collisions = _exact_pairs(sql_norm, file_norm, sql_hashes, file_hashes)
+    report.update(verified=fp.VERIFY, collisions=collisions)
 
-    sql_hash_groups  = {}
-    for idx, h in zip(df_sql.index, sql_hashes):
-        sql_hash_groups.setdefault(h, []).append(idx)
-
-    file_hash_groups = {}
-    for idx, h in zip(df_file.index, file_hashes):
-        file_hash_groups.setdefault(h, []).append(idx)
-
-    sql_matched  = set()
-    file_matched = set()
-
-    for h, sql_idxs in sql_hash_groups.items():
-        if h in file_hash_groups:
-            file_idxs = file_hash_groups[h]
-            pairs = min(len(sql_idxs), len(file_idxs))
-            sql_matched.update(sql_idxs[:pairs])
-            file_matched.update(file_idxs[:pairs])
-
-    matched_count = len(sql_matched)
-
-    sql_unmatched_idxs  = [i for i in df_sql.index  if i not in sql_matched]
-    file_unmatched_idxs = [i for i in df_file.index if i not in file_matched]
+    matched_count = len(pos_sql)
+    sql_left = np.ones(len(df_sql), dtype=bool)
+    sql_left[pos_sql] = False
+    file_left = np.ones(len(df_file), dtype=bool)
+    file_left[pos_file] = False
+    sql_unmatched_idxs  = df_sql.index[sql_left].tolist()
+    file_unmatched_idxs = df_file.index[file_left].tolist()
 
     print(f"  [Match]  {matched_count} exact matches eliminated, "
           f"{len(sql_unmatched_idxs)} SQL + {len(file_unmatched_idxs)} File "
-          f"unmatched in {time.time()-t1:.2f}s")
+          f"unmatched in {time.time()-t1:.2f}s"
+          + (f" ({collisions} fingerprint collisions rejected)" if collisions else ""))
 
     # ---- Step 3: similarity-based pairing ----
     paired = []
@@ -343,69 +394,341 @@ def _smart_no_key_comparison(df_sql, df_file, common_cols):
         diff_df = pd.DataFrame(rows)
 
     print(f"  [Done]   Smart comparison finished in {time.time()-t0:.2f}s total")
-    return diff_df, matched_count, pairing_skipped
+    return diff_df, matched_count, pairing_skipped, report
+
+
+def _exact_pairs(norm_a, norm_b, fp_a, fp_b):
+    """Multiset exact matches of two sides by fingerprint (n-th copy of a row
+    with its n-th copy), checked against the normalised values when
+    fingerprint_verify is on.  Returns (pos_a, pos_b, rejected collisions)."""
+    codes_a, codes_b = fp.match_codes(fp_a, fp_b)
+    pos_a, pos_b = fp.exact_match_pairs(codes_a, codes_b)
+    collisions = 0
+    if fp.VERIFY:
+        ok = fp.verify_pairs(norm_a, norm_b, pos_a, pos_b)
+        collisions = int((~ok).sum())
+        pos_a, pos_b = pos_a[ok], pos_b[ok]
+    return pos_a, pos_b, collisions
+
+
+def row_fingerprints(df, cols):
+    """128-bit fingerprint per row ((n, 2) uint64) of the normalised values of *cols*."""
+    return fp.fingerprint_frame(_compute_normalized_frame(df, cols))
+
+
+def split_exact_matches(df_sql, df_file, common_cols):
+    """Multiset exact-match elimination without the pairing step.
+
+    Rows whose normalised values are identical are matched occurrence by
+    occurrence (k copies on one side match at most k on the other).
+    Returns (sql_unmatched, file_unmatched, matched_count).
+    Used to shrink partitions before a final smart comparison.
+    """
+    norm_sql  = _compute_normalized_frame(df_sql, common_cols)
+    norm_file = _compute_normalized_frame(df_file, common_cols)
+    pos_sql, pos_file, _ = _exact_pairs(norm_sql, norm_file,
+                                        fp.fingerprint_frame(norm_sql), fp.fingerprint_frame(norm_file))
+
+    sql_hit = np.zeros(len(df_sql), dtype=bool)
+    sql_hit[pos_sql] = True
+    file_hit = np.zeros(len(df_file), dtype=bool)
+    file_hit[pos_file] = True
+    return df_sql[~sql_hit], df_file[~file_hit], len(pos_sql)
 
 
 # ====================== Key-Based Comparison ================================
 
-def _key_based_comparison(df_sql, df_file, keys):
-    """Standard key-based comparison via pd.merge outer join."""
-    print(f"  Key-Based Comparison: {keys}")
+def _strip_key(s):
+    return s.astype(str).str.strip()
+
+
+def _key_codes(sql_keys, file_keys):
+    """Shared int64 codes for the composite keys of both sides.
+
+    Each key column is factorised over both sides together (sorted, so code
+    order = lexicographic key order, the order pd.merge would produce); the
+    per-column codes are combined mixed-radix and re-densified after every
+    column, so the code space never exceeds the row count.
+    Returns (sql_codes, file_codes).
+    """
+    n = len(sql_keys)
+    codes = None
+    for key in sql_keys.columns:
+        both = pd.concat([sql_keys[key], file_keys[key]], ignore_index=True)
+        col_codes, uniques = pd.factorize(both, sort=True, use_na_sentinel=False)
+        col_codes = col_codes.astype(np.int64)
+        if codes is None:
+            codes = col_codes
+        else:
+            codes, _ = pd.factorize(codes * len(uniques) + col_codes, sort=True)
+    return codes[:n], codes[n:]
+
 
-    for key in keys:
-        if key in df_sql.columns:
-            df_sql[key] = df_sql[key].astype(str).str.strip()
-        if key in df_file.columns:
-            df_file[key] = df_file[key].astype(str).str.strip()
+def _join_positions(sql_codes, file_codes):
+    """Outer join on codes with sort/searchsorted.
 
-    merged_df = pd.merge(
-        df_sql, df_file, on=keys, how='outer',
-        suffixes=('_sql', '_file'), indicator=True)
+    Returns (pair_sql, pair_file, sql_only, file_only) as position arrays.
+    A code present k times on one side and j times on the other would yield
+    k*j pairs -- callers make codes unique per side first (_pair_positions).
+    """
+    order = np.argsort(file_codes, kind='stable')
+    sorted_codes = file_codes[order]
+    lo = np.searchsorted(sorted_codes, sql_codes, 'left')
+    counts = np.searchsorted(sorted_codes, sql_codes, 'right') - lo
+
+    pair_sql = np.repeat(np.arange(len(sql_codes)), counts)
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    pair_file = order[starts + np.arange(len(pair_sql))]
+
+    seen = np.zeros(len(file_codes), dtype=bool)
+    seen[pair_file] = True
+    return pair_sql, pair_file, np.flatnonzero(counts == 0), np.flatnonzero(~seen)
+
+
+def _occurrence(codes):
+    """0-based occurrence number of each element among equal codes, in order."""
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    run_start = np.repeat(starts, np.diff(np.r_[starts, len(codes)]))
+    occ = np.empty(len(codes), dtype=np.int64)
+    occ[order] = np.arange(len(codes)) - run_start
+    return occ
+
+
+def _pair_by_occurrence(sql_codes, file_codes):
+    """Join where the k-th row of a code on one side pairs with the k-th row
+    of that code on the other (a multiset join: never more pairs than rows)."""
+    # Re-densify first so code * width cannot overflow int64
+    dense = pd.factorize(np.concatenate([sql_codes, file_codes]))[0].astype(np.int64)
+    sql_codes, file_codes = dense[:len(sql_codes)], dense[len(sql_codes):]
+    occ_sql, occ_file = _occurrence(sql_codes), _occurrence(file_codes)
+    width = int(max(occ_sql.max(initial=0), occ_file.max(initial=0))) + 1
+    return _join_positions(sql_codes * width + occ_sql, file_codes * width + occ_file)
+
+
+def _duplicate_stats(codes):
+    """(keys occurring more than once, rows carrying such keys, mask of those rows)."""
+    counts = np.bincount(codes) if len(codes) else np.zeros(0, dtype=np.int64)
+    dup_rows = counts[codes] > 1
+    return int((counts > 1).sum()), int(dup_rows.sum()), dup_rows
+
+
+def _pair_positions(df_sql, df_file, sql_codes, file_codes, common_cols):
+    """Match rows of both sides on key codes without a cartesian product.
+
+    Unique keys join 1:1.  Rows whose key is duplicated (on either side) are
+    paired the way the fingerprint engine eliminates multisets: identical
+    rows (same key + same normalised values) first, then the rest by
+    occurrence order within the key.  Returns (pair_sql, pair_file,
+    sql_only, file_only, duplicates) -- duplicates is the summary report.
+    """
+    sql_dup_keys, sql_dup_rows, sql_dup = _duplicate_stats(sql_codes)
+    file_dup_keys, file_dup_rows, file_dup = _duplicate_stats(file_codes)
+    duplicates = {"sql_keys": sql_dup_keys, "sql_rows": sql_dup_rows,
+                  "file_keys": file_dup_keys, "file_rows": file_dup_rows}
+    if not sql_dup_keys and not file_dup_keys:
+        return _join_positions(sql_codes, file_codes) + (duplicates,)
+
+    print(f"  [Keys]   Duplicate keys: {sql_dup_keys} in SQL ({sql_dup_rows} rows), "
+          f"{file_dup_keys} in File ({file_dup_rows} rows) -- pairing by fingerprint/occurrence")
+
+    # Rows of a key that is duplicated on either side take the multiset path
+    n_codes = int(max(sql_codes.max(initial=-1), file_codes.max(initial=-1))) + 1
+    dup_code = np.zeros(n_codes, dtype=bool)
+    dup_code[sql_codes[sql_dup]] = True
+    dup_code[file_codes[file_dup]] = True
+    sql_multi = np.flatnonzero(dup_code[sql_codes])
+    file_multi = np.flatnonzero(dup_code[file_codes])
+    sql_single = np.flatnonzero(~dup_code[sql_codes])
+    file_single = np.flatnonzero(~dup_code[file_codes])
+
+    # 1. Unique keys: plain 1:1 join
+    s_pairs, f_pairs, s_only, f_only = _join_positions(sql_codes[sql_single], file_codes[file_single])
+    pair_sql, pair_file = [sql_single[s_pairs]], [file_single[f_pairs]]
+    sql_only, file_only = [sql_single[s_only]], [file_single[f_only]]
+
+    # 2. Duplicated keys, identical rows: pair on (key, row fingerprint)
+    row_sql, row_file = fp.match_codes(row_fingerprints(df_sql.iloc[sql_multi], common_cols),
+                                       row_fingerprints(df_file.iloc[file_multi], common_cols))
+    n_rows = int(max(row_sql.max(initial=-1), row_file.max(initial=-1))) + 1
+    s_pairs, f_pairs, s_rest, f_rest = _pair_by_occurrence(
+        sql_codes[sql_multi] * n_rows + row_sql,
+        file_codes[file_multi] * n_rows + row_file)
+    pair_sql.append(sql_multi[s_pairs])
+    pair_file.append(file_multi[f_pairs])
+
+    # 3. Duplicated keys, remaining rows: pair by occurrence order within the key
+    sql_rest, file_rest = sql_multi[s_rest], file_multi[f_rest]
+    s_pairs, f_pairs, s_only, f_only = _pair_by_occurrence(sql_codes[sql_rest], file_codes[file_rest])
+    pair_sql.append(sql_rest[s_pairs])
+    pair_file.append(file_rest[f_pairs])
+    sql_only.append(sql_rest[s_only])
+    file_only.append(file_rest[f_only])
+
+    return (np.concatenate(pair_sql), np.concatenate(pair_file),
+            np.sort(np.concatenate(sql_only)), np.sort(np.concatenate(file_only)), duplicates)
+
+
+def _take(s, positions):
+    """Values of *s* at *positions* (-1 = missing), as a fresh Series."""
+    return pd.Series(pd.api.extensions.take(s.array, positions, allow_fill=True), name=s.name)
+
+
+def _key_based_comparison(df_sql, df_file, keys, stages=None):
+    """Key-based comparison: factorised int64 key join.
+    Duplicate keys are paired as multisets (see _pair_positions), so the
+    output never exceeds the input size.
+
+    Keys are compared as stripped strings (as before).  Matched, SQL-only and
+    File-only positions come from numpy sort/searchsorted on shared key codes;
+    values are compared on the matched pairs column by column, and the wide
+    side-by-side frame (merge layout: key, col_sql, col_file, ...) is built
+    only for the discrepant rows.
+    """
+    print(f"  Key-Based Comparison: {keys}")
+
+    sql_keys = pd.DataFrame({k: _strip_key(df_sql[k]) for k in keys})
+    file_keys = pd.DataFrame({k: _strip_key(df_file[k]) for k in keys})
+    sql_codes, file_codes = _key_codes(sql_keys, file_keys)
 
     key_cols = keys
     common_cols = [c for c in df_sql.columns
                    if c in df_file.columns and c not in keys]
+    pair_sql, pair_file, sql_only, file_only, duplicates = _pair_positions(
+        df_sql, df_file, sql_codes, file_codes, common_cols)
 
-    merged_df['has_mismatch'] = False
+    # Identical text implies identical normalised values (normalisation is a
+    # function of str(value)), so only differing cells are normalised
+    mismatch = np.zeros(len(pair_sql), dtype=bool)
     for col in common_cols:
-        mask_both = merged_df['_merge'] == 'both'
-        s1 = normalize_series_for_comparison(merged_df.loc[mask_both, f'{col}_sql'])
-        s2 = normalize_series_for_comparison(merged_df.loc[mask_both, f'{col}_file'])
-        merged_df.loc[mask_both & (s1 != s2), 'has_mismatch'] = True
-
-    final = merged_df[
-        (merged_df['_merge'] != 'both') | (merged_df['has_mismatch'])
-    ].copy()
-
-    status_map = {
-        'left_only':  'Only in SQL',
-        'right_only': 'Only in File',
-        'both':       'Mismatch'
+        v1 = df_sql[col].take(pair_sql)
+        v2 = df_file[col].take(pair_file)
+        differs = v1.astype(str).to_numpy(dtype=object) != v2.astype(str).to_numpy(dtype=object)
+        if differs.any():
+            s1 = normalize_series_for_comparison(v1[differs])
+            s2 = normalize_series_for_comparison(v2[differs])
+            mismatch[differs] |= s1.to_numpy() != s2.to_numpy()
+
+    # ---- Discrepant rows only, in merge order (key, SQL row, File row) ----
+    n_mm = int(mismatch.sum())
+    sql_pos = np.concatenate([pair_sql[mismatch], sql_only, np.full(len(file_only), -1)])
+    file_pos = np.concatenate([pair_file[mismatch], np.full(len(sql_only), -1), file_only])
+    codes = np.concatenate([sql_codes[pair_sql[mismatch]], sql_codes[sql_only], file_codes[file_only]])
+    order = np.lexsort((file_pos, sql_pos, codes))
+    sql_pos, file_pos = sql_pos[order], file_pos[order]
+
+    out = {}
+    for col in df_sql.columns:
+        if col in keys:
+            k = _take(sql_keys[col], sql_pos)
+            out[col] = k.where(sql_pos >= 0, _take(file_keys[col], file_pos))
+        else:
+            out[f'{col}_sql' if col in common_cols else col] = _take(df_sql[col], sql_pos)
+    for col in df_file.columns:
+        if col not in keys:
+            out[f'{col}_file' if col in common_cols else col] = _take(df_file[col], file_pos)
+    final = pd.DataFrame(out)
+
+    final['has_mismatch'] = (sql_pos >= 0) & (file_pos >= 0)
+    final['status'] = np.select([final['has_mismatch'].to_numpy(), sql_pos >= 0],
+                                ['Mismatch', 'Only in SQL'], 'Only in File')
+    record_stage(stages, 'discrepant', final)
+
+    matched = len(pair_sql) - n_mm
+    return final, key_cols, common_cols, matched, duplicates
+
+
+# ========================= Sample Estimates ================================
+
+def _scaled_count(n, p):
+    """Full-table estimate of a count seen *n* times in a key sample taken with
+    probability *p* (Horvitz-Thompson: est = n/p, var = n(1-p)/p^2)."""
+    est = n / p
+    if n == 0:
+        # "rule of three": 95 % upper bound when nothing was observed
+        return {"estimate": 0, "ci_low": 0, "ci_high": int(math.ceil(3 * (1 - p) / p))}
+    half = Z_95 * math.sqrt(n * (1 - p)) / p
+    return {"estimate": int(round(est)), "ci_low": int(max(n, math.floor(est - half))),
+            "ci_high": int(math.ceil(est + half))}
+
+
+def _wilson_interval(hits, n):
+    """95 % Wilson score interval of a proportion."""
+    if n == 0:
+        return 0.0, 1.0
+    phat = hits / n
+    denom = 1 + Z_95 ** 2 / n
+    centre = (phat + Z_95 ** 2 / (2 * n)) / denom
+    half = Z_95 * math.sqrt(phat * (1 - phat) / n + Z_95 ** 2 / (4 * n * n)) / denom
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+def _sample_estimates(summary, fraction):
+    """Estimated full-table counts (with 95 % intervals) from a key-sampled run."""
+    estimates = {field: _scaled_count(summary[field], fraction)
+                 for field in ('total_sql_rows', 'total_file_rows', 'matched_rows',
+                               'mismatches', 'only_on_sql', 'only_on_file')}
+
+    keys_seen = (summary['matched_rows'] + summary['mismatches']
+                 + summary['only_on_sql'] + summary['only_on_file'])
+    bad = summary['mismatches'] + summary['only_on_sql'] + summary['only_on_file']
+    low, high = _wilson_interval(bad, keys_seen)
+    return {
+        "fraction": fraction,
+        "sampled_keys": keys_seen,
+        "estimates": estimates,
+        "discrepancy_rate": {"estimate": round(bad / keys_seen, 6) if keys_seen else 0.0,
+                             "ci_low": round(low, 6), "ci_high": round(high, 6)},
     }
-    final['status'] = final['_merge'].map(status_map)
-    final.drop(columns=['_merge'], inplace=True, errors='ignore')
-
-    matched = len(merged_df) - len(final)
-    return final, key_cols, common_cols, matched
 
 
 # ========================== Public Entry Point ==============================
 
-def run_hybrid_comparison(df_sql, df_file, keys=None, file_name='File'):
-    """Compare two DataFrames and return (pre_post_df, summary).
+def _finish_memory_report(stages, result_df):
+    """Add the result size and process RSS (where the platform reports it)."""
+    record_stage(stages, 'result', result_df)
+    rss = process_rss_mb()
+    if rss is not None:
+        stages['process_rss'] = rss
+    return stages
+
+
+def run_hybrid_comparison(df_sql, df_file, keys=None, file_name='File', sql_label='SQL',
+                          sample_fraction=None, memory=None, file_normalized=None, file_fingerprints=None):
+    """Compare two DataFrames and return (result_df, summary).
+
+    result_df is the compact result (one row per discrepancy, see
+    common/result_layout.py); expand_result(result_df, summary) gives the
+    stacked pre/post display rows.
 
     When *keys* are provided  -> key-based outer join  (100 % accurate).
     When *keys* are empty     -> smart fingerprint + similarity pairing
                                  (accurate regardless of row order).
 
     file_name is used as the label for the file source column (instead of 'post').
+    sql_label is the label for the left side (another source in SQL-to-SQL /
+    File-to-File); statuses keep their 'Only in SQL' / 'Only in File' names.
+
+    sample_fraction: set when both inputs are the same consistent key sample
+    (quick mode).  Counts stay those of the sample; summary['sample'] holds
+    full-table estimates with 95 % confidence intervals.
+
+    memory: optional {stage: MB} report from the caller (fetch / load stages);
+    the engine adds its own stages and returns it as summary['memory_mb'].
+
+    file_normalized / file_fingerprints: normalised file values (columns named
+    like df_file's, same row order) and row fingerprints over all of them,
+    precomputed at upload.  Used by the fingerprint path when they line up.
     """
     t_start = time.time()
+    stages = dict(memory or {})
+    record_stage(stages, 'engine_inputs', df_sql, df_file)
 
     if keys and len(keys) > 0:
         # ---- Key-Based ----
-        final, key_cols, common_cols, matched = _key_based_comparison(
-            df_sql, df_file, keys)
+        final, key_cols, common_cols, matched, duplicates = _key_based_comparison(
+            df_sql, df_file, keys, stages)
 
         summary = {
             "total_sql_rows":     len(df_sql),
@@ -417,21 +740,28 @@ def run_hybrid_comparison(df_sql, df_file, keys=None, file_name='File'):
             "only_on_file":       int((final['status'] == 'Only in File').sum()),
             "comparison_mode":    "Key-Based",
             "pairing_skipped":    False,
+            "duplicate_keys":     duplicates,
             "key_cols":           key_cols,
             "common_cols":        common_cols,
+            "source_labels":      [sql_label, file_name],
             "elapsed_seconds":    round(time.time() - t_start, 2)
         }
 
-        pre_post_df = transform_to_pre_post(final, key_cols, common_cols, sql_label='SQL', file_label=file_name)
-        return pre_post_df, summary
+        if sample_fraction:
+            summary['sample'] = _sample_estimates(summary, sample_fraction)
+            summary['comparison_mode'] = f"Key-Based (Sampled {sample_fraction:.1%})"
+
+        result_df = compact_result(final, key_cols, common_cols)
+        summary['memory_mb'] = _finish_memory_report(stages, result_df)
+        return result_df, summary
 
     else:
         # ---- Smart Fingerprint ----
         print("Smart Fingerprint Comparison Active")
         common_cols = [c for c in df_sql.columns if c in df_file.columns]
 
-        diff_df, matched, pairing_skipped = _smart_no_key_comparison(
-            df_sql, df_file, common_cols)
+        diff_df, matched, pairing_skipped, fingerprint = _smart_no_key_comparison(
+            df_sql, df_file, common_cols, stages, file_normalized, file_fingerprints)
 
         key_cols = ['Match#']
 
@@ -445,10 +775,13 @@ def run_hybrid_comparison(df_sql, df_file, keys=None, file_name='File'):
             "only_on_file":       int((diff_df['status'] == 'Only in File').sum()) if len(diff_df) > 0 else 0,
             "comparison_mode":    "Smart Fingerprint",
             "pairing_skipped":    pairing_skipped,
+            "fingerprint":        fingerprint,
             "key_cols":           key_cols,
             "common_cols":        common_cols,
+            "source_labels":      [sql_label, file_name],
             "elapsed_seconds":    round(time.time() - t_start, 2)
         }
 
-        pre_post_df = transform_to_pre_post(diff_df, key_cols, common_cols, sql_label='SQL', file_label=file_name)
-        return pre_post_df, summary
+        result_df = compact_result(diff_df, key_cols, common_cols)
+        summary['memory_mb'] = _finish_memory_report(stages, result_df)
+        return result_df, summary
@@ -1,26 +1,44 @@
 """
 Module 1: SQL-to-File Comparison Routes
-Flask Blueprint — handles SQL query, file upload, comparison, results, export.
+Flask Blueprint — handles SQL query, file upload, comparison.
+Paging and export of the stored result live in common/result_routes.py.
 """
 
-from flask import Blueprint, request, send_file
-import pyodbc
-import pandas as pd
+from flask import Blueprint, request
+import os
 import uuid
 
 from common.json_utils import safe_jsonify, sanitize_df_for_json
-from common.db_utils import get_connection_string
-from common.storage_manager import save_df, load_df
+from common.db_utils import fetch_row_count, is_select_only, project_query
+from common.sql_snapshot import fetch_sql_snapshot, find_snapshot, request_options
+from common.storage_manager import load_df, sample_shape
+from common.file_ingest import is_supported
+from common.admission import admitted, estimate_mb, AdmissionRejected, MEMORY_BUDGET_MB
+from common.memory_utils import record_stage
+from common.result_index import store_result
+from common.result_layout import preview
+from common.metrics import observe_comparison
+from common.wire_format import parse_format, table_response
 from common.routes import _touch_activity
 from module_1.comparison_engine import run_hybrid_comparison
+from module_1.checksum_bisect import (run_checksum_comparison, probe_query_columns,
+                                      key_sample_sql, file_key_sample, SAMPLE_MODULUS, MAX_DIFF_FRACTION)
+from module_1.upload_ingest import (staged_path, read_preview, estimate_rows, start_ingest,
+                                    get_ingest_status, wait_for_ingest, load_prepared)
 
 m1_bp = Blueprint('module_1', __name__)
 
+# Keys per thousand compared in sample mode unless the request says otherwise
+DEFAULT_SAMPLE_PER_MILLE = 10
+
 
 @m1_bp.route('/api/preview_sql', methods=['POST'])
 def preview_sql():
     """
     Executes a SQL query and returns columns + top 5 rows.
+    The full result is kept as a snapshot (common/sql_snapshot.py) that a
+    following comparison of the same query reuses; "refresh": true bypasses
+    a fresh snapshot, "snapshot_max_age_minutes" overrides the max age.
     """
     _touch_activity()
     data = request.json
@@ -33,15 +51,16 @@ def preview_sql():
         return safe_jsonify({"error": "Missing parameters"}, 400)
 
     # Basic Safety Check (Prevent modifications)
-    forbidden_keywords = ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'TRUNCATE', 'ALTER', 'GRANT', 'REVOKE', 'EXEC', 'CREATE', 'MERGE']
-    if any(keyword in query.upper() for keyword in forbidden_keywords):
+    if not is_select_only(query):
         return safe_jsonify({"error": "Security Alert: Only SELECT queries are permitted in this environment."}, 403)
-
-    conn_str = get_connection_string(server, database, port)
+    try:
+        refresh, max_age = request_options(data)
+    except ValueError as e:
+        return safe_jsonify({"error": str(e)}, 400)
 
     try:
-        conn = pyodbc.connect(conn_str, timeout=10)
-        df = pd.read_sql(query, conn)
+        df, snapshot = fetch_sql_snapshot(server, database, query, port, refresh=refresh,
+                                          max_age_minutes=max_age, timeout=10)
 
         preview_df = df.head(5)
         columns = list(preview_df.columns)
@@ -52,13 +71,13 @@ def preview_sql():
         if len(df) > 5:
             last_row = sanitize_df_for_json(df.tail(1)).to_dict(orient='records')[0]
 
-        conn.close()
         return safe_jsonify({
             "status": "success",
             "columns": columns,
             "preview_data": rows,
             "row_count_estimate": len(df),
-            "last_row": last_row
+            "last_row": last_row,
+            "snapshot": snapshot
         })
 
     except Exception as e:
@@ -68,7 +87,10 @@ def preview_sql():
 @m1_bp.route('/api/upload_file', methods=['POST'])
 def upload_file():
     """
-    Uploads a file, saves it temp, and returns columns + preview.
+    Uploads a file, stages it on disk and returns columns + preview at once.
+    Parsing, the Parquet write and the exact row count continue in the
+    background (module_1/upload_ingest.py); total_rows is an estimate until
+    /api/upload_status reports "done".
     """
     _touch_activity()
     if 'file' not in request.files:
@@ -81,34 +103,52 @@ def upload_file():
     unique_id = str(uuid.uuid4())
     filename = file.filename
 
-    try:
-        if filename.endswith('.csv'):
-            df = pd.read_csv(file)
-        elif filename.endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(file)
-        else:
-            return safe_jsonify({"error": "Invalid file format. Only CSV or Excel allowed."}, 400)
+    if not is_supported(filename):
+        return safe_jsonify({"error": "Invalid file format. Only CSV, Excel or Parquet allowed."}, 400)
 
-        # Save to Disk Cache FIRST (Parquet handles NaN natively)
-        save_df(df, 'uploads', unique_id)
+    path = staged_path(unique_id, filename)
+    try:
+        file.save(path)
 
         # Build preview (sanitize handles NaN/NaT → '' for JSON safety)
-        preview_df = df.head(5)
-        columns = list(preview_df.columns)
+        preview_df = read_preview(path, filename)
+        columns = [str(c) for c in preview_df.columns]
         rows = sanitize_df_for_json(preview_df).to_dict(orient='records')
+        total_rows = estimate_rows(path, filename)
+    except Exception as e:
+        if os.path.exists(path):
+            os.remove(path)
+        return safe_jsonify({"status": "error", "message": str(e)}, 500)
+
+    try:
+        start_ingest(unique_id, path, filename, source={"filename": filename})
 
         return safe_jsonify({
             "status": "success",
             "file_id": unique_id,
             "columns": columns,
             "preview_data": rows,
-            "total_rows": len(df)
+            "total_rows": total_rows,
+            "total_rows_estimated": True,
+            "ingest_status": "running"
         })
 
     except Exception as e:
         return safe_jsonify({"status": "error", "message": str(e)}, 500)
 
 
+@m1_bp.route('/api/upload_status', methods=['GET'])
+def upload_status():
+    """
+    Background ingestion status of an upload:
+    {"status": "running" | "done" | "error" | "none", "total_rows", "prepared", ...}
+    """
+    file_id = request.args.get('file_id')
+    if not file_id:
+        return safe_jsonify({"error": "Missing file_id"}, 400)
+    return safe_jsonify(dict(get_ingest_status(file_id), file_id=file_id))
+
+
 @m1_bp.route('/api/run_comparison', methods=['POST'])
 def run_comparison():
     """
@@ -117,6 +157,24 @@ def run_comparison():
     2. Retrieves Uploaded File data from Cache.
     3. Runs Hybrid Comparison Engine.
     4. Caches Result.
+    Modes ("mode", keys required for all but standard):
+      - standard : full fetch and compare
+      - checksum : SQL Server aggregates row hashes per key bucket and only
+                   rows of differing buckets are fetched (checksum_bisect.py)
+      - sample   : quick estimate -- only keys whose hash % 1000 is below
+                   "sample_per_mille" (default 10) are fetched and compared;
+                   summary['sample'] holds estimated counts with 95 % CIs
+    Admission (common/admission.py): the job's memory is estimated from the
+    upload metadata and a SQL row count; it then runs, waits in the queue
+    (optional "ticket" -- follow it with /api/comparison_queue) or is
+    rejected.  A standard job with keys that exceeds the memory budget runs
+    in checksum mode instead.  summary['admission'] reports the estimate,
+    the wait and any fallback.
+    SQL snapshots (common/sql_snapshot.py): standard and sample runs reuse a
+    fresh snapshot of the same query (from an earlier run or the preview)
+    instead of querying the server; "refresh": true forces a fetch,
+    "snapshot_max_age_minutes" overrides the max age.  summary['sql_snapshot']
+    tells which was used and its age.
     """
     _touch_activity()
     data = request.json
@@ -128,216 +186,152 @@ def run_comparison():
     keys = data.get('keys', [])
     column_mapping = data.get('column_mapping', [])
     file_name = data.get('file_name', 'File')
+    fmt = parse_format(data.get('format'))
+    mode = data.get('mode', 'standard')
 
     if not file_id or not server or not database or not query:
         return safe_jsonify({"error": "Missing required parameters"}, 400)
-
-    # 1. Retrieve File Data
-    df_file = load_df('uploads', file_id)
-    if df_file is None:
+    if fmt is None:
+        return safe_jsonify({"error": "Invalid format. Use records, columns or arrow."}, 400)
+    if mode not in ('standard', 'checksum', 'sample'):
+        return safe_jsonify({"error": "Invalid mode. Use standard, checksum or sample."}, 400)
+    if mode != 'standard' and not keys:
+        return safe_jsonify({"error": f"{mode.capitalize()} mode needs at least one key column."}, 400)
+    try:
+        sample_k = int(data.get('sample_per_mille', DEFAULT_SAMPLE_PER_MILLE))
+    except (TypeError, ValueError):
+        sample_k = -1
+    if mode == 'sample' and not 1 <= sample_k < SAMPLE_MODULUS:
+        return safe_jsonify({"error": f"sample_per_mille must be between 1 and {SAMPLE_MODULUS - 1}."}, 400)
+    try:
+        refresh, max_age = request_options(data)
+    except ValueError as e:
+        return safe_jsonify({"error": str(e)}, 400)
+
+    # 1. Column mapping; the upload must be ingested
+    sql_columns, mapped_file_cols, rename_map = None, None, {}
+    if column_mapping and len(column_mapping) > 0:
+        rename_map = {m['file']: m['sql'] for m in column_mapping}
+        sql_columns = [m['sql'] for m in column_mapping]
+        mapped_file_cols = [m['file'] for m in column_mapping]
+
+    ingest = wait_for_ingest(file_id, prepared=not keys)
+    if ingest['status'] == 'error':
+        return safe_jsonify({"status": "error", "message": f"File ingestion failed: {ingest['message']}"}, 500)
+    if ingest['status'] == 'running':
+        return safe_jsonify({"error": "File is still being ingested. Please try again shortly."}, 409)
+
+    # 2. Admission: memory estimate from the upload metadata and a SQL row count
+    shape = sample_shape('uploads', file_id, columns=mapped_file_cols)
+    if shape is None:
         return safe_jsonify({"error": "File session expired or invalid. Please re-upload."}, 404)
+    snap = None if refresh else find_snapshot(server, database, query, port, sql_columns, max_age)
+    if snap is not None:
+        sql_rows = snap['rows']
+    else:
+        sql_rows = fetch_row_count(server, database, project_query(query, sql_columns), port)
+    estimate = _estimate_mb(mode, shape, sql_rows, keys, sample_k)
+    fallback = None
+    if estimate > MEMORY_BUDGET_MB and mode == 'standard' and keys:
+        # Lower-memory mode: only rows of differing key buckets are fetched
+        fallback = {"from_mode": "standard", "to_mode": "checksum", "standard_estimated_mb": estimate}
+        mode, estimate = 'checksum', _estimate_mb('checksum', shape, sql_rows, keys, sample_k)
+        print(f"  [Admission] standard mode needs ~{fallback['standard_estimated_mb']:.0f} MB"
+              f" (budget {MEMORY_BUDGET_MB:.0f} MB) -- falling back to checksum mode")
+
+    source = {"module": "sql_to_file", "file_id": file_id, "file_name": file_name,
+              "server": server, "database": database, "query": query}
+    if mode != 'standard':
+        source['mode'] = mode
 
     try:
-        # 2. Fetch Full SQL Data
-        conn_str = get_connection_string(server, database, port)
-        conn = pyodbc.connect(conn_str)
-        df_sql = pd.read_sql(query, conn)
-        conn.close()
-
-        # 3. Apply Column Mapping
-        if column_mapping and len(column_mapping) > 0:
-            rename_map = {m['file']: m['sql'] for m in column_mapping}
-            mapped_sql_cols = [m['sql'] for m in column_mapping]
-            mapped_file_cols = [m['file'] for m in column_mapping]
-
-            df_sql = df_sql[[c for c in mapped_sql_cols if c in df_sql.columns]]
-            df_file = df_file[[c for c in mapped_file_cols if c in df_file.columns]]
-            df_file = df_file.rename(columns=rename_map)
-
-        # 4. Run Logic
-        result_df, summary = run_hybrid_comparison(df_sql, df_file, keys, file_name=file_name)
-
-        # 5. Cache Result
-        result_id = str(uuid.uuid4())
-        save_df(result_df, 'results', result_id)
-
-        # 6. Return Summary + First Page
-        preview_page = sanitize_df_for_json(result_df.head(50)).to_dict(orient='records')
-
-        return safe_jsonify({
-            "status": "success",
-            "result_id": result_id,
-            "summary": summary,
-            "preview_rows": preview_page,
-            "columns": list(result_df.columns)
-        })
-
+        with admitted(estimate, ticket=data.get('ticket'), label=file_name) as admission:
+            if fallback:
+                admission['fallback'] = fallback
+            # Retrieve File Data (only the mapped columns are read)
+            df_file = load_df('uploads', file_id, columns=mapped_file_cols)
+            if df_file is None:
+                return safe_jsonify({"error": "File session expired or invalid. Please re-upload."}, 404)
+
+            # 3. Apply Column Mapping (file side now; the SQL side is projected on the server)
+            if rename_map:
+                df_file = df_file.rename(columns=rename_map)
+
+            if mode == 'checksum':
+                result_df, summary = run_checksum_comparison(
+                    server, database, query, df_file, keys, port,
+                    sql_columns=sql_columns, file_name=file_name)
+                summary['admission'] = admission
+                return _store_and_respond(result_df, summary, fmt, source)
+
+            # 4. Restrict both sides to the same key sample (quick mode)
+            sample_fraction, fetch_columns = None, sql_columns
+            if mode == 'sample':
+                kinds = dict(probe_query_columns(server, database, query, port))
+                df_file = file_key_sample(df_file, keys, kinds, sample_k)
+                query = key_sample_sql(query, keys, kinds, sample_k,
+                                       None if sql_columns is None else [c for c in sql_columns if c in kinds])
+                sample_fraction, fetch_columns = sample_k / SAMPLE_MODULUS, None
+
+            # 5. Fetch SQL Data (mapped columns only), or reuse a fresh snapshot
+            df_sql, snapshot = fetch_sql_snapshot(server, database, query, port, fetch_columns,
+                                                  refresh=refresh, max_age_minutes=max_age)
+            if sql_columns is not None:
+                df_sql = df_sql[[c for c in sql_columns if c in df_sql.columns]]
+            memory = record_stage({}, 'sql_fetched', df_sql)
+            record_stage(memory, 'file_loaded', df_file)
+
+            # 6. Run Logic (the fingerprint path reuses the file-side prework from the upload)
+            file_normalized, file_fingerprints = None, None
+            if not keys:
+                file_normalized, file_fingerprints = load_prepared(file_id, mapped_file_cols)
+                if file_normalized is not None and rename_map:
+                    file_normalized = file_normalized.rename(columns=rename_map)
+            result_df, summary = run_hybrid_comparison(df_sql, df_file, keys, file_name=file_name,
+                                                       sample_fraction=sample_fraction, memory=memory,
+                                                       file_normalized=file_normalized,
+                                                       file_fingerprints=file_fingerprints)
+
+            # 7. Cache Result + Return Summary and First Page
+            summary['admission'] = admission
+            summary['sql_snapshot'] = snapshot
+            return _store_and_respond(result_df, summary, fmt, source)
+
+    except AdmissionRejected as e:
+        message = str(e)
+        if e.status == 413 and not keys:
+            message += " Select key columns so that the lower-memory checksum mode can be used."
+        return safe_jsonify({"status": "error", "message": message, "admission": e.info}, e.status)
     except Exception as e:
         return safe_jsonify({"status": "error", "message": str(e)}, 500)
 
 
-@m1_bp.route('/api/results_page', methods=['GET'])
-def get_results_page():
-    """
-    Pagination for the Data Grid.
-    Query Params: result_id, page (1-based), size (default 100)
-    """
-    result_id = request.args.get('result_id')
-    page = int(request.args.get('page', 1))
-    size = int(request.args.get('size', 100))
-
-    df = load_df('results', result_id)
-    if df is None:
-        return safe_jsonify({"error": "Result cache expired. Run comparison again."}, 404)
-
-    # Calculate slice
-    start = (page - 1) * size
-    end = start + size
-
-    if start >= len(df):
-        return safe_jsonify({"data": [], "page": page, "has_more": False})
-
-    sliced_df = df.iloc[start:end]
-    data = sanitize_df_for_json(sliced_df).to_dict(orient='records')
-
-    return safe_jsonify({
-        "data": data,
-        "page": page,
-        "total_pages": (len(df) // size) + 1,
-        "has_more": end < len(df)
-    })
-
-
-@m1_bp.route('/api/export_excel', methods=['GET'])
-def export_excel():
-    """Generate styled Excel file with color-coded reconciliation results."""
-    from openpyxl import Workbook
-    from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
-    from openpyxl.utils import get_column_letter
-    from io import BytesIO
-
-    result_id = request.args.get('result_id')
-    if not result_id:
-        return safe_jsonify({"error": "Missing result_id"}, 400)
-
-    df = load_df('results', result_id)
-    if df is None:
-        return safe_jsonify({"error": "Result cache expired. Run comparison again."}, 404)
-
-    # Sanitize all cells for display (handles NaT, time objects, etc.)
-    df = sanitize_df_for_json(df)
-
-    # ── Color definitions (match web UI) ──
-    header_fill = PatternFill(start_color='334155', end_color='334155', fill_type='solid')
-    header_font = Font(color='FFFFFF', bold=True, size=10)
-    pre_fill = PatternFill(start_color='FEF9C3', end_color='FEF9C3', fill_type='solid')
-    post_fill = PatternFill(start_color='DCFCE7', end_color='DCFCE7', fill_type='solid')
-    mismatch_cell_fill = PatternFill(start_color='FECACA', end_color='FECACA', fill_type='solid')
-    mismatch_font = Font(bold=True, color='7F1D1D')
-    sql_only_fill = PatternFill(start_color='FDE68A', end_color='FDE68A', fill_type='solid')
-    file_only_fill = PatternFill(start_color='FECDD3', end_color='FECDD3', fill_type='solid')
-    section_title_fill = PatternFill(start_color='F3F4F6', end_color='F3F4F6', fill_type='solid')
-    section_font = Font(bold=True, size=11)
-    thin_border = Border(
-        left=Side(style='thin', color='D1D5DB'),
-        right=Side(style='thin', color='D1D5DB'),
-        top=Side(style='thin', color='D1D5DB'),
-        bottom=Side(style='thin', color='D1D5DB')
-    )
-
-    display_cols = [c for c in df.columns if c != '_mismatch_cols']
-
-    # ── Split data by category ──
-    mismatched = df[df['status'] == 'Mismatch']
-    missing_df = df[df['status'] == 'Only in SQL']
-    extra_df = df[df['status'] == 'Only in File']
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Reconciliation Results"
-
-    def write_section(ws, section_df, title, start_row):
-        """Write a section with title, headers, and colored data rows."""
-        # Section title row
-        ws.merge_cells(start_row=start_row, start_column=1, end_row=start_row, end_column=len(display_cols))
-        cell = ws.cell(row=start_row, column=1, value=title)
-        cell.font = section_font
-        cell.fill = section_title_fill
-        start_row += 1
-
-        # Column headers
-        for ci, col_name in enumerate(display_cols, 1):
-            cell = ws.cell(row=start_row, column=ci, value=col_name)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.border = thin_border
-            cell.alignment = Alignment(horizontal='center')
-        start_row += 1
-
-        # Data rows
-        for _, row in section_df.iterrows():
-            mismatch_cols = [c.strip() for c in str(row.get('_mismatch_cols', '')).split(',') if c.strip()]
-            status = str(row.get('status', ''))
-            source_val = str(row.get('source', ''))
-
-            if status == 'Mismatch':
-                base_fill = pre_fill if source_val == 'SQL' else post_fill
-            elif status == 'Only in SQL':
-                base_fill = sql_only_fill
-            elif status == 'Only in File':
-                base_fill = file_only_fill
-            else:
-                base_fill = None
-
-            for ci, col_name in enumerate(display_cols, 1):
-                val = row.get(col_name, '')
-                cell = ws.cell(row=start_row, column=ci, value=str(val))
-                cell.border = thin_border
-
-                if base_fill:
-                    cell.fill = base_fill
-
-                if col_name in mismatch_cols and status == 'Mismatch':
-                    cell.fill = mismatch_cell_fill
-                    cell.font = mismatch_font
-
-            start_row += 1
-
-        return start_row + 1
-
-    current_row = 1
-
-    if len(mismatched) > 0:
-        current_row = write_section(ws, mismatched, f"Mismatched Rows ({len(mismatched) // 2})", current_row)
-    if len(missing_df) > 0:
-        current_row = write_section(ws, missing_df, f"Missing from File / SQL Only ({len(missing_df)})", current_row)
-    if len(extra_df) > 0:
-        current_row = write_section(ws, extra_df, f"Extra in File / Not in SQL ({len(extra_df)})", current_row)
-
-    if len(df) == 0:
-        ws.cell(row=1, column=1, value="No discrepancies found - data matches perfectly!")
-        ws.cell(row=1, column=1).font = Font(bold=True, size=12, color='16A34A')
-
-    # Auto-width columns
-    for ci, col_name in enumerate(display_cols, 1):
-        col_letter = get_column_letter(ci)
-        max_len = len(str(col_name))
-        for i, (_, row) in enumerate(df.iterrows()):
-            if i >= 100:
-                break
-            val_len = len(str(row.get(col_name, '')))
-            if val_len > max_len:
-                max_len = val_len
-        ws.column_dimensions[col_letter].width = min(max_len + 3, 40)
-
-    # Save to memory and return
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=f'reconciliation_{result_id[:8]}.xlsx'
-    )
+def _estimate_mb(mode, shape, sql_rows, keys, sample_k):
+    """Memory estimate of a comparison from the upload's sample_shape() and
+    the SQL row count (None when it could not be counted: taken as the file's)."""
+    file_rows, n_cols, width = shape
+    if sql_rows is None:
+        sql_rows = file_rows
+    if mode == 'checksum':
+        # The file is hashed whole; SQL rows come only from differing buckets
+        # (beyond MAX_DIFF_FRACTION the bisection fetches everything)
+        rows = file_rows + MAX_DIFF_FRACTION * max(sql_rows, file_rows)
+    elif mode == 'sample':
+        rows = (file_rows + sql_rows) * sample_k / SAMPLE_MODULUS
+    else:
+        rows = file_rows + sql_rows
+    return estimate_mb(rows, width, n_cols, 'key' if keys else 'fingerprint')
+
+
+def _store_and_respond(result_df, summary, fmt, source):
+    """Cache the result (Parquet + paging/filter index) and return the summary
+    with the first page in the requested wire format."""
+    observe_comparison(summary)
+    result_id = store_result(result_df, summary, source=source)
+    preview_df, columns = preview(result_df, summary, 50)
+    return table_response(preview_df, fmt, {
+        "status": "success",
+        "result_id": result_id,
+        "summary": summary,
+        "columns": columns
+    }, rows_key='preview_rows')
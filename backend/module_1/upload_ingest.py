@@ -0,0 +1,297 @@
+"""
+Module 1: Background Upload Ingestion
+upload_file stages the raw file in the upload cache and answers straight away
+with a preview of the first PREVIEW_ROWS rows and a row-count estimate.  A
+background thread then does the slow part:
+  1. full parse (same pandas readers as before) + compact dtypes
+  2. Parquet write and exact row count (uploads/<file_id>.parquet)
+  3. file-side engine prework: the normalised value of every cell and the
+     128-bit row fingerprints over all columns, kept in
+     uploads/<file_id>.prepared.arrow
+The staged file (<file_id>.upload.<ext>) exists until step 2 is done.  The
+job state is a sidecar of the upload (<file_id>.ingest.json, removed once the
+job is done), so every worker process sees the same progress and errors.
+run_comparison waits for the ingestion and hands the prework to the engine.
+"""
+
+import os
+import json
+import time
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from common.storage_manager import (save_df, load_row_index, cache_file_path, sidecar_path,
+                                    coerce_for_parquet)
+from common.memory_utils import compact_df
+from common.file_ingest import iter_file_chunks, SUPPORTED_EXTENSIONS
+from common.admission import pid_alive
+from common.fingerprint import fingerprint_frame
+from module_1.comparison_engine import _compute_normalized_frame
+
+# Rows returned in the upload preview
+PREVIEW_ROWS = 5
+
+# Longest a comparison waits for its upload to finish ingesting
+INGEST_WAIT_SECONDS = 900
+
+# Bytes read from the start of a CSV to estimate its row count
+CSV_SAMPLE_BYTES = 1024 * 1024
+
+JOB_SUFFIX = 'ingest.json'
+PREPARED_SUFFIX = 'prepared.arrow'
+# The two 64-bit halves of the row fingerprint (older sidecars hold a single
+# 64-bit '_fingerprint' column: their normalised values are still used)
+FINGERPRINT_COLS = ('_fingerprint_hi', '_fingerprint_lo')
+LEGACY_FINGERPRINT_COL = '_fingerprint'
+
+_threads = {}                   # file_id -> ingest thread of this process
+_threads_lock = threading.Lock()
+
+
+def staged_path(file_id, filename):
+    """Where the raw upload waits until it has been ingested."""
+    return sidecar_path('uploads', file_id, 'upload' + os.path.splitext(filename)[1].lower())
+
+
+def _staged_file(file_id):
+    for ext in SUPPORTED_EXTENSIONS:
+        path = staged_path(file_id, ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Preview + estimate (request thread)
+# ═══════════════════════════════════════════════════════════════════════════
+
+def read_preview(path, filename):
+    """First PREVIEW_ROWS rows, read without parsing the rest of the file."""
+    with open(path, 'rb') as stream:
+        return next(iter_file_chunks(stream, filename, PREVIEW_ROWS)).head(PREVIEW_ROWS)
+
+
+def estimate_rows(path, filename):
+    """Cheap data-row estimate: CSV from the line density of the first
+    CSV_SAMPLE_BYTES, Excel from the sheet dimensions, Parquet from its
+    footer.  None if unknown."""
+    name = filename.lower()
+    try:
+        if name.endswith('.csv'):
+            size = os.path.getsize(path)
+            with open(path, 'rb') as f:
+                sample = f.read(CSV_SAMPLE_BYTES)
+            lines = sample.count(b'\n') + (0 if sample.endswith(b'\n') or not sample else 1)
+            if size <= len(sample):
+                return max(lines - 1, 0)
+            return max(int(lines * size / len(sample)) - 1, 0)
+        if name.endswith('.xlsx'):
+            from openpyxl import load_workbook
+            wb = load_workbook(path, read_only=True)
+            try:
+                max_row = wb.worksheets[0].max_row
+            finally:
+                wb.close()
+            return None if max_row is None else max(max_row - 1, 0)
+        if name.endswith('.xls'):
+            return max(pd.ExcelFile(path).book.sheet_by_index(0).nrows - 1, 0)
+        if name.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            return pq.ParquetFile(path).metadata.num_rows
+    except Exception:
+        return None
+    return None
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Background ingestion
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _parse(path, filename):
+    name = filename.lower()
+    if name.endswith('.csv'):
+        return pd.read_csv(path)
+    if name.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_excel(path)
+
+
+def _job_path(file_id):
+    return sidecar_path('uploads', file_id, JOB_SUFFIX)
+
+
+def _read_job(file_id):
+    try:
+        with open(_job_path(file_id), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_job(file_id, job):
+    """Atomically replace the job file."""
+    path = _job_path(file_id)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(job, f)
+    os.replace(tmp, path)
+
+
+def _remove_job(file_id):
+    try:
+        os.remove(_job_path(file_id))
+    except OSError:
+        pass
+
+
+def _prepare(file_id, df):
+    """Normalised values + row fingerprints over all columns, as a sidecar."""
+    norm = _compute_normalized_frame(df, list(df.columns))
+    fingerprints = fingerprint_frame(norm)
+    table = pa.Table.from_pandas(norm, preserve_index=False)
+    for i, name in enumerate(FINGERPRINT_COLS):
+        table = table.append_column(name, pa.array(fingerprints[:, i], pa.uint64()))
+    path = sidecar_path('uploads', file_id, PREPARED_SUFFIX)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        feather.write_feather(table, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _run_ingest(file_id, path, filename, source):
+    try:
+        _ingest_and_prepare(file_id, path, filename, source)
+    finally:
+        with _threads_lock:
+            _threads.pop(file_id, None)
+
+
+def _ingest_and_prepare(file_id, path, filename, source):
+    job = _read_job(file_id) or {"status": "running", "started_at": time.time(), "pid": os.getpid()}
+    t0 = time.time()
+    try:
+        # The prework is built from the values as persisted (mixed object
+        # columns become strings), i.e. what the engine reads back otherwise
+        df = coerce_for_parquet(compact_df(_parse(path, filename)))
+        save_df(df, 'uploads', file_id, source=source)
+    except Exception as e:
+        _write_job(file_id, {"status": "error", "message": str(e)})
+        return
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    _write_job(file_id, dict(job, stage='preparing', total_rows=len(df)))
+
+    # The prework is optional: the upload is complete without it and the
+    # engine recomputes what is missing
+    t1 = time.time()
+    try:
+        _prepare(file_id, df)
+        print(f"  [Upload] {filename}: {len(df)} rows ingested in {t1 - t0:.2f}s, "
+              f"prepared in {time.time() - t1:.2f}s")
+    except Exception as e:
+        print(f"  [Upload] {filename}: {len(df)} rows ingested in {t1 - t0:.2f}s, "
+              f"prework skipped: {e}")
+    finally:
+        _remove_job(file_id)
+
+
+def start_ingest(file_id, path, filename, source=None):
+    """Ingest the staged upload at *path* in a background thread."""
+    _write_job(file_id, {"status": "running", "stage": "parsing", "started_at": time.time(),
+                         "pid": os.getpid()})
+    thread = threading.Thread(target=_run_ingest, args=(file_id, path, filename, source), daemon=True)
+    with _threads_lock:
+        _threads[file_id] = thread
+    thread.start()
+    return thread
+
+
+def get_ingest_status(file_id):
+    """
+    {"status": "done" | "running" | "error" | "none", ...} for an upload.
+    "done" carries total_rows and whether the engine prework is ready.
+    """
+    job = _read_job(file_id)
+    if job is not None and job.get('status') == 'running' and not pid_alive(job.get('pid', -1)):
+        if load_row_index('uploads', file_id) is None:
+            job = {"status": "error", "message": "Upload ingestion was interrupted. Please upload the file again."}
+        else:
+            job = None                  # only the optional prework was lost
+    if job is not None and (job.get('status') == 'error' or job.get('stage') == 'parsing'):
+        job.pop('pid', None)
+        return job
+    index = load_row_index('uploads', file_id)
+    if index is not None:
+        return {"status": "done", "total_rows": index['num_rows'],
+                "prepared": os.path.exists(sidecar_path('uploads', file_id, PREPARED_SUFFIX))}
+    if _staged_file(file_id) is not None:
+        return {"status": "running", "stage": "parsing"}
+    return {"status": "none"}
+
+
+def wait_for_ingest(file_id, prepared=False, timeout=INGEST_WAIT_SECONDS):
+    """
+    Block until the upload's Parquet is written (or *timeout*).  Returns the status.
+    prepared=True also waits for the engine prework while it is being computed
+    (cheaper than the engine redoing it alongside).
+    """
+    with _threads_lock:
+        thread = _threads.get(file_id)
+    deadline = time.time() + timeout
+    while True:
+        status = get_ingest_status(file_id)
+        if status['status'] != 'running' and not (prepared and _preparing(file_id)):
+            return status
+        if time.time() >= deadline:
+            return status
+        if thread is not None:
+            thread.join(0.2)
+        else:
+            time.sleep(0.2)
+
+
+def _preparing(file_id):
+    job = _read_job(file_id)
+    return (job is not None and job.get('stage') == 'preparing'
+            and pid_alive(job.get('pid', -1)))
+
+
+def load_prepared(file_id, columns=None):
+    """
+    Engine prework for an upload: (normalised DataFrame, (n, 2) fingerprints).
+    With *columns* only those normalised columns are read and the
+    fingerprints (which cover all columns) are None.
+    Returns (None, None) when the prework is missing or incomplete, and no
+    fingerprints for prework written before 128-bit fingerprints.
+    """
+    path = sidecar_path('uploads', file_id, PREPARED_SUFFIX)
+    if not os.path.exists(path) or cache_file_path('uploads', file_id) is None:
+        return None, None
+    try:
+        table = feather.read_table(path, memory_map=True)
+    except (OSError, pa.ArrowException):
+        return None, None
+    names = table.schema.names
+    value_cols = [c for c in names if c not in FINGERPRINT_COLS and c != LEGACY_FINGERPRINT_COL]
+    if columns is not None:
+        if not set(columns) <= set(value_cols):
+            return None, None
+        return table.select(list(columns)).to_pandas(), None
+    norm = table.select(value_cols).to_pandas()
+    if not all(c in names for c in FINGERPRINT_COLS):
+        return norm, None
+    fingerprints = np.column_stack([np.asarray(table.column(c).to_numpy(), dtype=np.uint64)
+                                    for c in FINGERPRINT_COLS])
+    return norm, fingerprints
@@ -1 +1 @@
-# Module 2: SQL-to-SQL Comparison (Coming Soon)
+# Module 2: SQL-to-SQL Comparison
@@ -1,19 +1,157 @@
 """
-Module 2: SQL-to-SQL Comparison Routes  (Placeholder)
-Compare two SQL query results from the same or different databases.
+Module 2: SQL-to-SQL Comparison Routes
+Compare two SQL query results from the same or different databases/instances.
+Both sides are fetched concurrently on separate connections, then run through
+the module_1 comparison engine.  Results are stored with the shared layout, so
+paging and export use the common result routes (/api/results_page, /api/export_*).
 """
 
-from flask import Blueprint
+from flask import Blueprint, request
+from concurrent.futures import ThreadPoolExecutor
+import time
+
 from common.json_utils import safe_jsonify
+from common.db_utils import fetch_row_count, is_select_only, project_query
+from common.sql_snapshot import fetch_sql_snapshot, find_snapshot, request_options
+from common.admission import admitted, estimate_mb, AdmissionRejected, DEFAULT_COLUMNS
+from common.result_index import store_result
+from common.result_layout import preview
+from common.metrics import observe_comparison
+from common.wire_format import parse_format, table_response
+from common.memory_utils import record_stage
+from common.routes import _touch_activity
+from module_1.comparison_engine import run_hybrid_comparison
 
 m2_bp = Blueprint('module_2', __name__)
 
+# Rows pulled from each cursor per chunk while fetching
+FETCH_CHUNK_ROWS = 50_000
+
 
 @m2_bp.route('/api/m2/status', methods=['GET'])
 def module_status():
-    """Health-check / placeholder for Module 2."""
+    """Health-check for Module 2."""
     return safe_jsonify({
         "module": "SQL-to-SQL",
-        "status": "coming_soon",
-        "message": "Module 2 is under development. SQL-to-SQL comparison will be available in a future release."
+        "status": "active",
+        "message": "SQL-to-SQL comparison is available."
     })
+
+
+def _source_label(side, default):
+    """Display label for one side ('source' column value)."""
+    return side.get('label') or f"{default}: {side.get('database')}"
+
+
+@m2_bp.route('/api/m2/run_comparison', methods=['POST'])
+def run_comparison():
+    """
+    Orchestrates a SQL-to-SQL Comparison:
+    1. Fetches both queries concurrently (one connection each).
+    2. Applies the column mapping (B columns renamed to A names).
+    3. Runs the Hybrid Comparison Engine (key-based or fingerprint).
+    4. Caches Result.
+    Expects JSON: { "source_a": {"server", "database", "port", "query", "label"},
+                    "source_b": {...}, "keys": [...],
+                    "column_mapping": [{"a": "...", "b": "..."}], "format": "records" }
+    Side A takes the 'SQL' slots of the result ('Only in SQL' = only in A).
+    Runs under admission control (common/admission.py): the memory estimate
+    comes from a row count of each query; optional "ticket" to follow the
+    queue position with /api/comparison_queue.
+    Each side reuses a fresh SQL snapshot of its query (common/sql_snapshot.py);
+    "refresh": true forces both fetches, "snapshot_max_age_minutes" overrides
+    the max age.  summary['sql_snapshot'] = {"a": ..., "b": ...}.
+    """
+    _touch_activity()
+    data = request.json
+    side_a = data.get('source_a') or {}
+    side_b = data.get('source_b') or {}
+    keys = data.get('keys', [])
+    column_mapping = data.get('column_mapping', [])
+    fmt = parse_format(data.get('format'))
+
+    for side in (side_a, side_b):
+        if not side.get('server') or not side.get('database') or not side.get('query'):
+            return safe_jsonify({"error": "Missing required parameters for source_a/source_b"}, 400)
+        if not is_select_only(side['query']):
+            return safe_jsonify({"error": "Security Alert: Only SELECT queries are permitted in this environment."}, 403)
+    if fmt is None:
+        return safe_jsonify({"error": "Invalid format. Use records, columns or arrow."}, 400)
+    try:
+        refresh, max_age = request_options(data)
+    except ValueError as e:
+        return safe_jsonify({"error": str(e)}, 400)
+
+    label_a = _source_label(side_a, 'A')
+    label_b = _source_label(side_b, 'B')
+    if label_a == label_b:
+        label_a, label_b = f"{label_a} (A)", f"{label_b} (B)"
+
+    mapped_a_cols = mapped_b_cols = None
+    if column_mapping and len(column_mapping) > 0:
+        mapped_a_cols = [m['a'] for m in column_mapping]
+        mapped_b_cols = [m['b'] for m in column_mapping]
+
+    # Admission: estimate from the row counts (unknown counts reserve nothing)
+    sides = ((side_a, mapped_a_cols), (side_b, mapped_b_cols))
+    counts = []
+    for side, cols in sides:
+        snap = None if refresh else find_snapshot(side['server'], side['database'], side['query'],
+                                                  side.get('port'), cols, max_age)
+        counts.append(snap['rows'] if snap is not None else fetch_row_count(
+            side['server'], side['database'], project_query(side['query'], cols), side.get('port')))
+    estimate = estimate_mb(sum(c or 0 for c in counts), None, len(mapped_a_cols or ()) or DEFAULT_COLUMNS,
+                           'key' if keys else 'fingerprint')
+
+    try:
+        with admitted(estimate, ticket=data.get('ticket'), label=f"{label_a} vs {label_b}") as admission:
+            # 1. Fetch both sides concurrently (mapped columns only, projected on the server),
+            #    or reuse fresh snapshots
+            t0 = time.time()
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                fut_a, fut_b = [pool.submit(fetch_sql_snapshot, side['server'], side['database'], side['query'],
+                                            side.get('port'), cols, refresh, max_age, 0, FETCH_CHUNK_ROWS)
+                                for side, cols in sides]
+                df_a, snapshot_a = fut_a.result()
+                df_b, snapshot_b = fut_b.result()
+            print(f"  [Fetch]  {len(df_a)} A + {len(df_b)} B rows in {time.time() - t0:.2f}s (concurrent)")
+
+            # 2. Apply Column Mapping
+            if column_mapping and len(column_mapping) > 0:
+                rename_map = {m['b']: m['a'] for m in column_mapping}
+
+                df_a = df_a[[c for c in mapped_a_cols if c in df_a.columns]]
+                df_b = df_b[[c for c in mapped_b_cols if c in df_b.columns]]
+                df_b = df_b.rename(columns=rename_map)
+
+            memory = record_stage({}, 'sql_a_fetched', df_a)
+            record_stage(memory, 'sql_b_fetched', df_b)
+
+            # 3. Run Logic
+            result_df, summary = run_hybrid_comparison(df_a, df_b, keys, file_name=label_b, sql_label=label_a,
+                                                       memory=memory)
+            summary['source_a'] = label_a
+            summary['source_b'] = label_b
+            summary['admission'] = admission
+            summary['sql_snapshot'] = {"a": snapshot_a, "b": snapshot_b}
+            observe_comparison(summary)
+
+            # 4. Cache Result (same layout as module_1)
+            result_id = store_result(result_df, summary, source={
+                "module": "sql_to_sql",
+                "source_a": {k: side_a.get(k) for k in ('server', 'database', 'query')},
+                "source_b": {k: side_b.get(k) for k in ('server', 'database', 'query')},
+            })
+
+            preview_df, columns = preview(result_df, summary, 50)
+            return table_response(preview_df, fmt, {
+                "status": "success",
+                "result_id": result_id,
+                "summary": summary,
+                "columns": columns
+            }, rows_key='preview_rows')
+
+    except AdmissionRejected as e:
+        return safe_jsonify({"status": "error", "message": str(e), "admission": e.info}, e.status)
+    except Exception as e:
+        return safe_jsonify({"status": "error", "message": str(e)}, 500)
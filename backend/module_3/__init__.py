@@ -1 +1 @@
-# Module 3: File-to-File Comparison (Coming Soon)
+# Module 3: File-to-File Comparison
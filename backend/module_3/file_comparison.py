@@ -0,0 +1,185 @@
+"""
+Module 3: File-to-File Comparison Driver
+Runs the module_1 engine over two cached uploads with a bounded memory footprint.
+
+Small inputs are loaded whole and compared directly.  Above
+PARTITION_THRESHOLD_ROWS both sides are hash-partitioned to disk, one
+row group at a time, so that matching rows always land in the same partition:
+  - key-based   : partition on the stripped key values; each partition pair
+                  goes through the key-based engine and the results are joined
+  - fingerprint : partition on the normalised row fingerprint; exact matches
+                  are eliminated per partition and only the leftovers go
+                  through the smart engine (similarity pairing included).
+                  A changed row hashes to another partition than its
+                  counterpart, so the leftovers are paired together, in
+                  one pass: at most MAX_LEFTOVER_ROWS per side, above that
+                  the comparison needs key columns
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from common.storage_manager import CACHE_DIR, load_df, load_row_index, iter_row_groups, cache_file_path
+from common.memory_utils import record_stage
+from common.fingerprint import fingerprint_frame, partition_of
+from module_1.comparison_engine import run_hybrid_comparison, row_fingerprints, split_exact_matches
+
+# Combined input rows above which the hash-partitioned path is used
+PARTITION_THRESHOLD_ROWS = 1_000_000
+
+# Target rows per partition (per side)
+PARTITION_ROWS = 250_000
+
+# Unmatched rows per side that the fingerprint path pairs in memory
+MAX_LEFTOVER_ROWS = PARTITION_ROWS
+
+WORK_DIR = os.path.join(CACHE_DIR, 'work')
+
+
+def _mapped_columns(column_mapping):
+    """(columns of A, columns of B, rename map B -> A) from the mapping list."""
+    if not column_mapping:
+        return None, None, {}
+    return ([m['a'] for m in column_mapping], [m['b'] for m in column_mapping],
+            {m['b']: m['a'] for m in column_mapping})
+
+
+def _project(df, columns, rename):
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    return df.rename(columns=rename) if rename else df
+
+
+def _partition_ids(df, keys, common_cols, n_parts):
+    """Partition number per row: key hash (key-based) or row fingerprint."""
+    if keys:
+        key_frame = pd.DataFrame({k: df[k].astype(str).str.strip() for k in keys})
+        hashes = fingerprint_frame(key_frame)
+    else:
+        hashes = row_fingerprints(df, common_cols)
+    return partition_of(hashes, n_parts)
+
+
+def _partition_side(file_id, columns, rename, keys, common_cols, n_parts, out_dir, tag):
+    """Split one cached upload into *n_parts* Parquet files, a row group at a time.
+    Every chunk is cast to the upload's own schema: pandas picks category code
+    widths (and null / decimal types) per chunk, the partition writers need
+    one schema throughout."""
+    schema = _side_schema(file_id, columns, rename)
+    writers = {}
+    try:
+        for table in iter_row_groups('uploads', file_id, columns=columns):
+            df = _project(table.to_pandas(), columns, rename)
+            parts = _partition_ids(df, keys, common_cols, n_parts)
+            table = pa.Table.from_pandas(df, preserve_index=False).cast(schema)
+            for p in np.unique(parts):
+                chunk = table.take(np.flatnonzero(parts == p))
+                if p not in writers:
+                    writers[p] = pq.ParquetWriter(os.path.join(out_dir, f"{tag}_{p}.parquet"), schema)
+                writers[p].write_table(chunk)
+    finally:
+        for w in writers.values():
+            w.close()
+
+
+def _read_partition(out_dir, tag, p, columns):
+    path = os.path.join(out_dir, f"{tag}_{p}.parquet")
+    if not os.path.exists(path):
+        return pd.DataFrame({c: pd.Series(dtype=object) for c in columns})
+    return pd.read_parquet(path)
+
+
+def _side_schema(file_id, columns, rename):
+    """Arrow schema of one side after projection/renaming (schema only)."""
+    schema = pq.read_schema(cache_file_path('uploads', file_id))
+    names = schema.names if columns is None else [c for c in columns if c in schema.names]
+    return pa.schema([schema.field(c).with_name(rename.get(c, c)) for c in names])
+
+
+def _side_columns(file_id, columns, rename):
+    """Column names of one side after projection/renaming (schema only)."""
+    return _side_schema(file_id, columns, rename).names
+
+
+def compare_uploads(file_a_id, file_b_id, keys, column_mapping, label_a, label_b):
+    """
+    Compare two cached uploads.  Returns (result_df, summary) like
+    run_hybrid_comparison, or None if either upload has expired.
+    """
+    idx_a = load_row_index('uploads', file_a_id)
+    idx_b = load_row_index('uploads', file_b_id)
+    if idx_a is None or idx_b is None:
+        return None
+
+    cols_a, cols_b, rename = _mapped_columns(column_mapping)
+    n_a, n_b = idx_a['num_rows'], idx_b['num_rows']
+
+    if n_a + n_b <= PARTITION_THRESHOLD_ROWS:
+        df_a = _project(load_df('uploads', file_a_id, columns=cols_a), cols_a, {})
+        df_b = _project(load_df('uploads', file_b_id, columns=cols_b), cols_b, rename)
+        memory = record_stage({}, 'files_loaded', df_a, df_b)
+        return run_hybrid_comparison(df_a, df_b, keys, file_name=label_b, sql_label=label_a, memory=memory)
+
+    # ── Hash-partitioned path ──
+    t0 = time.time()
+    n_parts = max(2, -(-max(n_a, n_b) // PARTITION_ROWS))
+    names_a = _side_columns(file_a_id, cols_a, {})
+    names_b = _side_columns(file_b_id, cols_b, rename)
+    common_cols = [c for c in names_a if c in names_b]
+
+    os.makedirs(WORK_DIR, exist_ok=True)
+    out_dir = tempfile.mkdtemp(dir=WORK_DIR)
+    try:
+        _partition_side(file_a_id, cols_a, {}, keys, common_cols, n_parts, out_dir, 'a')
+        _partition_side(file_b_id, cols_b, rename, keys, common_cols, n_parts, out_dir, 'b')
+        print(f"  [Partition] {n_a} A + {n_b} B rows into {n_parts} partitions in {time.time() - t0:.2f}s")
+
+        if keys:
+            results, summaries = [], []
+            for p in range(n_parts):
+                res, summ = run_hybrid_comparison(
+                    _read_partition(out_dir, 'a', p, names_a), _read_partition(out_dir, 'b', p, names_b),
+                    keys, file_name=label_b, sql_label=label_a)
+                results.append(res)
+                summaries.append(summ)
+            result_df = pd.concat(results, ignore_index=True)
+            summary = dict(summaries[0])
+            for field in ('total_sql_rows', 'total_file_rows', 'matched_rows', 'total_discrepancies',
+                          'mismatches', 'only_on_sql', 'only_on_file'):
+                summary[field] = int(sum(s[field] for s in summaries))
+            summary['duplicate_keys'] = {field: int(sum(s['duplicate_keys'][field] for s in summaries))
+                                         for field in summary['duplicate_keys']}
+        else:
+            left_a, left_b, matched = [], [], 0
+            n_left_a = n_left_b = 0
+            for p in range(n_parts):
+                ua, ub, m = split_exact_matches(_read_partition(out_dir, 'a', p, names_a),
+                                                _read_partition(out_dir, 'b', p, names_b), common_cols)
+                n_left_a += len(ua)
+                n_left_b += len(ub)
+                if max(n_left_a, n_left_b) > MAX_LEFTOVER_ROWS:
+                    raise ValueError(
+                        f"More than {MAX_LEFTOVER_ROWS} rows differ between the files, too many to pair "
+                        f"without keys. Select key columns to compare files of this size.")
+                left_a.append(ua)
+                left_b.append(ub)
+                matched += m
+            result_df, summary = run_hybrid_comparison(
+                pd.concat(left_a, ignore_index=True), pd.concat(left_b, ignore_index=True),
+                [], file_name=label_b, sql_label=label_a)
+            summary['total_sql_rows'] = n_a
+            summary['total_file_rows'] = n_b
+            summary['matched_rows'] += matched
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    summary['partitions'] = n_parts
+    summary['comparison_mode'] += f" (Partitioned x{n_parts})"
+    summary['elapsed_seconds'] = round(time.time() - t0, 2)
+    return result_df, summary
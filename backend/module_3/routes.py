@@ -1,19 +1,139 @@
 """
-Module 3: File-to-File Comparison Routes  (Placeholder)
-Compare two uploaded files (CSV/Excel) against each other.
+Module 3: File-to-File Comparison Routes
+Compare two uploaded files (CSV / Excel / Parquet) against each other.
+Uploads are streamed in chunks into the Parquet cache; large comparisons are
+hash-partitioned (see file_comparison.py).  Results use the shared layout, so
+paging and export go through the common result routes (/api/results_page,
+/api/export_*).
 """
 
-from flask import Blueprint
-from common.json_utils import safe_jsonify
+from flask import Blueprint, request
+import uuid
+
+from common.json_utils import safe_jsonify, sanitize_df_for_json
+from common.file_ingest import ingest_file, is_supported
+from common.storage_manager import sample_shape
+from common.admission import admitted, estimate_mb, AdmissionRejected
+from common.result_index import store_result
+from common.result_layout import preview
+from common.metrics import observe_comparison
+from common.wire_format import parse_format, table_response
+from common.routes import _touch_activity
+from module_3.file_comparison import compare_uploads, PARTITION_THRESHOLD_ROWS, PARTITION_ROWS
 
 m3_bp = Blueprint('module_3', __name__)
 
 
 @m3_bp.route('/api/m3/status', methods=['GET'])
 def module_status():
-    """Health-check / placeholder for Module 3."""
+    """Health-check for Module 3."""
     return safe_jsonify({
         "module": "File-to-File",
-        "status": "coming_soon",
-        "message": "Module 3 is under development. File-to-File comparison will be available in a future release."
+        "status": "active",
+        "message": "File-to-File comparison is available."
     })
+
+
+@m3_bp.route('/api/m3/upload_file', methods=['POST'])
+def upload_file():
+    """
+    Streams an uploaded file (CSV, Excel or Parquet) into the cache in chunks
+    and returns columns + preview.
+    """
+    _touch_activity()
+    if 'file' not in request.files:
+        return safe_jsonify({"error": "No file part"}, 400)
+
+    file = request.files['file']
+    if file.filename == '':
+        return safe_jsonify({"error": "No selected file"}, 400)
+    if not is_supported(file.filename):
+        return safe_jsonify({"error": "Invalid file format. Only CSV, Excel or Parquet allowed."}, 400)
+
+    unique_id = str(uuid.uuid4())
+    try:
+        columns, preview_df, total_rows = ingest_file(
+            file.stream, file.filename, unique_id, source={"filename": file.filename})
+
+        return safe_jsonify({
+            "status": "success",
+            "file_id": unique_id,
+            "columns": columns,
+            "preview_data": sanitize_df_for_json(preview_df).to_dict(orient='records'),
+            "total_rows": total_rows
+        })
+
+    except Exception as e:
+        return safe_jsonify({"status": "error", "message": str(e)}, 500)
+
+
+@m3_bp.route('/api/m3/run_comparison', methods=['POST'])
+def run_comparison():
+    """
+    Orchestrates a File-to-File Comparison.
+    Expects JSON: { "file_a_id", "file_b_id", "file_a_name", "file_b_name",
+                    "keys": [...], "column_mapping": [{"a": "...", "b": "..."}],
+                    "format": "records" }
+    File A takes the 'SQL' slots of the result ('Only in SQL' = only in A).
+    Runs under admission control (common/admission.py), estimated from the
+    upload metadata; optional "ticket" to follow the queue position with
+    /api/comparison_queue.
+    """
+    _touch_activity()
+    data = request.json
+    file_a_id = data.get('file_a_id')
+    file_b_id = data.get('file_b_id')
+    label_a = data.get('file_a_name', 'File A')
+    label_b = data.get('file_b_name', 'File B')
+    keys = data.get('keys', [])
+    column_mapping = data.get('column_mapping', [])
+    fmt = parse_format(data.get('format'))
+
+    if not file_a_id or not file_b_id:
+        return safe_jsonify({"error": "Missing required parameters"}, 400)
+    if fmt is None:
+        return safe_jsonify({"error": "Invalid format. Use records, columns or arrow."}, 400)
+    if label_a == label_b:
+        label_a, label_b = f"{label_a} (A)", f"{label_b} (B)"
+
+    # Admission: estimate from the upload metadata
+    mapped_a = [m['a'] for m in column_mapping] if column_mapping else None
+    mapped_b = [m['b'] for m in column_mapping] if column_mapping else None
+    shapes = [sample_shape('uploads', file_a_id, mapped_a), sample_shape('uploads', file_b_id, mapped_b)]
+    if None in shapes:
+        return safe_jsonify({"error": "File session expired or invalid. Please re-upload."}, 404)
+    rows = shapes[0][0] + shapes[1][0]
+    if rows > PARTITION_THRESHOLD_ROWS:
+        # Hash-partitioned: one partition pair is in memory at a time
+        rows = 2 * PARTITION_ROWS
+    estimate = estimate_mb(rows, max(s[2] for s in shapes), max(s[1] for s in shapes),
+                           'key' if keys else 'fingerprint')
+
+    try:
+        with admitted(estimate, ticket=data.get('ticket'), label=f"{label_a} vs {label_b}") as admission:
+            outcome = compare_uploads(file_a_id, file_b_id, keys, column_mapping, label_a, label_b)
+            if outcome is None:
+                return safe_jsonify({"error": "File session expired or invalid. Please re-upload."}, 404)
+            result_df, summary = outcome
+            summary['source_a'] = label_a
+            summary['source_b'] = label_b
+            summary['admission'] = admission
+
+            observe_comparison(summary)
+            result_id = store_result(result_df, summary, source={
+                "module": "file_to_file", "file_a_id": file_a_id, "file_b_id": file_b_id,
+                "file_a_name": label_a, "file_b_name": label_b,
+            })
+
+            preview_df, columns = preview(result_df, summary, 50)
+            return table_response(preview_df, fmt, {
+                "status": "success",
+                "result_id": result_id,
+                "summary": summary,
+                "columns": columns
+            }, rows_key='preview_rows')
+
+    except AdmissionRejected as e:
+        return safe_jsonify({"status": "error", "message": str(e), "admission": e.info}, e.status)
+    except Exception as e:
+        return safe_jsonify({"status": "error", "message": str(e)}, 500)
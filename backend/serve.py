@@ -0,0 +1,60 @@
+"""
+SQL File Reconcile Tool — Production Server
+===========================================
+Runs app.py under a production WSGI server instead of the Werkzeug dev server.
+
+  python serve.py --workers 4 --port 5000
+
+  - gunicorn (Linux/macOS) : N worker processes, one per core by default
+  - waitress (Windows)     : one process, N x 4 worker threads
+Session/connection state lives in the shared session store
+(common/session_store.py), so every worker sees the same sessions.
+"""
+
+import argparse
+import os
+
+
+def _run_gunicorn(app, host, port, workers, timeout):
+    from gunicorn.app.base import BaseApplication
+
+    class _App(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{host}:{port}")
+            self.cfg.set('workers', workers)
+            # Comparisons and exports can run for minutes
+            self.cfg.set('timeout', timeout)
+
+        def load(self):
+            return app
+
+    _App().run()
+
+
+def _run_waitress(app, host, port, workers):
+    from waitress import serve
+    serve(app, host=host, port=port, threads=workers * 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the reconcile tool with a production WSGI server.")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('RECON_WORKERS', os.cpu_count() or 1)),
+                        help="worker processes (gunicorn) or thread groups (waitress)")
+    parser.add_argument('--timeout', type=int, default=1800, help="gunicorn worker timeout in seconds")
+    args = parser.parse_args()
+
+    from app import app
+
+    try:
+        import gunicorn  # noqa: F401
+        print(f"Serving with gunicorn: {args.workers} workers on {args.host}:{args.port}")
+        _run_gunicorn(app, args.host, args.port, args.workers, args.timeout)
+    except ImportError:
+        print(f"Serving with waitress: {args.workers * 4} threads on {args.host}:{args.port}")
+        _run_waitress(app, args.host, args.port, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Shared test setup.
+  - the backend packages are importable from any working directory
+  - nothing is written to backend/temp_cache: import-time stores go to a
+    throwaway directory, and every test gets its own cache under tmp_path
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+_IMPORT_CACHE = tempfile.mkdtemp(prefix='recon-tests-')
+os.environ['RECON_CACHE_DIR'] = _IMPORT_CACHE
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_IMPORT_CACHE, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Point every cache location at this test's tmp_path."""
+    from common import storage_manager as sm
+    from common import admission, excel_export, result_index
+    from module_3 import file_comparison
+
+    root = str(tmp_path / 'temp_cache')
+    dirs = {category: os.path.join(root, category) for category in sm.CATEGORY_DIRS}
+    monkeypatch.setattr(sm, 'CACHE_DIR', root)
+    monkeypatch.setattr(sm, 'UPLOADS_DIR', dirs['uploads'])
+    monkeypatch.setattr(sm, 'RESULTS_DIR', dirs['results'])
+    monkeypatch.setattr(sm, 'SNAPSHOTS_DIR', dirs['snapshots'])
+    monkeypatch.setattr(sm, 'CATEGORY_DIRS', dirs)
+    monkeypatch.setattr(sm, 'MANIFEST_PATH', os.path.join(root, 'manifest.sqlite'))
+    monkeypatch.setattr(sm, 'LEGACY_MANIFEST_PATH', os.path.join(root, 'manifest.json'))
+    monkeypatch.setattr(admission, 'DB_PATH', os.path.join(root, 'admission.sqlite'))
+    monkeypatch.setattr(excel_export, 'RESULTS_DIR', dirs['results'])
+    monkeypatch.setattr(result_index, 'RESULTS_DIR', dirs['results'])
+    monkeypatch.setattr(file_comparison, 'WORK_DIR', os.path.join(root, 'work'))
+    sm.init_cache()
+    sm._mem_clear()
+    result_index._index_cache.clear()
+    with sm._manifest_lock:
+        sm._access_written.clear()
+    yield root
+    sm._mem_clear()
+    result_index._index_cache.clear()
@@ -0,0 +1,92 @@
+"""Admission control: memory budget, concurrency, queue."""
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+from common import admission
+from common.admission import AdmissionRejected, admitted
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(admission, 'MEMORY_BUDGET_MB', 100.0)
+    monkeypatch.setattr(admission, 'MAX_CONCURRENT', 2)
+    monkeypatch.setattr(admission, 'MAX_QUEUE', 1)
+    monkeypatch.setattr(admission, 'QUEUE_TIMEOUT_SECONDS', 5.0)
+    monkeypatch.setattr(admission, 'POLL_SECONDS', 0.02)
+
+
+def test_job_above_the_budget_is_413():
+    with pytest.raises(AdmissionRejected) as e:
+        with admitted(150):
+            pass
+    assert e.value.status == 413
+    assert admission.queue_status()['running'] == 0
+
+
+def _wait_in_queue(release):
+    with admitted(10):
+        release.wait(5)
+
+
+def test_full_queue_is_503():
+    release = threading.Event()
+    with admitted(60), admitted(30):                # both slots taken
+        waiting = threading.Thread(target=_wait_in_queue, args=(release,))
+        waiting.start()
+        while admission.queue_status()['queued'] == 0:
+            time.sleep(0.01)
+        with pytest.raises(AdmissionRejected) as e:     # MAX_QUEUE = 1 already waiting
+            with admitted(10):
+                pass
+        assert e.value.status == 503 and 'queue is full' in str(e.value)
+    release.set()
+    waiting.join(5)
+    assert admission.queue_status()['running'] == admission.queue_status()['queued'] == 0
+
+
+def test_queue_wait_times_out_with_503(monkeypatch):
+    monkeypatch.setattr(admission, 'QUEUE_TIMEOUT_SECONDS', 0.2)
+    with admitted(60):
+        with pytest.raises(AdmissionRejected) as e:
+            with admitted(60):                      # does not fit next to the first
+                pass
+    assert e.value.status == 503 and 'Timed out' in str(e.value)
+
+
+def test_queued_job_starts_when_memory_is_released():
+    order = []
+    first = admitted(60, label='first')
+    first.__enter__()
+
+    def second():
+        with admitted(60, ticket='second') as report:
+            order.append(('second', report['queue_position']))
+    worker = threading.Thread(target=second)
+    worker.start()
+    while admission.queue_status('second').get('status') != 'queued':
+        time.sleep(0.01)
+    assert admission.queue_status('second')['position'] == 1
+    order.append('first done')
+    first.__exit__(None, None, None)
+    worker.join(5)
+    assert order == ['first done', ('second', 1)]
+
+
+def _die_holding_a_slot():
+    slot = admitted(90)
+    slot.__enter__()
+    os._exit(0)                                     # no cleanup, like a killed worker
+
+
+def test_slots_of_dead_processes_are_reclaimed():
+    holder = multiprocessing.get_context('fork').Process(target=_die_holding_a_slot)
+    holder.start()
+    holder.join()
+    assert holder.exitcode == 0
+    assert admission.queue_status()['running'] == 1
+    with admitted(90) as report:
+        assert report['queue_position'] == 0
@@ -0,0 +1,77 @@
+"""Headless batch runner: shared SQL fetches."""
+import json
+from datetime import datetime
+
+import pandas as pd
+
+import batch_runner
+
+
+def _sql():
+    return pd.DataFrame({'id': [1, 2, 3],
+                         'when': pd.Series([datetime(2024, 1, 2), 'n/a', datetime(2024, 3, 4, 5, 6)],
+                                           dtype=object)})
+
+
+def _job(tmp_path):
+    path = tmp_path / 'f.csv'
+    file_df = pd.DataFrame({'id': [1, 2, 3], 'when': ['2024-01-02', 'n/a', '2024-03-04 05:06']})
+    file_df.to_csv(path, index=False)
+    return {"name": "j", "server": "s", "database": "d", "query": "SELECT * FROM t", "file": str(path),
+            "keys": ['id'], "column_mapping": [], "file_name": "f.csv", "memory_mb": 0}
+
+
+def test_shared_and_direct_fetches_compare_alike(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_runner, 'fetch_sql_df', lambda *args, **kwargs: _sql())
+    job = _job(tmp_path)
+
+    direct = batch_runner.run_job(job, None, str(tmp_path))
+    batch_runner.fetch_shared('s', 'd', job['query'], None, 'snap')
+    shared = batch_runner.run_job(job, 'snap', str(tmp_path))
+
+    assert direct['status'] == shared['status'] == 'success'
+    for field in ('matched_rows', 'mismatches', 'only_on_sql', 'only_on_file'):
+        assert shared['summary'][field] == direct['summary'][field], field
+
+
+def test_shared_fetch_runs_under_the_memory_limit(monkeypatch):
+    limits = []
+    monkeypatch.setattr(batch_runner, '_limit_memory', limits.append)
+
+    def fetch(*args, **kwargs):
+        assert limits == [512]
+        raise MemoryError()
+    monkeypatch.setattr(batch_runner, 'fetch_sql_df', fetch)
+
+    try:
+        batch_runner.fetch_shared('s', 'd', 'SELECT 1', None, 'snap', memory_mb=512)
+    except RuntimeError as e:
+        assert '512 MB' in str(e)
+    else:
+        raise AssertionError("MemoryError not reported")
+    assert limits == [512, 0]
+
+
+def test_batch_fetches_a_shared_query_once(tmp_path, monkeypatch):
+    calls = tmp_path / 'calls.txt'
+
+    def fetch(server, database, query, port=None):
+        with open(calls, 'a') as f:
+            f.write(query.replace('\n', ' ') + '\n')
+        return _sql()
+    monkeypatch.setattr(batch_runner, 'fetch_sql_df', fetch)
+
+    job = _job(tmp_path)
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text(json.dumps({
+        "defaults": {"server": "s", "database": "d", "file": "f.csv", "keys": ["id"]},
+        "jobs": [{"name": "one", "query": job['query']}, {"name": "two", "query": job['query']},
+                 {"name": "own", "query": "SELECT * FROM other"}],
+    }))
+    jobs = batch_runner.load_manifest(str(manifest))
+    batch = batch_runner.run_batch(jobs, str(tmp_path / 'out'), workers=2)
+
+    assert batch['jobs_succeeded'] == 3 and batch['shared_sql_fetches'] == 1
+    assert sorted(calls.read_text().splitlines()) == ["SELECT * FROM other", job['query']]
+    assert [r['shared_sql'] for r in batch['jobs']] == [True, True, False]
+    assert (tmp_path / 'out' / 'summary.json').exists()
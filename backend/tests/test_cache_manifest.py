@@ -0,0 +1,133 @@
+"""Cache manifest: per-entry updates shared by worker processes."""
+import multiprocessing
+import os
+import time
+import uuid
+from contextlib import closing
+
+import pandas as pd
+import pytest
+
+from common import cache_janitor
+from common import storage_manager as sm
+
+DF = pd.DataFrame({'a': [1, 2]})
+
+
+@pytest.fixture
+def entry_ids():
+    ids = []
+    yield ids
+    for file_id in ids:
+        sm.delete_entry('results', file_id)
+
+
+def _save_many(prefix, n):
+    for i in range(n):
+        sm.save_df(DF, 'results', f"{prefix}-{i}")
+
+
+def test_concurrent_processes_keep_every_record(entry_ids):
+    prefix = uuid.uuid4().hex
+    ctx = multiprocessing.get_context('fork')
+    workers = [ctx.Process(target=_save_many, args=(f"{prefix}-{w}", 10)) for w in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    entry_ids.extend(f"{prefix}-{w}-{i}" for w in range(4) for i in range(10))
+
+    manifest = sm.read_manifest()
+    assert all(sm._manifest_key('results', file_id) in manifest for file_id in entry_ids)
+
+
+def test_sweep_keeps_entries_saved_during_the_pass(entry_ids, monkeypatch):
+    old, new = uuid.uuid4().hex, uuid.uuid4().hex
+    entry_ids.extend([old, new])
+    sm.save_df(DF, 'results', old)
+    list_entries = sm.list_entries
+
+    def save_meanwhile():
+        entries = list_entries()
+        sm.save_df(DF, 'results', new)          # another request, after the sweep read the manifest
+        return entries
+    monkeypatch.setattr(sm, 'list_entries', save_meanwhile)
+
+    cache_janitor.sweep()
+    assert sm._manifest_key('results', new) in sm.read_manifest()
+
+
+def _age(file_id, seconds, forget_writes=True):
+    """Pretend the entry was last accessed *seconds* ago."""
+    with closing(sm._manifest_connect()) as conn:
+        conn.execute("UPDATE entries SET last_access = ? WHERE key = ?",
+                     (time.time() - seconds, sm._manifest_key('results', file_id)))
+    if forget_writes:
+        sm._access_written.clear()
+
+
+def _read_in_other_process(file_id):
+    sm._access_written.clear()          # another worker: nothing written by it yet
+    sm._mem_clear()
+    assert len(sm.load_df('results', file_id)) == len(DF)
+
+
+def test_access_from_another_process_keeps_entry(entry_ids, monkeypatch):
+    used, idle = uuid.uuid4().hex, uuid.uuid4().hex
+    entry_ids.extend([used, idle])
+    for file_id in (used, idle):
+        sm.save_df(DF, 'results', file_id)
+        _age(file_id, 7200)
+    monkeypatch.setattr(cache_janitor, '_ttl_seconds', lambda category: 3600.0)
+
+    worker = multiprocessing.get_context('fork').Process(target=_read_in_other_process, args=(used,))
+    worker.start()
+    worker.join()
+    assert worker.exitcode == 0
+
+    assert cache_janitor.sweep()['expired'] == 1
+    assert sm.cache_file_path('results', used) is not None
+    assert sm.cache_file_path('results', idle) is None
+
+
+def test_sweep_spares_entries_used_since_the_manifest_was_read(entry_ids, monkeypatch):
+    file_id = uuid.uuid4().hex
+    entry_ids.append(file_id)
+    sm.save_df(DF, 'results', file_id)
+    _age(file_id, 7200)
+    monkeypatch.setattr(cache_janitor, '_ttl_seconds', lambda category: 3600.0)
+    list_entries = sm.list_entries
+
+    def read_meanwhile():
+        sm.load_df('results', file_id)          # after the sweep read the manifest
+        return list_entries()
+    monkeypatch.setattr(sm, 'list_entries', read_meanwhile)
+
+    assert cache_janitor.sweep()['expired'] == 0
+    assert sm.cache_file_path('results', file_id) is not None
+
+
+def test_access_times_are_throttled(entry_ids):
+    file_id = uuid.uuid4().hex
+    entry_ids.append(file_id)
+    sm.save_df(DF, 'results', file_id)
+    _age(file_id, 7200)
+    sm.load_df('results', file_id)
+    first = sm.read_manifest()[sm._manifest_key('results', file_id)]['last_access']
+    assert first > time.time() - 60
+    _age(file_id, 7200, forget_writes=False)
+    sm.load_df('results', file_id)              # within ACCESS_WRITE_SECONDS of the last write
+    assert sm.read_manifest()[sm._manifest_key('results', file_id)]['last_access'] < first
+
+
+def test_sweep_removes_old_orphaned_files(monkeypatch):
+    monkeypatch.setattr(cache_janitor, '_ttl_seconds', lambda category: 3600.0)
+    os.makedirs(sm.UPLOADS_DIR, exist_ok=True)
+    old, new = (sm.sidecar_path('uploads', uuid.uuid4().hex, 'ingest.json') for _ in range(2))
+    for path in (old, new):
+        open(path, 'w').close()
+    os.utime(old, (time.time() - 7200, time.time() - 7200))
+
+    cache_janitor.sweep()
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
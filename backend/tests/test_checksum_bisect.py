@@ -0,0 +1,136 @@
+"""Checksum bisection and key sampling on small in-memory frames.
+
+The SQL side is played by the file-side implementation of the same hash
+contract: the aggregate and leaf queries are intercepted and answered from a
+DataFrame standing in for the table.
+"""
+import sys
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import module_1.checksum_bisect as cb
+from module_1.comparison_engine import run_hybrid_comparison
+
+KINDS = {'id': 'integer', 'amount': 'decimal', 'name': 'string'}
+
+
+def _table(n=3000):
+    return pd.DataFrame({'id': np.arange(n), 'amount': np.arange(n) * 0.5,
+                         'name': [f"n{i % 50}" for i in range(n)]})
+
+
+def _file(sql):
+    file = sql.copy()
+    file.loc[file['id'].isin([7, 1234, 2999]), 'amount'] = -1.0
+    file = file[file['id'] != 42]
+    return pd.concat([file, pd.DataFrame({'id': [5000], 'amount': [1.0], 'name': ['new']})],
+                     ignore_index=True)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Run checksum comparisons against a DataFrame instead of SQL Server.
+    Returns a dict: set 'table' before running; 'fetched' counts the rows read."""
+    state = {'fetched': 0}
+
+    class Cursor:
+        def execute(self, query):
+            kind, width, parents = query
+            key_h, s1, s2 = cb.file_hashes(state['table'], ['id'], list(KINDS), KINDS)
+            agg = cb._file_aggregates(key_h, s1, s2, width, parents)
+            self.rows = [(b, n, x, y) for b, (n, x, y) in agg.items()]
+
+        def fetchall(self):
+            return self.rows
+
+    def read_sql(query, conn):
+        table = state['table']
+        if isinstance(query, tuple):                # leaf buckets
+            _, width, buckets = query
+            key_h = cb.file_key_hashes(table, ['id'], KINDS)
+            table = table[np.isin((key_h // np.uint64(width)).astype(np.int64), list(buckets))]
+        state['fetched'] += len(table)
+        return table.copy()
+
+    conn = types.SimpleNamespace(cursor=Cursor, close=lambda: None)
+    monkeypatch.setitem(sys.modules, 'pyodbc', types.SimpleNamespace(connect=lambda *a, **k: conn))
+    monkeypatch.setattr(cb, 'probe_columns', lambda cursor, query: list(KINDS.items()))
+    monkeypatch.setattr(cb, 'bucket_aggregates_sql',
+                        lambda query, keys, hash_cols, kinds, width, parents: ('agg', width, parents))
+    monkeypatch.setattr(cb, 'leaf_rows_sql',
+                        lambda query, keys, kinds, width, buckets, columns=None: ('leaf', width, buckets))
+    monkeypatch.setattr(cb.pd, 'read_sql', read_sql)
+    return state
+
+
+def test_bisection_fetches_only_differing_rows(server, monkeypatch):
+    monkeypatch.setattr(cb, 'INITIAL_BUCKETS', 16)
+    monkeypatch.setattr(cb, 'FANOUT', 4)
+    monkeypatch.setattr(cb, 'LEAF_ROWS', 50)
+    sql = _table()
+    file = _file(sql)
+    server['table'] = sql
+
+    _, summary = cb.run_checksum_comparison('s', 'd', 'SELECT * FROM t', file, ['id'])
+    _, direct = run_hybrid_comparison(sql, file, ['id'])
+
+    for field in ('matched_rows', 'mismatches', 'only_on_sql', 'only_on_file'):
+        assert summary[field] == direct[field], field
+    assert (summary['mismatches'], summary['only_on_sql'], summary['only_on_file']) == (3, 1, 1)
+    assert summary['checksum']['levels'] > 1
+    assert not summary['checksum']['full_fetch_fallback']
+    assert server['fetched'] == summary['checksum']['sql_rows_fetched'] <= 50
+
+
+def test_identical_sides_fetch_nothing(server):
+    sql = _table(500)
+    server['table'] = sql
+    _, summary = cb.run_checksum_comparison('s', 'd', 'SELECT * FROM t', sql.copy(), ['id'])
+    assert summary['matched_rows'] == 500 and summary['total_discrepancies'] == 0
+    assert server['fetched'] == 0
+
+
+def test_mostly_different_sides_fall_back_to_a_full_fetch(server):
+    sql = _table(500)
+    file = sql.copy()
+    file['amount'] += 1
+    server['table'] = sql
+    _, summary = cb.run_checksum_comparison('s', 'd', 'SELECT * FROM t', file, ['id'])
+    assert summary['checksum']['full_fetch_fallback']
+    assert summary['mismatches'] == 500
+
+
+def test_hash_contract_is_pinned():
+    # MD5 over UTF-16LE '7' and '7<US>12.500000<US>x', as HASHBYTES computes them on the server
+    df = pd.DataFrame({'id': [7], 'amount': [12.5], 'name': [' x ']})
+    key_h, s1, s2 = cb.file_hashes(df, ['id'], ['id', 'amount', 'name'], KINDS)
+    assert int(key_h[0]) == 0x6e046c46                  # key hash: bytes 5-8, unsigned
+    assert (int(s1[0]), int(s2[0])) == (0xd4ae0b95 - (1 << 32), 0x44217bf4)   # bytes 1-4, 9-12, signed
+
+
+def test_key_sample_selects_the_same_keys_on_both_sides():
+    sql = _table(2000)
+    file = sql.assign(id=' ' + sql['id'].astype(str), amount=sql['amount'] + 1)    # text keys, other values
+    picked_sql = cb.file_key_sample(sql, ['id'], KINDS, 100)
+    picked_file = cb.file_key_sample(file, ['id'], KINDS, 100)
+    assert 100 < len(picked_sql) < 300                       # about 10 %
+    assert picked_sql['id'].tolist() == picked_file['id'].astype(int).tolist()
+    assert cb.key_sample_sql("SELECT * FROM t", ['id'], KINDS, 100, ['id']).endswith(" % 1000 < 100")
+
+
+def test_sample_estimates_cover_the_full_counts():
+    sql = _table(20000)
+    file = sql.copy()
+    file.loc[file['id'] % 10 == 0, 'amount'] = -1.0          # 2,000 mismatches
+    k = 100
+    _, summary = run_hybrid_comparison(cb.file_key_sample(sql, ['id'], KINDS, k),
+                                       cb.file_key_sample(file, ['id'], KINDS, k), ['id'],
+                                       sample_fraction=k / cb.SAMPLE_MODULUS)
+    estimates = summary['sample']['estimates']
+    for field, full in (('total_sql_rows', 20000), ('mismatches', 2000), ('only_on_sql', 0)):
+        assert estimates[field]['ci_low'] <= full <= estimates[field]['ci_high'], field
+    rate = summary['sample']['discrepancy_rate']
+    assert rate['ci_low'] <= 0.1 <= rate['ci_high']
@@ -0,0 +1,77 @@
+"""Comparison engine: key-based join and pairing, and the memory report."""
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import common.memory_utils as mu
+from module_1.comparison_engine import _key_codes, run_hybrid_comparison
+
+
+def test_duplicate_keys_pair_as_multisets():
+    sql = pd.DataFrame({'id': ['1', '1', '2', '3'], 'v': ['a', 'b', 'c', 'd']})
+    file = pd.DataFrame({'id': ['1', '1', '2', '4'], 'v': ['b', 'x', 'c', 'e']})
+
+    result, summary = run_hybrid_comparison(sql, file, keys=['id'])
+
+    assert summary['duplicate_keys'] == {"sql_keys": 1, "sql_rows": 2, "file_keys": 1, "file_rows": 2}
+    assert summary['matched_rows'] == 2          # id 1 'b' == 'b', id 2
+    assert summary['mismatches'] == 1            # id 1 'a' vs 'x'
+    assert summary['only_on_sql'] == 1
+    assert summary['only_on_file'] == 1
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="/proc fallback is Linux only")
+def test_memory_report_has_rss_without_psutil(monkeypatch):
+    monkeypatch.setattr(mu, 'psutil', None)
+    df = pd.DataFrame({'id': ['1', '2'], 'v': ['a', 'b']})
+    _, summary = run_hybrid_comparison(df, df.copy(), keys=['id'])
+    assert summary['memory_mb']['process_rss'] > 0
+
+
+def test_key_join_matches_a_merge_on_composite_keys():
+    rng = np.random.default_rng(0)
+    n = 2000
+    sql = pd.DataFrame({'k1': rng.integers(0, 40, n), 'k2': rng.choice(['a', 'b', 'c'], n),
+                        'v': rng.integers(0, 5, n)}).drop_duplicates(['k1', 'k2'])
+    file = sql.sample(frac=0.8, random_state=1).copy()
+    file['k1'] = ' ' + file['k1'].astype(str)               # same keys, as padded text
+    file.loc[file.index[:10], 'v'] += 1
+    file = pd.concat([file, pd.DataFrame({'k1': ['99'], 'k2': ['z'], 'v': [0]})], ignore_index=True)
+
+    _, summary = run_hybrid_comparison(sql, file, keys=['k1', 'k2'])
+
+    left = sql.assign(k1=sql['k1'].astype(str))
+    right = file.assign(k1=file['k1'].str.strip())
+    merged = left.merge(right, on=['k1', 'k2'], how='outer', suffixes=('_s', '_f'), indicator=True)
+    both = merged[merged['_merge'] == 'both']
+    assert summary['matched_rows'] == int((both['v_s'] == both['v_f']).sum())
+    assert summary['mismatches'] == int((both['v_s'] != both['v_f']).sum()) == 10
+    assert summary['only_on_sql'] == int((merged['_merge'] == 'left_only').sum())
+    assert summary['only_on_file'] == int((merged['_merge'] == 'right_only').sum()) == 1
+
+
+def test_key_codes_follow_key_order():
+    sql = pd.DataFrame({'a': ['b', 'a', 'b'], 'b': ['2', '9', '1']})
+    file = pd.DataFrame({'a': ['a', 'c'], 'b': ['1', '0']})
+    sql_codes, file_codes = _key_codes(sql, file)
+    keys = list(zip(sql['a'], sql['b'])) + list(zip(file['a'], file['b']))
+    codes = list(sql_codes) + list(file_codes)
+    assert [k for _, k in sorted(zip(codes, keys))] == sorted(keys)
+    assert len(set(codes)) == len(set(keys))
+
+
+def test_duplicated_keys_do_not_multiply_rows():
+    n = 300
+    sql = pd.DataFrame({'id': ['k'] * n, 'v': [str(i) for i in range(n)]})
+    file = sql.iloc[::-1].reset_index(drop=True)            # same rows, other order
+    file.loc[0, 'v'] = 'changed'                            # was the last SQL row
+
+    result, summary = run_hybrid_comparison(sql, file, keys=['id'])
+
+    assert summary['duplicate_keys'] == {"sql_keys": 1, "sql_rows": n, "file_keys": 1, "file_rows": n}
+    assert summary['matched_rows'] == n - 1
+    assert summary['mismatches'] == 1
+    assert summary['only_on_sql'] == summary['only_on_file'] == 0
+    assert len(result) == 1
@@ -0,0 +1,43 @@
+"""Derived-table query rewriting and chunked fetches."""
+import sqlite3
+import sys
+import types
+
+import pytest
+
+from common.db_utils import count_query, fetch_sql_df, project_query
+
+QUERY = "SELECT * FROM dbo.T -- month-end"
+
+
+def test_project_query_survives_trailing_line_comment():
+    sql = project_query(QUERY, ['a', 'b'])
+    assert sql.splitlines() == ["SELECT q.[a], q.[b] FROM (", QUERY, ") q"]
+
+
+def test_count_query_survives_trailing_line_comment():
+    assert count_query(QUERY).splitlines() == ["SELECT COUNT_BIG(*) FROM (", QUERY, ") q"]
+
+
+def test_unusable_derived_tables_are_left_alone():
+    assert project_query("WITH x AS (SELECT 1 a) SELECT * FROM x", ['a']).startswith("WITH")
+    assert count_query("SELECT * FROM dbo.T ORDER BY a") is None
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """pyodbc stand-in: every connection opens the same in-memory SQLite table."""
+    def connect(conn_str, timeout=0):
+        conn = sqlite3.connect(':memory:')
+        conn.execute("CREATE TABLE t (id INTEGER, v TEXT)")
+        conn.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"v{i}") for i in range(25)])
+        return conn
+    monkeypatch.setitem(sys.modules, 'pyodbc', types.SimpleNamespace(connect=connect))
+
+
+@pytest.mark.parametrize('query', ["SELECT * FROM t", "SELECT * FROM t WHERE id < 0"])
+def test_chunked_fetch_equals_single_read(database, query):
+    whole = fetch_sql_df('s', 'd', query)
+    chunked = fetch_sql_df('s', 'd', query, chunksize=10)
+    assert list(chunked.columns) == ['id', 'v']
+    assert chunked.astype(str).values.tolist() == whole.astype(str).values.tolist()
@@ -0,0 +1,51 @@
+"""Background Excel exports shared by worker processes."""
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from common import excel_export as ex
+from common.result_index import store_result
+from common.storage_manager import delete_entry
+from module_1.comparison_engine import run_hybrid_comparison
+
+
+@pytest.fixture
+def result_id():
+    n = 500
+    sql = pd.DataFrame({'id': np.arange(n), 'a': np.arange(n) % 7})
+    file = sql.copy()
+    file.loc[::5, 'a'] = 99
+    res, summary = run_hybrid_comparison(sql, file, ['id'], file_name='F')
+    rid = store_result(res, summary)
+    yield rid
+    delete_entry('results', rid)
+
+
+def test_background_export(result_id):
+    ex.start_export(result_id)
+    status = ex.wait_for_export(result_id, timeout=60)
+    assert status['status'] == 'done'
+    assert os.path.exists(ex.export_path(result_id))
+    assert not os.path.exists(ex._job_path(result_id))
+
+
+def test_export_running_in_another_process_is_followed(result_id):
+    other = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    try:
+        with open(ex._job_path(result_id), 'w') as f:
+            json.dump({"status": "running", "rows_written": 10, "started_at": 0, "pid": other.pid}, f)
+        ex.start_export(result_id)            # joins the other worker's job
+        assert ex.get_export_status(result_id) == {"status": "running", "rows_written": 10, "started_at": 0}
+        assert not os.path.exists(ex.export_path(result_id))
+    finally:
+        other.kill()
+        other.wait()
+
+    assert ex.get_export_status(result_id)['status'] == 'error'     # its worker died
+    ex.start_export(result_id)
+    assert ex.wait_for_export(result_id, timeout=60)['status'] == 'done'
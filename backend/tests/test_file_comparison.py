@@ -0,0 +1,64 @@
+"""File-to-File comparison: hash-partitioned path."""
+import io
+import uuid
+
+import pandas as pd
+import pytest
+
+import module_3.file_comparison as fc
+from common.file_ingest import ingest_file
+from common.storage_manager import delete_entry
+
+
+@pytest.fixture
+def uploads():
+    """Ingest DataFrames as 1,000-row-group uploads; removed afterwards."""
+    ids = []
+
+    def upload(df):
+        file_id = str(uuid.uuid4())
+        ingest_file(io.BytesIO(df.to_csv(index=False).encode()), 'f.csv', file_id, chunk_rows=1000)
+        ids.append(file_id)
+        return file_id
+    yield upload
+    for file_id in ids:
+        delete_entry('uploads', file_id)
+
+
+def _frame(n=3000):
+    # 'grp' is dictionary encoded from the first chunk (100 distinct values);
+    # later chunks hold 400, so pandas widens the category codes past int8
+    grp = [f"g{i % 100}" if i < 1000 else f"g{i % 400}" for i in range(n)]
+    return pd.DataFrame({'id': range(n), 'grp': grp, 'v': [f"v{i}" for i in range(n)]})
+
+
+@pytest.mark.parametrize('keys', [['id'], []])
+def test_partitioned_matches_direct(uploads, monkeypatch, keys):
+    a = _frame()
+    b = a.copy()
+    b.loc[10, 'v'] = 'changed'
+    b = b.drop(index=[20])
+    id_a, id_b = uploads(a), uploads(b)
+
+    _, direct = fc.compare_uploads(id_a, id_b, keys, None, 'A', 'B')
+    monkeypatch.setattr(fc, 'PARTITION_THRESHOLD_ROWS', 1000)
+    monkeypatch.setattr(fc, 'PARTITION_ROWS', 1000)
+    _, partitioned = fc.compare_uploads(id_a, id_b, keys, None, 'A', 'B')
+
+    assert 'Partitioned' in partitioned['comparison_mode']
+    for field in ('matched_rows', 'mismatches', 'only_on_sql', 'only_on_file'):
+        assert partitioned[field] == direct[field], field
+    assert direct['only_on_sql'] == 1
+
+
+def test_too_many_leftovers_without_keys_is_an_error(uploads, monkeypatch):
+    a = _frame()
+    b = a.copy()
+    b['v'] = b['v'] + '!'
+    id_a, id_b = uploads(a), uploads(b)
+
+    monkeypatch.setattr(fc, 'PARTITION_THRESHOLD_ROWS', 1000)
+    monkeypatch.setattr(fc, 'PARTITION_ROWS', 1000)
+    monkeypatch.setattr(fc, 'MAX_LEFTOVER_ROWS', 500)
+    with pytest.raises(ValueError, match='key columns'):
+        fc.compare_uploads(id_a, id_b, [], None, 'A', 'B')
@@ -0,0 +1,21 @@
+"""128-bit row fingerprints."""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from common import fingerprint as fp
+
+
+def test_slices_hash_like_the_whole_array():
+    values = pa.array([f"v{i}-{'x' * (i % 13)}" if i % 7 else None for i in range(5000)], pa.large_string())
+    full = fp._hash_strings(values)
+    for start, length in [(0, 10), (5, 100), (1000, 4000), (4990, 10), (123, 0)]:
+        assert np.array_equal(fp._hash_strings(values.slice(start, length)), full[start:start + length])
+
+
+def test_fingerprints_do_not_depend_on_chunking(monkeypatch):
+    df = pd.DataFrame({'a': [f"a{i}" for i in range(1000)], 'b': [str(i % 10) for i in range(1000)]})
+    whole = fp.fingerprint_frame(df)
+    monkeypatch.setattr(fp, 'CHUNK_ROWS', 64)
+    assert np.array_equal(fp.fingerprint_frame(df, threads=2), whole)
+    assert len(np.unique(whole, axis=0)) == len(df)
@@ -0,0 +1,46 @@
+"""safe_jsonify encoding: the orjson path must give the stdlib json values."""
+import datetime
+import decimal
+import json
+
+import numpy as np
+import pytest
+
+import common.json_utils as ju
+
+PAYLOAD = {
+    "float64": np.float64(1.5), "float32": np.float32(2.5), "int64": np.int64(5), "bool_": np.bool_(True),
+    "str_": np.str_("x"), "int": 3, "float": 0.1, "bool": False, "none": None, "text": "é ünïcode",
+    "decimal": decimal.Decimal("1.10"), "datetime": datetime.datetime(2024, 1, 2, 3, 4, 5),
+    "date": datetime.date(2024, 1, 2), "big": 2 ** 70, "int_keys": {1: "a", 2: "b"},
+    "rows": [{"a": np.float64(0.25), "b": "y"}, {"a": None, "b": np.int32(7)}], "tuple": (1, "2"),
+}
+
+
+def _stdlib(data):
+    return json.loads(json.dumps(data, ensure_ascii=False, default=str))
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_payload_equals_stdlib_json(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(ju, 'orjson', None)
+    elif ju.orjson is None:
+        pytest.skip("orjson not installed")
+    for key, value in PAYLOAD.items():
+        assert json.loads(ju._dumps({key: value})) == _stdlib({key: value}), key
+    assert json.loads(ju._dumps(PAYLOAD)) == _stdlib(PAYLOAD)
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_non_finite_floats_stay_nan(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(ju, 'orjson', None)
+    elif ju.orjson is None:
+        pytest.skip("orjson not installed")
+    data = {"nan": float("nan"), "inf": np.float64("inf"), "rows": [{"x": float("-inf"), "y": 1.0}],
+            "none": None}
+    payload = ju._dumps(data)
+    payload = payload if isinstance(payload, str) else payload.decode()
+    assert payload == json.dumps(data, ensure_ascii=False, default=str)
+    assert '"nan": NaN' in payload and '"none": null' in payload
@@ -0,0 +1,53 @@
+"""Prometheus metrics exposition."""
+import pandas as pd
+
+from common import metrics
+from common import storage_manager as sm
+
+
+def _samples():
+    """{'name{labels}': value} of every sample in the exposition."""
+    samples = {}
+    for line in metrics.render().splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_requests_are_counted_with_a_latency_histogram():
+    endpoint = '/api/test_metrics'
+    started = metrics.request_started(endpoint)
+    metrics.request_finished(endpoint, 'GET', 200, started - 0.2)       # took ~0.2 s
+    metrics.request_closed(endpoint)
+
+    samples = _samples()
+    labels = f'endpoint="{endpoint}",method="GET"'
+    assert samples[f'recon_http_requests_total{{{labels},status="200"}}'] == 1
+    assert samples[f'recon_http_request_duration_seconds_bucket{{{labels},le="0.1"}}'] == 0
+    assert samples[f'recon_http_request_duration_seconds_bucket{{{labels},le="0.25"}}'] == 1
+    assert samples[f'recon_http_request_duration_seconds_bucket{{{labels},le="+Inf"}}'] == 1
+    assert samples[f'recon_http_request_duration_seconds_count{{{labels}}}'] == 1
+    assert 0.2 <= samples[f'recon_http_request_duration_seconds_sum{{{labels}}}'] < 1
+
+
+def test_comparison_and_cache_metrics():
+    before = _samples()
+    in_flight = metrics.request_started('/api/run_comparison')
+    assert _samples()['recon_comparisons_in_flight'] == before['recon_comparisons_in_flight'] + 1
+    metrics.observe_sql_fetch(30)
+    metrics.observe_comparison({'total_sql_rows': 30, 'total_file_rows': 20, 'elapsed_seconds': 0.5})
+    metrics.request_finished('/api/run_comparison', 'POST', 200, in_flight)
+    metrics.request_closed('/api/run_comparison')
+    sm.save_df(pd.DataFrame({'a': [1, 2]}), 'results', 'r')
+    sm.load_df('results', 'r')
+
+    after = _samples()
+    assert after['recon_comparisons_in_flight'] == before['recon_comparisons_in_flight']
+    assert after['recon_comparisons_total'] == before['recon_comparisons_total'] + 1
+    assert after['recon_sql_rows_fetched_total'] == before['recon_sql_rows_fetched_total'] + 30
+    assert after['recon_rows_compared_total'] == before['recon_rows_compared_total'] + 50
+    assert after['recon_comparison_rows_per_second'] == 100
+    assert after['recon_cache_disk_entries{category="results"}'] == 1
+    assert after['recon_cache_memory_entries{category="results"}'] == 1
+    assert after['process_resident_memory_bytes'] > 0
@@ -0,0 +1,160 @@
+"""Result routes: paging, filters and exports of a stored result."""
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from flask import Flask
+
+import common.result_index as result_index
+from common.result_layout import FILE_PREFIX, MASK_COL, expand_result
+from common.result_routes import results_bp
+from common.storage_manager import delete_entry, load_df
+from module_1.comparison_engine import run_hybrid_comparison
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(results_bp)
+    return app.test_client()
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    """A result in several row groups: 20 mismatches, 2 rows only in SQL, 2 only in File.
+    Yields (result_id, stacked display rows)."""
+    monkeypatch.setattr(result_index, 'RESULTS_ROW_GROUP_SIZE', 8)
+    sql = pd.DataFrame({'id': np.arange(200), 'a': np.arange(200) % 7, 'b': ['x'] * 200})
+    file = sql.copy()
+    file.loc[file['id'] % 10 == 0, 'a'] = 99
+    file = file[~file['id'].isin([5, 15])]
+    file = pd.concat([file, pd.DataFrame({'id': [1000, 1001], 'a': [1, 2], 'b': ['y', 'y']})],
+                     ignore_index=True)
+    res, summary = run_hybrid_comparison(sql, file, ['id'], file_name='F')
+    result_id = result_index.store_result(res, summary)
+    yield result_id, expand_result(res, summary)
+    delete_entry('results', result_id)
+
+
+def _rows(df):
+    return [(str(k), source, status) for k, source, status in zip(df['id'], df['source'], df['status'])]
+
+
+def _page_rows(data):
+    return [(str(r['id']), r['source'], r['status']) for r in data]
+
+
+def test_pages_cover_the_result_once(client, stored):
+    result_id, expected = stored
+    assert len(expected) == 44
+    rows, page = [], 1
+    while True:
+        payload = client.get(f'/api/results_page?result_id={result_id}&page={page}&size=10').get_json()
+        assert payload['total_rows'] == 44
+        rows.extend(_page_rows(payload['data']))
+        if not payload['has_more']:
+            break
+        page += 1
+    assert page == 5
+    assert rows == _rows(expected)
+
+    past_end = client.get(f'/api/results_page?result_id={result_id}&page=9&size=10').get_json()
+    assert past_end['data'] == [] and past_end['has_more'] is False
+
+
+def test_expired_result_is_404(client):
+    assert client.get('/api/results_page?result_id=missing&page=1').status_code == 404
+
+
+def test_a_page_reads_only_its_row_groups(client, stored, monkeypatch):
+    result_id, _ = stored
+    read = []
+    read_row_groups = pq.ParquetFile.read_row_groups
+
+    def spy(self, row_groups, *args, **kwargs):
+        read.append(list(row_groups))
+        return read_row_groups(self, row_groups, *args, **kwargs)
+    monkeypatch.setattr(pq.ParquetFile, 'read_row_groups', spy)
+
+    client.get(f'/api/results_page?result_id={result_id}&page=1&size=5')
+    assert read == [[0]]
+
+
+def _page(client, result_id, **params):
+    query = '&'.join(f"{k}={v}" for k, v in dict(result_id=result_id, size=1000, **params).items())
+    return client.get(f'/api/results_page?{query}').get_json()
+
+
+def test_status_and_column_filters(client, stored):
+    result_id, expected = stored
+    only_sql = _page(client, result_id, status='Only in SQL')
+    assert only_sql['total_rows'] == 2
+    assert _page_rows(only_sql['data']) == _rows(expected[expected['status'] == 'Only in SQL'])
+
+    by_column = _page(client, result_id, column='a')
+    assert by_column['total_rows'] == 40                    # both rows of every mismatch
+    assert all(r['_mismatch_cols'] == 'a' for r in by_column['data'])
+    assert _page(client, result_id, column='b')['total_rows'] == 0
+
+
+def test_key_lookup_and_sort(client, stored):
+    result_id, expected = stored
+    assert _page_rows(_page(client, result_id, key=30)['data']) == [('30', 'SQL', 'Mismatch'),
+                                                                     ('30', 'F', 'Mismatch')]
+    assert _page(client, result_id, key=31)['total_rows'] == 0
+
+    ordered = _page_rows(_page(client, result_id, sort='key', order='desc')['data'])
+    keys = [k for k, _, _ in ordered]
+    assert keys == sorted(keys, reverse=True)
+    assert sorted(ordered) == sorted(_rows(expected))
+    pair = [row for row in ordered if row[0] == '30']
+    assert [source for _, source, _ in pair] == ['SQL', 'F']      # pairs keep their order
+
+    by_status = _page_rows(_page(client, result_id, sort='status', status='Mismatch')['data'])
+    assert by_status == _rows(expected[expected['status'] == 'Mismatch'])
+
+
+def test_csv_export_streams_the_stacked_rows(client, stored):
+    result_id, expected = stored
+    response = client.get(f'/api/export_csv?result_id={result_id}')
+    assert response.status_code == 200
+    body = response.get_data()
+    assert body.count(b'"status"') == 1                     # one header across the row groups
+    exported = pd.read_csv(io.BytesIO(body))
+    assert list(exported.columns) == list(expected.columns)
+    assert _rows(exported) == _rows(expected)
+
+
+def test_parquet_export_matches_the_stacked_rows(client, stored, cache_dir):
+    result_id, expected = stored
+    response = client.get(f'/api/export_parquet?result_id={result_id}')
+    assert response.status_code == 200
+    exported = pd.read_parquet(io.BytesIO(response.get_data()))
+    response.close()
+    assert _rows(exported) == _rows(expected)
+    assert exported['a'].astype(str).tolist() == expected['a'].astype(str).tolist()
+    assert not [n for n in os.listdir(os.path.join(cache_dir, 'results')) if n.endswith('.tmp')]
+
+
+def test_exports_of_an_expired_result_are_404(client):
+    assert client.get('/api/export_csv?result_id=missing').status_code == 404
+    assert client.get('/api/export_parquet?result_id=missing').status_code == 404
+
+
+def test_compact_storage_expands_to_the_stacked_rows(stored):
+    result_id, expected = stored
+    compact = load_df('results', result_id)
+    assert len(compact) == 24                               # one stored row per discrepancy
+    assert MASK_COL in compact.columns
+    # Right-side values only where they differ: never for 'b', on mismatch rows for 'a'
+    assert FILE_PREFIX + 'b' not in compact.columns
+    assert (compact[FILE_PREFIX + 'a'].notna() == (compact['status'] == 'Mismatch')).all()
+
+    index = result_index.load_result_index(result_id)
+    rows = result_index.load_result_rows(result_id, np.arange(len(expected)), index)
+    pd.testing.assert_frame_equal(rows.astype(str), expected.astype(str), check_dtype=False)
+    pair = result_index.load_result_rows(result_id, [3, 2], index)          # any order, one side each
+    assert pair.astype(str).values.tolist() == expected.iloc[[3, 2]].astype(str).values.tolist()
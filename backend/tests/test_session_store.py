@@ -0,0 +1,35 @@
+"""Session state shared by worker processes."""
+import multiprocessing
+
+from common.session_store import DEFAULT_STATE, SQLiteSessionStore
+
+
+def _bump(path, n):
+    store = SQLiteSessionStore(path)
+    for _ in range(n):
+        store.modify('sid', lambda state: state.update(last_activity=state['last_activity'] + 1))
+
+
+def test_state_written_by_one_process_is_seen_by_another(tmp_path):
+    path = str(tmp_path / 'sessions.sqlite')
+    worker = multiprocessing.get_context('fork').Process(
+        target=lambda: SQLiteSessionStore(path).update('sid', connected=True, server='srv'))
+    worker.start()
+    worker.join()
+    assert worker.exitcode == 0
+
+    state = SQLiteSessionStore(path).get('sid')
+    assert state['connected'] is True and state['server'] == 'srv'
+    assert SQLiteSessionStore(path).get('other') == DEFAULT_STATE
+
+
+def test_concurrent_modifications_are_not_lost(tmp_path):
+    path = str(tmp_path / 'sessions.sqlite')
+    SQLiteSessionStore(path)
+    ctx = multiprocessing.get_context('fork')
+    workers = [ctx.Process(target=_bump, args=(path, 25)) for _ in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    assert SQLiteSessionStore(path).get('sid')['last_activity'] == 100
@@ -0,0 +1,58 @@
+"""SQL result snapshots: reuse within the max age."""
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from common import sql_snapshot
+from common.storage_manager import cache_file_path
+
+ARGS = ('srv', 'db', 'SELECT id, v FROM t')
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    queries = []
+
+    def fake_fetch(server, database, query, port=None, timeout=0, chunksize=None):
+        queries.append(query)
+        return pd.DataFrame({'id': [1, 2, 3], 'v': ['a', 'b', 'c']})
+    monkeypatch.setattr(sql_snapshot, 'fetch_sql_df', fake_fetch)
+    return queries
+
+
+def _age(sid, seconds):
+    path = cache_file_path('snapshots', sid)
+    os.utime(path, (time.time() - seconds, time.time() - seconds))
+
+
+def test_second_fetch_is_answered_from_the_snapshot(fetches):
+    first, info = sql_snapshot.fetch_sql_snapshot(*ARGS, max_age_minutes=60)
+    assert info['source'] == 'database'
+    again, info = sql_snapshot.fetch_sql_snapshot(*ARGS, max_age_minutes=60)
+    assert info['source'] == 'snapshot'
+    assert len(fetches) == 1
+    pd.testing.assert_frame_equal(again.reset_index(drop=True), first.reset_index(drop=True),
+                                  check_dtype=False)
+
+
+def test_refresh_and_expired_snapshots_fetch_again(fetches):
+    _, info = sql_snapshot.fetch_sql_snapshot(*ARGS, max_age_minutes=60)
+    _, info = sql_snapshot.fetch_sql_snapshot(*ARGS, refresh=True, max_age_minutes=60)
+    assert info['source'] == 'database' and len(fetches) == 2
+
+    _age(info['snapshot_id'], 2 * 3600)
+    assert sql_snapshot.find_snapshot(*ARGS, max_age_minutes=60) is None
+    _, info = sql_snapshot.fetch_sql_snapshot(*ARGS, max_age_minutes=60)
+    assert info['source'] == 'database' and len(fetches) == 3
+
+    _, info = sql_snapshot.fetch_sql_snapshot(*ARGS, max_age_minutes=0)     # 0 = always fetch
+    assert info['source'] == 'database' and len(fetches) == 4
+
+
+def test_projection_is_answered_from_the_base_snapshot(fetches):
+    sql_snapshot.fetch_sql_snapshot(*ARGS, max_age_minutes=60)
+    df, info = sql_snapshot.fetch_sql_snapshot(*ARGS, columns=['v'], max_age_minutes=60)
+    assert info['source'] == 'snapshot' and len(fetches) == 1
+    assert list(df.columns) == ['v']
@@ -0,0 +1,62 @@
+"""Module 2: SQL-to-SQL comparison over patched fetches."""
+import threading
+
+import pandas as pd
+import pytest
+from flask import Flask
+
+pytest.importorskip('pyodbc', exc_type=ImportError)     # the routes import it (needs the ODBC driver manager)
+
+import common.sql_snapshot as sql_snapshot
+import module_2.routes as m2
+
+TABLES = {
+    'db_a': pd.DataFrame({'id': [1, 2, 3], 'amount': [10, 20, 30]}),
+    'db_b': pd.DataFrame({'ID': [1, 2, 4], 'amt': [10, 25, 40]}),
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    both_fetching = threading.Barrier(2, timeout=10)
+    queries = []
+
+    def fetch(server, database, query, port=None, timeout=0, chunksize=None):
+        queries.append(query)
+        both_fetching.wait()                    # raises unless the two sides overlap
+        return TABLES[database].copy()
+    monkeypatch.setattr(sql_snapshot, 'fetch_sql_df', fetch)
+    monkeypatch.setattr(m2, 'fetch_row_count', lambda *args, **kwargs: None)
+
+    app = Flask(__name__)
+    app.register_blueprint(m2.m2_bp)
+    client = app.test_client()
+    client.queries = queries
+    return client
+
+
+def test_sides_are_fetched_concurrently_and_compared(client):
+    payload = client.post('/api/m2/run_comparison', json={
+        "source_a": {"server": "s", "database": "db_a", "query": "SELECT * FROM t"},
+        "source_b": {"server": "s", "database": "db_b", "query": "SELECT * FROM u"},
+        "keys": ['id'],
+        "column_mapping": [{"a": "id", "b": "ID"}, {"a": "amount", "b": "amt"}],
+    }).get_json()
+
+    assert payload['status'] == 'success', payload
+    summary = payload['summary']
+    assert (summary['matched_rows'], summary['mismatches'], summary['only_on_sql'],
+            summary['only_on_file']) == (1, 1, 1, 1)
+    assert summary['source_a'] == 'A: db_a' and summary['source_b'] == 'B: db_b'
+    assert {row['source'] for row in payload['preview_rows']} == {'A: db_a', 'B: db_b'}
+    assert sorted(client.queries) == sorted(["SELECT q.[id], q.[amount] FROM (\nSELECT * FROM t\n) q",
+                                             "SELECT q.[ID], q.[amt] FROM (\nSELECT * FROM u\n) q"])
+
+
+def test_non_select_queries_are_refused(client):
+    response = client.post('/api/m2/run_comparison', json={
+        "source_a": {"server": "s", "database": "db_a", "query": "DELETE FROM t"},
+        "source_b": {"server": "s", "database": "db_b", "query": "SELECT * FROM u"},
+    })
+    assert response.status_code == 403
+    assert client.queries == []
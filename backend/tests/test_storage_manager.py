@@ -0,0 +1,63 @@
+"""Parquet coercion of object columns and the in-memory DataFrame cache."""
+import datetime
+import decimal
+
+import numpy as np
+import pandas as pd
+
+from common import storage_manager as sm
+
+
+def _per_cell(s):
+    out = s.map(sm._coerce_cell)
+    return out.mask(s.isna() | out.isin(sm._NULL_SENTINELS), '')
+
+
+def test_mixed_column_keeps_each_cells_text():
+    s = pd.Series([1, 1.0, True, decimal.Decimal('1'), decimal.Decimal('1.0'), np.int64(1), np.float64(1),
+                   -0.0, 0.0, 0, False, 'x', None, float('nan'), 1, datetime.date(2024, 1, 2),
+                   datetime.datetime(2024, 1, 2), [1, 2], 2.5, 1.0], dtype=object)
+    out = sm._coerce_object_column(s)
+    assert out.tolist() == _per_cell(s).tolist()
+    assert out.tolist()[:11] == ['1', '1.0', 'True', '1', '1.0', '1', '1.0', '-0.0', '0.0', '0', 'False']
+
+
+def test_single_type_column_converted_per_unique():
+    s = pd.Series([3, 1, 3, None, 2, 1] * 100, dtype=object)
+    assert sm._coerce_object_column(s).tolist() == _per_cell(s).tolist()
+
+
+def _frame_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def test_memory_cache_serves_repeat_loads_and_evicts_lru(monkeypatch):
+    df = pd.DataFrame({'a': np.arange(1000)})
+    for file_id in ('one', 'two', 'three'):
+        sm.save_df(df, 'results', file_id)
+    loaded = sm.load_df('results', 'one')
+    monkeypatch.setattr(sm, 'MEMORY_CACHE_BUDGET', 2 * _frame_bytes(loaded))
+
+    assert sm.load_df('results', 'one') is sm.load_df('results', 'one')     # served from memory
+    sm.load_df('results', 'two')
+    sm.load_df('results', 'one')                # 'one' is now the most recent
+    before = sm.cache_stats()['evictions']
+    sm.load_df('results', 'three')              # over budget: evicts 'two'
+    assert sm.cache_stats()['evictions'] == before + 1
+    assert sm._mem_get(('results', 'one'), count_miss=False) is not None
+    assert sm._mem_get(('results', 'two'), count_miss=False) is None
+    assert sm.cache_stats()['bytes'] <= sm.MEMORY_CACHE_BUDGET
+
+
+def test_memory_cache_never_holds_stale_or_oversized_frames(monkeypatch):
+    sm.save_df(pd.DataFrame({'a': [1, 2]}), 'results', 'entry')
+    sm.load_df('results', 'entry')
+    sm.save_df(pd.DataFrame({'a': [3]}), 'results', 'entry')         # rewritten
+    assert sm.load_df('results', 'entry')['a'].tolist() == [3]
+    sm.delete_entry('results', 'entry')
+    assert sm.load_df('results', 'entry') is None
+
+    monkeypatch.setattr(sm, 'MEMORY_CACHE_BUDGET', 1)
+    sm.save_df(pd.DataFrame({'a': [1]}), 'results', 'big')
+    assert sm.load_df('results', 'big') is not None
+    assert sm.cache_stats()['entries'] == 0
@@ -0,0 +1,103 @@
+"""Background upload ingestion."""
+import multiprocessing
+import os
+import uuid
+
+import pandas as pd
+
+import module_1.upload_ingest as ui
+from common.storage_manager import delete_entry, load_df
+
+
+def _ingest(tmp_path, df):
+    file_id = str(uuid.uuid4())
+    path = tmp_path / 'f.csv'
+    df.to_csv(path, index=False)
+    ui.start_ingest(file_id, str(path), 'f.csv').join()
+    return file_id
+
+
+def test_ingest_prepares_upload(tmp_path):
+    file_id = _ingest(tmp_path, pd.DataFrame({'id': [1, 2], 'v': ['a', 'b']}))
+    try:
+        assert ui.get_ingest_status(file_id) == {"status": "done", "total_rows": 2, "prepared": True}
+    finally:
+        delete_entry('uploads', file_id)
+
+
+def test_failed_prework_leaves_upload_done(tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise MemoryError()
+    monkeypatch.setattr(ui, 'fingerprint_frame', fail)
+
+    file_id = _ingest(tmp_path, pd.DataFrame({'id': [1, 2], 'v': ['a', 'b']}))
+    try:
+        assert ui.get_ingest_status(file_id) == {"status": "done", "total_rows": 2, "prepared": False}
+        assert len(load_df('uploads', file_id)) == 2
+        assert ui.load_prepared(file_id) == (None, None)
+    finally:
+        delete_entry('uploads', file_id)
+
+
+def test_prework_matches_the_persisted_values(tmp_path, monkeypatch):
+    from datetime import datetime
+    from module_1.comparison_engine import _compute_normalized_frame, run_hybrid_comparison
+
+    mixed = pd.DataFrame({'id': [1, 2, 3],
+                          'when': pd.Series([datetime(2024, 1, 2), 'n/a', datetime(2024, 3, 4, 5, 6)],
+                                            dtype=object)})
+    monkeypatch.setattr(ui, '_parse', lambda path, filename: mixed.copy())
+    file_id = _ingest(tmp_path, mixed)
+    try:
+        persisted = load_df('uploads', file_id)
+        norm, fingerprints = ui.load_prepared(file_id)
+        assert norm is not None and fingerprints is not None
+        expected = _compute_normalized_frame(persisted, list(persisted.columns))
+        assert norm['when'].tolist() == expected['when'].tolist()
+
+        sql = pd.DataFrame({'id': [1, 2, 3], 'when': ['2024-01-02', 'n/a', '2024-03-04 05:06:00']})
+        _, with_prework = run_hybrid_comparison(sql, persisted, file_normalized=norm,
+                                                file_fingerprints=fingerprints)
+        _, without = run_hybrid_comparison(sql, persisted)
+        for k in ('matched_rows', 'mismatches', 'only_on_sql', 'only_on_file'):
+            assert with_prework[k] == without[k]
+    finally:
+        delete_entry('uploads', file_id)
+
+
+def _fail_ingest_in_other_process(file_id, path):
+    def bad_file(path, filename):
+        raise ValueError('bad file')
+    ui._parse = bad_file
+    ui.start_ingest(file_id, path, 'f.csv').join()
+
+
+def test_status_is_shared_between_processes(tmp_path):
+    file_id = str(uuid.uuid4())
+    path = tmp_path / 'f.csv'
+    path.write_text('id\n1\n')
+    worker = multiprocessing.get_context('fork').Process(target=_fail_ingest_in_other_process,
+                                                         args=(file_id, str(path)))
+    worker.start()
+    worker.join()
+    assert worker.exitcode == 0
+    assert ui.get_ingest_status(file_id) == {"status": "error", "message": "bad file"}
+
+
+def test_interrupted_ingest_is_an_error(tmp_path):
+    file_id = str(uuid.uuid4())
+    worker = multiprocessing.get_context('fork').Process(target=lambda: None)
+    worker.start()
+    worker.join()
+    ui._write_job(file_id, {"status": "running", "stage": "parsing", "started_at": 0, "pid": worker.pid})
+    open(ui.staged_path(file_id, 'f.csv'), 'w').close()
+    assert ui.get_ingest_status(file_id)['status'] == 'error'
+
+
+def test_finished_jobs_leave_no_state(tmp_path):
+    file_id = _ingest(tmp_path, pd.DataFrame({'id': [1, 2]}))
+    try:
+        assert file_id not in ui._threads
+        assert not os.path.exists(ui._job_path(file_id))
+    finally:
+        delete_entry('uploads', file_id)
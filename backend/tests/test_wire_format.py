@@ -0,0 +1,27 @@
+"""Wire formats of tabular payloads."""
+import json
+
+import pandas as pd
+import pytest
+from flask import Flask
+
+from common.wire_format import table_response
+
+DF = pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']})
+
+
+@pytest.fixture
+def ctx():
+    with Flask(__name__).test_request_context():
+        yield
+
+
+def test_records_payload_has_no_format_field(ctx):
+    payload = json.loads(table_response(DF, 'records', {"total": 2}, 'data').get_data())
+    assert payload == {"total": 2, "data": [{"a": 1, "b": "x"}, {"a": 2, "b": "y"}]}
+
+
+def test_columns_payload_names_its_format(ctx):
+    payload = json.loads(table_response(DF, 'columns', {"total": 2}, 'data').get_data())
+    assert payload == {"total": 2, "format": "columns",
+                       "data": {"columns": ["a", "b"], "data": [[1, 2], ["x", "y"]]}}